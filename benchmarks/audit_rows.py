@@ -0,0 +1,43 @@
+"""
+Measure sustained audit log insertion rate, in rows per second, for
+several batch sizes.
+
+  $ python -m benchmarks.audit_rows --rows 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from tdd.audit import AuditLog
+from tdd.synth import Authority, Generator
+from tdd.verify import verify
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000,
+                        help="Rows to insert per batch size")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 100, 1000, 10000],
+                        help="Batch sizes to measure")
+    args = parser.parse_args()
+
+    authority = Authority()
+    keychain = authority.keychain()
+    generator = Generator(authority, seed=1, corrupt_rate=0.1)
+    results = [verify(code, keychain) for code, _ in generator.generate(1000)]
+    # Rows are built from results once, so that only storage is timed
+    stamp = "2024-01-01T00:00:00+00:00"
+
+    for batch in args.batch:
+        rows = args.rows if batch > 1 else min(args.rows, 20000)
+        with tempfile.TemporaryDirectory() as d:
+            with AuditLog(os.path.join(d, "audit.db"), batch_size=batch) as audit:
+                start = time.perf_counter()
+                for i in range(rows):
+                    audit.write(results[i % len(results)], at=stamp)
+                audit.flush()
+                elapsed = time.perf_counter() - start
+        print(f"batch {batch:6d}: {rows / elapsed:10.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
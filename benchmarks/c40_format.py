@@ -0,0 +1,54 @@
+"""
+Compare the table-driven C40 encoder (format, format_many) with the
+original per-character pipeline (text_encode, pack, stream_format),
+on strings of mixed lengths and on 3 character strings (country and
+CA ids of binary headers).
+
+  $ python -m benchmarks.c40_format
+"""
+import random
+import time
+
+from tdd.c40 import c40
+
+COUNT = 100000
+ROUNDS = 7
+
+def legacy(s):
+    return c40.stream_format(c40.pack(c40.text_encode(s, c40.reverse)))
+
+def best_times(runs):
+    """
+    Best time of each run over ROUNDS, runs interleaved so that load
+    changes affect them all alike.
+    """
+    times = {}
+    for _ in range(ROUNDS):
+        for label, run in runs:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            times[label] = min(times.get(label, elapsed), elapsed)
+    return times
+
+def main():
+    rng = random.Random(0)
+    alphabet = " 0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-/."
+    batches = {
+        "mixed": [''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 30)))
+                  for _ in range(COUNT)],
+        "3 chars": [''.join(rng.choice(alphabet[11:37]) for _ in range(3))
+                    for _ in range(COUNT)],
+    }
+
+    for name, strings in batches.items():
+        print(name)
+        times = best_times((("legacy", lambda: [legacy(s) for s in strings]),
+                            ("format", lambda: [c40.format(s) for s in strings]),
+                            ("format_many", lambda: c40.format_many(strings))))
+        for label, elapsed in times.items():
+            print(f"  {label:12s} {COUNT / elapsed:10.0f} strings/s "
+                  f"{times['legacy'] / elapsed:5.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Compare decoding a batch of synthetic codes into per-field columns
+with decode_columns against building one TwoDDoc per code.
+
+  $ python -m benchmarks.columnar_decode --count 20000
+"""
+import argparse
+import time
+
+from tdd.columnar import decode_columns
+from tdd.doc import TwoDDoc
+from tdd.synth import Authority, Generator
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000,
+                        help="Number of codes")
+    args = parser.parse_args()
+
+    generator = Generator(Authority(), seed=1)
+    codes = [code for code, _ in generator.generate(args.count)]
+
+    start = time.perf_counter()
+    [TwoDDoc.from_code(c) for c in codes]
+    elapsed = time.perf_counter() - start
+    print(f"objects: {len(codes) / elapsed:10.0f} codes/s")
+
+    start = time.perf_counter()
+    cols = decode_columns(codes)
+    elapsed = time.perf_counter() - start
+    print(f"columns: {len(codes) / elapsed:10.0f} codes/s, {len(cols.fields)} field columns")
+
+    doc_type = codes[0][20:22]
+    start = time.perf_counter()
+    cols = decode_columns(codes, doc_type_id=doc_type)
+    elapsed = time.perf_counter() - start
+    print(f"columns, one doctype: {len(codes) / elapsed:10.0f} codes/s, {len(cols)} rows")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Measure memory retained by parsed documents, with and without
+interning of decoded field values.
+
+  $ python -m benchmarks.intern_memory --repeat 200
+"""
+import argparse
+import gc
+import tracemalloc
+from pathlib import Path
+
+from tdd.data_definition import Interner
+from tdd.doc import TwoDDoc
+
+ROOT = Path(__file__).parent.parent
+
+def _codes():
+    paths = sorted((ROOT / "tests" / "spec_samples").rglob("*.txt")) \
+        + sorted((ROOT / "samples").rglob("*.txt"))
+    return [p.read_text().strip() for p in paths]
+
+def _retained(codes):
+    gc.collect()
+    tracemalloc.start()
+    docs = [TwoDDoc.from_code(c) for c in codes]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del docs
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=100,
+                        help="Number of copies of each sample")
+    args = parser.parse_args()
+
+    # Distinct input strings, as a scanner would deliver them
+    codes = [c[:-1] + c[-1] for c in _codes() for _ in range(args.repeat)]
+    values = sum(len(TwoDDoc.from_code(c).message.dataset) for c in codes[::args.repeat]) * args.repeat
+
+    plain = _retained(codes)
+    interner = Interner()
+    interner.install()
+    try:
+        interned = _retained(codes)
+    finally:
+        Interner.uninstall()
+
+    print(f"{len(codes)} documents, {values} values")
+    print(f"plain:    {plain:10d} bytes ({plain / len(codes):6.0f} bytes/doc)")
+    print(f"interned: {interned:10d} bytes ({interned / len(codes):6.0f} bytes/doc)")
+    print(f"saved:    {plain - interned:10d} bytes ({100 * (plain - interned) / plain:.1f}%), "
+          f"{interner.size} distinct values")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Measure keychain memory footprint per certificate, for the regular
+and compact store modes.
+
+Each mode is measured in a fresh process, as resident set size growth
+while building several copies of the internal keychain. This accounts
+for memory allocated by the cryptography bindings, which tracemalloc
+does not see.
+
+  $ python -m benchmarks.keychain_memory
+"""
+import multiprocessing
+import os
+
+def _rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+COPIES = 20
+
+def _measure(compact, queue):
+    import gc
+    from tdd import keychain
+
+    # Import and warm the binding code paths before measuring
+    keychain.internal(include_test=True, compact=compact)
+    gc.collect()
+
+    before = _rss()
+    chains = [keychain.internal(include_test=True, compact=compact) for _ in range(COPIES)]
+    gc.collect()
+    queue.put((len(chains[0]._entries) * COPIES, _rss() - before))
+
+def main():
+    ctx = multiprocessing.get_context("spawn")
+    for compact in (False, True):
+        queue = ctx.Queue()
+        p = ctx.Process(target=_measure, args=(compact, queue))
+        p.start()
+        count, size = queue.get()
+        p.join()
+        mode = "compact" if compact else "regular"
+        print(f"{mode:8s} {count:6d} certs, {size:10d} bytes, {size / count:7.0f} bytes/cert")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Compare message parsing of the bundled samples with compiled layouts
+(the default) and with the generic parser only.
+
+  $ python -m benchmarks.layout_parse
+"""
+from pathlib import Path
+import time
+from tdd.doc import TwoDDoc
+from tdd.message import C40Message
+
+SAMPLES = Path(__file__).parent.parent / "samples"
+ROUNDS = 20000
+
+def messages():
+    for path in sorted(SAMPLES.rglob("*.txt")):
+        code = path.read_text().strip()
+        header = TwoDDoc.from_code(code).header
+        yield header.perimeter_id, code[header.length:code.index("\x1f")]
+
+def rate(items):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for perimeter_id, data in items:
+            C40Message.from_code(perimeter_id, data)
+    return ROUNDS * len(items) / (time.perf_counter() - start)
+
+def main():
+    items = list(messages())
+    layouts = C40Message.layouts
+    compiled = rate(items)
+    C40Message.layouts = {}
+    try:
+        generic = rate(items)
+    finally:
+        C40Message.layouts = layouts
+    print(f"generic  {generic:10.0f} messages/s")
+    print(f"layouts  {compiled:10.0f} messages/s ({compiled / generic:.1f}x)")
+
+if __name__ == "__main__":
+    main()
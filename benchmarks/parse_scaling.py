@@ -0,0 +1,37 @@
+"""
+Measure message parsing time against input size on adversarial
+inputs (many unbounded fields), to check it grows linearly.
+
+  $ python -m benchmarks.parse_scaling
+"""
+import time
+from tdd.message import C40Message, Limits
+
+SHAPES = {
+    "GS separated": "01A\x1d",
+    "RS separated": "01A\x1e",
+    "unterminated": "01",
+    "bounded, GS separated": "18AB CD\x1d",
+}
+
+def parse_time(code, limits):
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        C40Message.from_code(1, code, limits)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    unlimited = Limits(max_length = None, max_fields = None, max_field_size = None)
+    for label, field in SHAPES.items():
+        print(label)
+        for count in (10000, 20000, 40000, 80000, 160000):
+            code = field * count
+            elapsed = parse_time(code, unlimited)
+            print(f"  {len(code):8d} chars {elapsed * 1000:9.2f} ms "
+                  f"{elapsed / len(code) * 1e9:7.1f} ns/char")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Measure replay detector throughput, in checks per second, for new
+keys and for replays.
+
+  $ python -m benchmarks.replay_rate
+"""
+import os
+import time
+from tdd.replay import ReplayDetector
+
+COUNT = 200000
+
+def main():
+    detector = ReplayDetector(window = 7 * 86400, capacity = COUNT)
+    digests = [os.urandom(32) for _ in range(COUNT)]
+    for label in ("new", "replay"):
+        start = time.perf_counter()
+        for d in digests:
+            detector.check_digest(d, now = 0)
+        elapsed = time.perf_counter() - start
+        print(f"{label:8s} {COUNT / elapsed:10.0f} checks/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Compare single-threaded verification of the specification samples
+with thread pool verification.
+
+  $ python -m benchmarks.thread_verify --repeat 50 --workers 2 4 8
+"""
+import argparse
+import time
+from pathlib import Path
+
+from tdd.keychain import internal
+from tdd.verify import verify, verify_many
+
+SAMPLES = Path(__file__).parent.parent / "tests" / "spec_samples"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Number of passes over the samples")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8],
+                        help="Thread pool sizes to measure")
+    args = parser.parse_args()
+
+    keychain = internal(include_test=True, check_expiry=False)
+    codes = [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))] * args.repeat
+
+    start = time.perf_counter()
+    for code in codes:
+        verify(code, keychain)
+    base = time.perf_counter() - start
+    print(f"single thread: {len(codes) / base:10.0f} docs/s")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        for _ in verify_many(codes, keychain, workers=workers):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{workers:3d} threads:   {len(codes) / elapsed:10.0f} docs/s  (x{base / elapsed:.2f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compare the size and round trip time of parsed documents pickled as
+plain object graphs and through the compact tdd.wire encoding.
+
+  $ python -m benchmarks.wire_size
+"""
+import copyreg
+import pickle
+import time
+from pathlib import Path
+from tdd.data_definition import Group, Perimeter
+from tdd.doc import TwoDDoc
+
+SAMPLES = Path(__file__).parent.parent / "tests" / "spec_samples"
+ROUNDS = 200
+
+def _measure(name, dumps, loads, docs):
+    blobs = [dumps(d) for d in docs]
+    size = sum(len(b) for b in blobs)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for d in docs:
+            loads(dumps(d))
+    elapsed = time.perf_counter() - start
+    per_doc = elapsed / (ROUNDS * len(docs)) * 1e6
+    print(f"{name:8s} {size / len(docs):8.0f} bytes/doc {per_doc:8.1f} us/round trip")
+
+def main():
+    import io
+    docs = [TwoDDoc.from_code(p.read_text().strip())
+            for p in sorted(SAMPLES.rglob("*.txt"))]
+
+    # Bypass TwoDDoc.__reduce__ to pickle the full object graph,
+    # leaving generated view classes out as they are not picklable
+    def state(cls, *drop):
+        return lambda o: (object.__new__, (cls,),
+                          {k: v for k, v in vars(o).items() if k not in drop})
+    table = copyreg.dispatch_table.copy()
+    table[TwoDDoc] = state(TwoDDoc)
+    table[Group] = state(Group, "view")
+    table[Perimeter] = state(Perimeter, "view")
+
+    def graph_dumps(doc):
+        f = io.BytesIO()
+        p = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        p.dispatch_table = table
+        p.dump(doc)
+        return f.getvalue()
+
+    _measure("graph", graph_dumps, pickle.loads, docs)
+    _measure("wire", lambda d: pickle.dumps(d, pickle.HIGHEST_PROTOCOL), pickle.loads, docs)
+
+if __name__ == "__main__":
+    main()
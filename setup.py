@@ -36,7 +36,7 @@ setup(
     ],
     python_requires = ">=3.9",
     package_data = {
-        'tdd': ['chains/*.der', 'chains/tsl_signed.xml'],
+        'tdd': ['chains/*.der', 'chains/*.crl', 'chains/tsl_signed.xml'],
     },
     include_package_data = True,
     packages = find_packages(exclude=["tests", "tests.*"]),
@@ -51,6 +51,12 @@ setup(
             'lxml',
             'requests',
         ],
+        'columnar': [
+            'numpy',
+        ],
+        'zstd': [
+            'zstandard',
+        ],
         'dev': [
             'pytest',
             'pyyaml',
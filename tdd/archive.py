@@ -0,0 +1,357 @@
+import mmap
+import os
+import struct
+from .doc import TwoDDoc
+from .wire import (encode_value, decode_value, encode_header, decode_header,
+                   encode_dataset, decode_message)
+
+__doc__ = """
+Indexed archive of parsed and verified documents.
+
+An archive file is a small magic header followed by a sequence of
+segments, each one written by a bulk append. A segment holds its records (header fields, signature, field
+ids and decoded values in tdd.wire encoding, verification status),
+then its indexes, then a
+fixed size footer pointing back to the segment start. Readers map the
+file with mmap, walk the footers from the end, and only load the small
+index directories: records are decoded when a query returns them.
+
+Indexes: ca_id, (ca_id, cert_id), doc_type_id and perimeter_id map to
+posting lists of records, sign dates are kept sorted for range
+queries.
+
+  >>> with Archive("audit.tdda") as a:
+  ...     a.append(verify_many(codes, keychain))
+  ...     for r in a.query(doc_type_id="04", ca_id="FR03",
+  ...                      sign_from=date(2024, 3, 1), sign_to=date(2024, 3, 31)):
+  ...         print(r.header.cert_id, r.valid)
+"""
+__all__ = ["Archive", "Record"]
+
+MAGIC = b"TDDA"
+VERSION = 2
+
+FILE_HEADER = struct.Struct("<4sHxx")
+FOOTER = struct.Struct("<4sHxxIQQQ")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+I32 = struct.Struct("<i")
+U64 = struct.Struct("<Q")
+DATE_ENTRY = struct.Struct("<iI")
+
+FLAG_VALID = 1
+FLAG_REASON = 2
+
+INDEXES = ("ca", "cert", "doc_type", "perimeter")
+
+def _encode_record(doc, valid, reason):
+    buf = bytearray()
+    buf.append((FLAG_VALID if valid else 0) | (FLAG_REASON if reason else 0))
+    encode_header(buf, doc.header)
+    if reason:
+        encode_value(buf, reason)
+    encode_value(buf, doc.signature)
+    encode_dataset(buf, doc.message.dataset)
+    return buf
+
+class Record:
+    """
+    Archived document: `doc` is a TwoDDoc rebuilt from archived values
+    (without signed data), `valid` and `reason` the verification
+    status at archiving time.
+    """
+    def __init__(self, doc, valid, reason):
+        self.doc = doc
+        self.valid = valid
+        self.reason = reason
+
+    @property
+    def header(self):
+        return self.doc.header
+
+def _decode_record(buf, off):
+    flags = buf[off]
+    header, off = decode_header(buf, off + 1)
+    reason = None
+    if flags & FLAG_REASON:
+        reason, off = decode_value(buf, off)
+    signature, off = decode_value(buf, off)
+    message, off = decode_message(buf, off, header.perimeter_id)
+    return Record(TwoDDoc(header, message, signature), bool(flags & FLAG_VALID), reason)
+
+def _index_keys(header):
+    return (header.ca_id,
+            f"{header.ca_id}/{header.cert_id}",
+            str(header.doc_type_id),
+            str(header.perimeter_id))
+
+class _Segment:
+    """
+    Index directories of one segment, postings stay in the map.
+    """
+    def __init__(self, buf, count, index_offset):
+        self.buf = buf
+        self.count = count
+        self.offsets = index_offset
+        self.dates = index_offset + count * U64.size
+        off = self.dates + count * DATE_ENTRY.size
+        self.indexes = {}
+        for name in INDEXES:
+            n, = U32.unpack_from(buf, off)
+            off += U32.size
+            keys = {}
+            for _ in range(n):
+                kl, = U16.unpack_from(buf, off)
+                off += U16.size
+                key = bytes(buf[off:off + kl]).decode("utf-8")
+                off += kl
+                pc, = U32.unpack_from(buf, off)
+                off += U32.size
+                keys[key] = (off, pc)
+                off += pc * U32.size
+            self.indexes[name] = keys
+
+    def record_offset(self, ordinal):
+        return U64.unpack_from(self.buf, self.offsets + ordinal * U64.size)[0]
+
+    def postings(self, name, key):
+        entry = self.indexes[name].get(key)
+        if entry is None:
+            return ()
+        off, count = entry
+        return struct.unpack_from(f"<{count}I", self.buf, off)
+
+    def _date_bisect(self, key, right):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            d, = I32.unpack_from(self.buf, self.dates + mid * DATE_ENTRY.size)
+            if d < key or (right and d == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def date_range(self, start, end):
+        """
+        Ordinals of records signed in [start, end] (date ordinals,
+        None for an open bound)
+        """
+        lo = self._date_bisect(start, False) if start is not None else 0
+        hi = self._date_bisect(end, True) if end is not None else self.count
+        return [DATE_ENTRY.unpack_from(self.buf, self.dates + i * DATE_ENTRY.size)[1]
+                for i in range(lo, hi)]
+
+class Archive:
+    """
+    Archive file, opened for reading and bulk appending. The file is
+    only opened for writing by the first append (and created then if
+    missing).
+
+    A tail left by an interrupted append is ignored by readers, and
+    truncated away by the next append: the archive is recovered to
+    its last complete segment.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._writer = None
+        self._map = None
+        self._end = 0
+        self.segments = []
+        if os.path.exists(path):
+            self._fd = open(path, "rb")
+            self._load()
+
+    def _remap(self):
+        # Live query generators keep the previous map through their
+        # segments, it is released when they are done with it
+        size = os.fstat(self._fd.fileno()).st_size
+        self._map = mmap.mmap(self._fd.fileno(), 0, access = mmap.ACCESS_READ) if size else None
+        return size
+
+    def _footer(self, pos, floor):
+        """
+        Footer fields of a segment ending at pos, None if there is no
+        consistent footer there.
+        """
+        if pos - FOOTER.size < floor:
+            return None
+        magic, version, count, start, index_offset, index_length = \
+            FOOTER.unpack_from(self._map, pos - FOOTER.size)
+        if (magic != MAGIC or version != VERSION
+                or not floor <= start <= index_offset
+                or index_offset + index_length != pos - FOOTER.size
+                or index_offset + count * (U64.size + DATE_ENTRY.size) > pos):
+            return None
+        return count, start, index_offset
+
+    def _segments(self, end):
+        """
+        Segments of the file up to end, walking footers back to the
+        start, None if the chain is broken.
+        """
+        segments = []
+        pos = end
+        while pos > FILE_HEADER.size:
+            footer = self._footer(pos, FILE_HEADER.size)
+            if footer is None:
+                return None
+            count, start, index_offset = footer
+            try:
+                segments.append(_Segment(self._map, count, index_offset))
+            except (struct.error, UnicodeDecodeError):
+                return None
+            pos = start
+        return segments[::-1]
+
+    def _load(self):
+        size = self._remap()
+        self.segments = []
+        self._end = 0
+        header = FILE_HEADER.pack(MAGIC, VERSION)
+        if size < len(header):
+            # Empty, or interrupted while writing the file header
+            if self._map is not None and self._map[:] != header[:size]:
+                raise ValueError("Not a document archive")
+            return
+        if self._map[:len(header)] != header:
+            raise ValueError("Not a document archive")
+        self._end = len(header)
+        end = size
+        while end > len(header):
+            segments = self._segments(end)
+            if segments is not None:
+                self.segments = segments
+                self._end = end
+                return
+            # Truncated tail, look for the previous segment end
+            end = self._map.rfind(MAGIC, len(header), end - FOOTER.size + len(MAGIC) - 1)
+            if end < 0:
+                break
+            end += FOOTER.size
+
+    def close(self):
+        self.segments = []
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        for fd in (self._fd, self._writer):
+            if fd is not None:
+                fd.close()
+        self._fd = self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(s.count for s in self.segments)
+
+    def append(self, results):
+        """
+        Append verification results (tdd.verify.Result, or anything
+        with doc, valid and reason attributes) as a new segment.
+        Results without a parsed document are skipped. Returns the
+        number of archived records.
+        """
+        # The file header is written along with the first segment
+        head = b"" if self._end else FILE_HEADER.pack(MAGIC, VERSION)
+        start = self._end or FILE_HEADER.size
+        records = bytearray()
+        offsets = []
+        dates = []
+        indexes = {name: {} for name in INDEXES}
+
+        for r in results:
+            if r.doc is None:
+                continue
+            ordinal = len(offsets)
+            offsets.append(start + len(records))
+            records += _encode_record(r.doc, r.valid, r.reason)
+            sign_date = r.doc.header.sign_date
+            dates.append((sign_date.toordinal() if sign_date else -1, ordinal))
+            for name, key in zip(INDEXES, _index_keys(r.doc.header)):
+                indexes[name].setdefault(key, []).append(ordinal)
+
+        if not offsets:
+            return 0
+
+        index = bytearray()
+        for o in offsets:
+            index += U64.pack(o)
+        for d in sorted(dates):
+            index += DATE_ENTRY.pack(*d)
+        for name in INDEXES:
+            keys = indexes[name]
+            index += U32.pack(len(keys))
+            for key, postings in keys.items():
+                raw = key.encode("utf-8")
+                index += U16.pack(len(raw)) + raw + U32.pack(len(postings))
+                index += struct.pack(f"<{len(postings)}I", *postings)
+
+        if self._writer is None:
+            self._writer = open(self.path, "ab")
+        # Drop the tail of an interrupted append
+        self._writer.truncate(start - len(head))
+        index_offset = start + len(records)
+        self._writer.write(head)
+        self._writer.write(records)
+        self._writer.write(index)
+        self._writer.write(FOOTER.pack(MAGIC, VERSION, len(offsets), start,
+                                       index_offset, len(index)))
+        self._writer.flush()
+        if self._fd is None:
+            self._fd = open(self.path, "rb")
+        self._end = self._remap()
+        self.segments = self.segments + [_Segment(self._map, len(offsets), index_offset)]
+        return len(offsets)
+
+    def __iter__(self):
+        return self.query()
+
+    def query(self, ca_id = None, cert_id = None, doc_type_id = None,
+              perimeter_id = None, sign_from = None, sign_to = None,
+              valid = None):
+        """
+        Yield archived records matching all given criteria, in
+        archiving order. Sign date bounds are inclusive. cert_id
+        requires ca_id.
+        """
+        if cert_id is not None and ca_id is None:
+            raise ValueError("cert_id requires ca_id")
+        keyed = []
+        if cert_id is not None:
+            keyed.append(("cert", f"{ca_id}/{cert_id}"))
+        elif ca_id is not None:
+            keyed.append(("ca", ca_id))
+        if doc_type_id is not None:
+            keyed.append(("doc_type", str(doc_type_id)))
+        if perimeter_id is not None:
+            keyed.append(("perimeter", str(perimeter_id)))
+        dated = sign_from is not None or sign_to is not None
+
+        # Segments appended meanwhile are not seen
+        for segment in self.segments:
+            candidates = None
+            for name, key in keyed:
+                postings = segment.postings(name, key)
+                candidates = set(postings) if candidates is None else candidates.intersection(postings)
+                if not candidates:
+                    break
+            if candidates is not None and not candidates:
+                continue
+            if dated:
+                in_range = segment.date_range(
+                    sign_from.toordinal() if sign_from is not None else 1,
+                    sign_to.toordinal() if sign_to is not None else None)
+                candidates = set(in_range) if candidates is None else candidates.intersection(in_range)
+            ordinals = range(segment.count) if candidates is None else sorted(candidates)
+
+            for ordinal in ordinals:
+                off = segment.record_offset(ordinal)
+                if valid is not None and bool(segment.buf[off] & FLAG_VALID) != valid:
+                    continue
+                yield _decode_record(segment.buf, off)
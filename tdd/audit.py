@@ -0,0 +1,185 @@
+from datetime import datetime, timezone
+import sqlite3
+import threading
+import time
+
+__doc__ = """
+SQLite audit log of verifications.
+
+Every verification outcome (header fields, signature validity, failure
+reason, verification time) is recorded as a row. Rows are buffered
+and written in batches, one transaction and one executemany() of a
+single prepared statement per batch, to a database in WAL mode.
+Buffered rows are also flushed every `flush_interval` seconds, so that
+few are lost if the process dies while input is idle. Indexes cover ca_id/cert_id, doc_type_id and sign_date.
+
+  >>> with AuditLog("audit.db") as audit:
+  ...     for r in audit.record(verify_many(codes, keychain)):
+  ...         ...
+
+  $ sqlite3 audit.db "select count(*) from verifications where not valid"
+"""
+__all__ = ["AuditLog"]
+
+COLUMNS = ("verified_at", "valid", "reason", "version", "country_id",
+           "ca_id", "cert_id", "emit_date", "sign_date", "doc_type_id",
+           "perimeter_id", "code")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verifications (
+    id INTEGER PRIMARY KEY,
+    verified_at TEXT NOT NULL,
+    valid INTEGER NOT NULL,
+    reason TEXT,
+    version INTEGER,
+    country_id TEXT,
+    ca_id TEXT,
+    cert_id TEXT,
+    emit_date TEXT,
+    sign_date TEXT,
+    doc_type_id TEXT,
+    perimeter_id INTEGER,
+    code TEXT
+);
+CREATE INDEX IF NOT EXISTS verifications_cert ON verifications (ca_id, cert_id);
+CREATE INDEX IF NOT EXISTS verifications_doc_type ON verifications (doc_type_id);
+CREATE INDEX IF NOT EXISTS verifications_sign_date ON verifications (sign_date);
+"""
+
+INSERT = f"INSERT INTO verifications ({', '.join(COLUMNS)}) " \
+    f"VALUES ({', '.join('?' * len(COLUMNS))})"
+
+class AuditLog:
+    """
+    Audit database. Rows are buffered and written every `batch_size`
+    rows, by a background thread when buffered rows are older than
+    `flush_interval` seconds (None disables it), and on flush() and
+    close(). If store_code is True, the raw code is kept as well.
+
+    Safe for use from several threads.
+    """
+    def __init__(self, path, batch_size = 1000, store_code = False,
+                 flush_interval = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.store_code = store_code
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._rows = []
+        self._since = None
+        self._db = sqlite3.connect(path, isolation_level = None,
+                                   check_same_thread = False)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(SCHEMA)
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval is not None:
+            self._flusher = threading.Thread(target = self._flush_loop, daemon = True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        interval = self.flush_interval
+        while not self._closed.wait(interval / 2):
+            with self._lock:
+                if self._since is not None and time.monotonic() - self._since >= interval:
+                    self._flush()
+
+    def _flush(self):
+        "Write buffered rows, lock held"
+        rows, self._rows = self._rows, []
+        self._since = None
+        if rows:
+            self._write(rows)
+
+    def _check_open(self):
+        if self._db is None:
+            raise ValueError("Audit log is closed")
+
+    def _row(self, result, at):
+        """
+        Row of a tdd.verify.Result, or of a dict shaped as
+        Result.to_dict() (as returned by distributed workers).
+        """
+        if isinstance(result, dict):
+            d = result
+            code = d.get("code")
+        else:
+            d = result.to_dict()
+            code = result.code
+        return (at or datetime.now(timezone.utc).isoformat(),
+                int(bool(d["valid"])), d.get("reason"), d.get("version"),
+                d.get("country_id"), d.get("ca_id"), d.get("cert_id"),
+                d.get("emit_date"), d.get("sign_date"),
+                None if d.get("doc_type_id") is None else str(d["doc_type_id"]),
+                d.get("perimeter_id"),
+                code if self.store_code and isinstance(code, str) else None)
+
+    def _write(self, rows):
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            db.executemany(INSERT, rows)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def write(self, result, at = None):
+        """
+        Record a result. `at` is the verification time as an ISO
+        string, defaults to now.
+        """
+        row = self._row(result, at)
+        with self._lock:
+            self._check_open()
+            if not self._rows:
+                self._since = time.monotonic()
+            self._rows.append(row)
+            if len(self._rows) >= self.batch_size:
+                self._flush()
+
+    def record(self, results):
+        "Record results of an iterable while passing them through"
+        for r in results:
+            self.write(r)
+            yield r
+
+    def append(self, results):
+        "Record all results of an iterable, returns their count"
+        count = 0
+        for r in results:
+            self.write(r)
+            count += 1
+        self.flush()
+        return count
+
+    def flush(self):
+        with self._lock:
+            self._check_open()
+            self._flush()
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            if self._db is None:
+                return
+            self._flush()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        "Number of recorded rows, including buffered ones"
+        with self._lock:
+            self._check_open()
+            count, = self._db.execute("SELECT COUNT(*) FROM verifications").fetchone()
+            return count + len(self._rows)
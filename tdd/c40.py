@@ -1,3 +1,4 @@
+
 __doc__ = "C40 codec"
 
 # Just arbitrarily map FNC1 to u0080
@@ -7,6 +8,7 @@ class Codec:
     def __init__(self, sets):
         self.sets = sets
         self.reverse = self._reverse_gen(sets)
+        self.table = self._table_gen(self.reverse)
 
     @staticmethod
     def _reverse_gen(sets):
@@ -16,6 +18,17 @@ class Codec:
                 r[char] = i, code
         return r
 
+    @staticmethod
+    def _table_gen(reverse):
+        """
+        str.translate() table mapping each character to its C40 values
+        (shift, code), as a string of code points below 40.
+        """
+        t = {}
+        for char, (set, code) in reverse.items():
+            t[ord(char)] = chr(code) if set == 0 else chr(set - 1) + chr(code)
+        return t
+
     @staticmethod
     def stream_extract(cw):
         cw2 = []
@@ -97,10 +110,68 @@ class Codec:
     def stream_format(cw):
         return b''.join(x.to_bytes(2, "big") for x in cw)
 
+    # Padding of value strings, by length modulo 3, as in pack()
+    _padding = ("", "\x01\x1e", "\x00")
+
+    def _values(self, text):
+        """
+        C40 values of text, padded to whole words, as bytes. Raises
+        KeyError for characters that cannot be encoded.
+        """
+        cs = text.translate(self.table)
+        cs += self._padding[len(cs) % 3]
+        try:
+            values = cs.encode("latin-1")
+        except UnicodeEncodeError:
+            values = None
+        if values is None or values.translate(None, _VALUES):
+            # Untranslated characters were left as is
+            raise KeyError(next(c for c in text if ord(c) not in self.table))
+        return values
+
+    @staticmethod
+    def _words(values):
+        """
+        Big endian words of padded C40 values, as bytes.
+
+        All triples are packed at once with integer operations: the
+        values are read as one big integer, three bytes per triple,
+        each triple is replaced by its word in the same three bytes
+        (words fit in two), and the leading zero byte of each is
+        dropped.
+        """
+        n = len(values) // 3
+        if n == 1:
+            a, b, c = values
+            return (a * 1600 + b * 40 + c + 1).to_bytes(2, "big")
+        x = int.from_bytes(values, "big")
+        ones = int.from_bytes(b"\x00\x00\x01" * n, "big")
+        mask = ones * 0xff
+        x = ((x >> 16) & mask) * 1600 + ((x >> 8) & mask) * 40 + (x & mask) + ones
+        words = bytearray(x.to_bytes(3 * n, "big"))
+        del words[0::3]
+        return bytes(words)
+
     def format(self, text):
-        cs = self.text_encode(text, self.reverse)
-        cw = self.pack(cs)
-        return self.stream_format(cw)
+        return self._words(self._values(text))
+
+    def format_many(self, texts):
+        """
+        Encode several strings at once, returns the list of their
+        encodings. Same output as calling format() on each one.
+        """
+        values = [self._values(t) for t in texts]
+        stream = self._words(b"".join(values))
+        ret = []
+        off = 0
+        for v in values:
+            end = off + len(v) // 3 * 2
+            ret.append(stream[off:end])
+            off = end
+        return ret
+
+# C40 values, all below 40
+_VALUES = bytes(range(40))
 
 set0_c40 = {(i+3):v for (i, v) in enumerate(" 0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ")}
 set0_text = {k:v.lower() for (k, v) in set0_c40.items()}
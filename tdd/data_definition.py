@@ -1,5 +1,9 @@
-from datetime import date, time, datetime, timedelta
+from datetime import date, time, datetime
+import keyword
 import re
+import threading
+import unicodedata
+from .header import epoch_date
 
 __doc__ = """
 
@@ -12,6 +16,9 @@ This only defines perimeter ID 1.
 """
 
 class Format:
+    # Optional Interner applied to parsed values, see Interner.install()
+    interner = None
+
     def __init__(self, size_min, size_max):
         self.size_min = size_min
         self.size_max = size_max
@@ -118,8 +125,7 @@ class Date4(Format):
     EPOCH = date(2000, 1, 1)
 
     def parse(self, text):
-        v = int(text, 16)
-        return self.EPOCH + timedelta(days = v)
+        return epoch_date(int(text, 16))
 
     def serialize(self, d):
         return f'{(d - self.EPOCH).days:04X}'
@@ -216,10 +222,117 @@ class Base36(Format):
     def serialize(self, text):
         raise NotImplementedError()
 
+class Interner:
+    """
+    Bounded table of parsed values, so that equal values parsed from
+    different documents share a single object. Once the table is full,
+    new values are returned as is and already interned ones are still
+    shared.
+
+    Values are tabled per type, so that e.g. True and 1 never alias.
+    An interner may be used from several threads: lookups do not lock,
+    insertions do.
+    """
+    def __init__(self, max_size = 65536):
+        self.max_size = max_size
+        self.size = 0
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        table = self.tables.get(value.__class__)
+        if table is None:
+            table = self.tables.setdefault(value.__class__, {})
+        interned = table.get(value)
+        if interned is not None:
+            return interned
+        with self._lock:
+            if self.size >= self.max_size:
+                return value
+            interned = table.setdefault(value, value)
+            if interned is value:
+                self.size += 1
+            return interned
+
+    def install(self, definitions = None, formats = None):
+        """
+        Enable interning on all definitions (default: c40) whose
+        encoding is an instance of one of formats (default: strings
+        and dates).
+        """
+        formats = formats or (String, Date4, JJMMAAAA)
+        for d in (definitions or c40).definitions():
+            if isinstance(d.encoding, formats):
+                d.encoding.interner = self
+
+    @staticmethod
+    def uninstall(definitions = None):
+        "Disable interning on all definitions (default: c40)"
+        for d in (definitions or c40).definitions():
+            d.encoding.interner = None
+
+_attr_stopwords = {"a", "au", "aux", "d", "de", "des", "du", "en", "et",
+                   "l", "la", "le", "les", "ou", "par", "pour", "sur", "un", "une"}
+
+def attribute_name(name, id):
+    """
+    Python identifier for a definition name, e.g. "Date de fin des
+    droits" gives "date_fin_droits".
+    """
+    text = "".join(c for c in unicodedata.normalize("NFKD", name)
+                   if not unicodedata.combining(c)).lower()
+    words = [w for w in re.split(r"[^a-z0-9]+", text) if w and w not in _attr_stopwords]
+    attr = "_".join(words)
+    if not attr or not attr[0].isalpha():
+        attr = f"f_{id.lower()}_{attr}".rstrip("_")
+    if keyword.iskeyword(attr):
+        attr += "_"
+    return attr
+
+class TypedView:
+    """
+    Base of typed document views. Subclasses are generated with one
+    slot per data definition, `fields` maps definition ids to slot
+    names. Definitions absent from the document read as None.
+    """
+    __slots__ = ()
+    fields = {}
+    names = frozenset()
+
+    def __init__(self, dataset):
+        fields = self.fields
+        for d in reversed(dataset):
+            attr = fields.get(d.definition.id)
+            if attr is not None:
+                setattr(self, attr, d.value)
+
+    def __getattr__(self, name):
+        if name in self.names:
+            return None
+        raise AttributeError(name)
+
+    def __repr__(self):
+        values = ", ".join(f"{a}={getattr(self, a)!r}" for a in self.__slots__
+                           if getattr(self, a) is not None)
+        return f"{self.__class__.__name__}({values})"
+
+def view_class(name, fields):
+    """
+    Generate a slotted TypedView subclass for fields, a mapping of
+    definition ids to attribute names. Raises ValueError if two
+    definitions share an attribute name.
+    """
+    slots = tuple(dict.fromkeys(fields.values()))
+    if len(slots) != len(fields):
+        raise ValueError(f"{name}: definitions sharing an attribute name")
+    return type(name, (TypedView,), {"__slots__": slots, "fields": fields,
+                                     "names": frozenset(slots)})
+
 class Definition:
     def __init__(self, id, name, size_min, size_max, encoding, description = ""):
         self.id = id
         self.name = name
+        self.attr = attribute_name(name, id)
         self.fixed = size_min if size_min == size_max else None
         self.encoding = encoding(size_min, size_max)
         self.description = description
@@ -228,6 +341,11 @@ class Group:
     def __init__(self, name, *definitions):
         self.name = name
         self.definitions = list(definitions)
+        attrs = {}
+        for d in self.definitions:
+            if attrs.setdefault(d.attr, d.id) != d.id:
+                d.attr = f"{d.attr}_{d.id.lower()}"
+        self.view = view_class("GroupView", {d.id: d.attr for d in self.definitions})
 
 class Doctype:
     def __init__(self, id, user_type, emitter_type):
@@ -248,6 +366,15 @@ class Perimeter:
                     self.datatypes[d.id] = i, d
             elif isinstance(i, Doctype):
                 self.doctypes[i.id] = i
+        # Same names in different groups are distinct fields (e.g. the
+        # birth date of an identity document and of a test result),
+        # those get the definition id appended, as within a group
+        ids = {}
+        for _, d in self.datatypes.values():
+            ids.setdefault(d.attr, []).append(d.id)
+        self.view = view_class(f"Perimeter{id}View", {
+            d.id: d.attr if len(ids[d.attr]) == 1 else f"{d.attr}_{d.id.lower()}"
+            for _, d in self.datatypes.values()})
 
     def datatype_get(self, id):
         group, definition = self.datatypes[id]
@@ -269,6 +396,19 @@ class Definitions:
         except KeyError:
             return Group("Unknown group"), Definition(id, "Unknown "+id, 0, None, String)
 
+    def definitions(self):
+        "Iterate over all data definitions of all perimeters"
+        for p in self.perimeters.values():
+            for g in p.groups:
+                yield from g.definitions
+
+    def view_get(self, perimeter):
+        "Typed view class of a perimeter"
+        try:
+            return self.perimeters[perimeter].view
+        except KeyError:
+            return TypedView
+
     def doctype_get(self, perimeter, id):
         try:
             p = self.perimeters[perimeter]
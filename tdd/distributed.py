@@ -0,0 +1,303 @@
+import itertools
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from .verify import verify_many
+
+__doc__ = """
+Archive verification distributed over several hosts.
+
+Workers load the keychain once and serve verification requests over
+TCP. A coordinator shards an input stream of codes into chunks, farms
+them out to all workers, retries chunks whose worker failed on another
+one, and yields results in input order.
+
+Protocol: each message is a 4-byte big-endian length followed by a
+UTF-8 JSON object. The coordinator sends {"chunk": id, "codes": [...]}
+and the worker answers {"chunk": id, "results": [...]}, one
+Result.to_dict() per code, or {"chunk": id, "error": "..."}.
+
+  $ python -m tdd.distributed worker --bind 0.0.0.0:7700
+  $ python -m tdd.distributed coordinate -w host1:7700 -w host2:7700 codes.txt
+"""
+__all__ = ["Coordinator", "WorkerServer", "ChunkFailedError"]
+
+LENGTH = struct.Struct(">I")
+
+class ChunkFailedError(Exception):
+    """Raised when a chunk could not be verified by any worker."""
+    pass
+
+def send_message(sock, obj):
+    data = json.dumps(obj).encode("utf-8")
+    sock.sendall(LENGTH.pack(len(data)) + data)
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        part = sock.recv(size - len(buf))
+        if not part:
+            raise ConnectionError("Connection closed")
+        buf += part
+    return bytes(buf)
+
+def recv_message(sock):
+    size, = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+def parse_address(address):
+    "Parse a host:port string"
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                request = recv_message(self.request)
+            except ConnectionError:
+                return
+            chunk = request.get("chunk")
+            try:
+                results = [r.to_dict() for r in verify_many(
+                    request["codes"], server.keychain,
+                    workers = server.threads, historical = server.historical)]
+                reply = {"chunk": chunk, "results": results}
+            except Exception as e:
+                reply = {"chunk": chunk, "error": f"{type(e).__name__}: {e}"}
+            send_message(self.request, reply)
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """
+    Verification worker. The keychain is loaded once by the caller and
+    shared by all connections.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, keychain, threads = None, historical = False):
+        super().__init__(address, _Handler)
+        self.keychain = keychain
+        self.threads = threads
+        self.historical = historical
+
+class Coordinator:
+    """
+    Distribute codes over workers, given as (host, port) tuples.
+
+    A chunk whose worker fails (connection error, timeout or error
+    reply) goes back to the queue for the other workers, and is not
+    handed to the failing worker again while a healthy one is left.
+    Only failures with no other worker left count against the chunk's
+    `retries`. A worker that fails `retries` times in a row is
+    dropped.
+    """
+    def __init__(self, workers, chunk_size = 500, retries = 3, timeout = 60.0,
+                 backoff = 0.5):
+        self.workers = list(workers)
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+
+    def _serve(self, address, todo, done, cond, state):
+        sock = None
+        failures = 0
+        try:
+            while not state["stop"]:
+                try:
+                    chunk_id, codes, attempts, excluded = todo.get(timeout = 0.1)
+                except queue.Empty:
+                    continue
+                if address in excluded:
+                    with cond:
+                        others = bool(state["alive"] - excluded)
+                    if others:
+                        # Leave it to a worker that did not fail it
+                        todo.put((chunk_id, codes, attempts, excluded))
+                        time.sleep(min(self.backoff, 0.05))
+                        continue
+                    excluded = frozenset()
+                try:
+                    if sock is None:
+                        sock = socket.create_connection(address, timeout = self.timeout)
+                        with cond:
+                            state["sockets"][address] = sock
+                    send_message(sock, {"chunk": chunk_id, "codes": codes})
+                    reply = recv_message(sock)
+                    if "error" in reply:
+                        raise ChunkFailedError(reply["error"])
+                    if reply.get("chunk") != chunk_id or len(reply["results"]) != len(codes):
+                        raise ChunkFailedError("Mismatched reply")
+                    failures = 0
+                    result = reply["results"]
+                except (OSError, ValueError, ChunkFailedError) as e:
+                    if sock is not None:
+                        with cond:
+                            state["sockets"].pop(address, None)
+                        sock.close()
+                        sock = None
+                    if state["stop"]:
+                        return
+                    failures += 1
+                    excluded = excluded | {address}
+                    with cond:
+                        others = bool(state["alive"] - excluded)
+                    if not others:
+                        attempts += 1
+                        excluded = frozenset()
+                    if attempts > self.retries:
+                        result = ChunkFailedError(f"Chunk {chunk_id} failed on {address}: {e}")
+                    else:
+                        todo.put((chunk_id, codes, attempts, excluded))
+                        if failures > self.retries:
+                            return
+                        time.sleep(self.backoff)
+                        continue
+                with cond:
+                    done[chunk_id] = result
+                    cond.notify_all()
+        finally:
+            with cond:
+                state["sockets"].pop(address, None)
+                state["alive"].discard(address)
+                cond.notify_all()
+            if sock is not None:
+                sock.close()
+
+    def _chunks(self, codes):
+        chunk = []
+        for code in codes:
+            chunk.append(code)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run(self, codes):
+        """
+        Verify codes (any iterable, consumed lazily), yielding one
+        result dict per code in input order. Raises ChunkFailedError
+        if a chunk exhausted its retries or no worker is left.
+        """
+        todo = queue.Queue()
+        done = {}
+        cond = threading.Condition()
+        state = {"stop": False, "alive": set(self.workers), "sockets": {}}
+        threads = [threading.Thread(target = self._serve,
+                                    args = (address, todo, done, cond, state),
+                                    daemon = True)
+                   for address in self.workers]
+        for t in threads:
+            t.start()
+
+        max_pending = 2 * len(self.workers)
+        chunks = enumerate(self._chunks(codes))
+        submitted = 0
+        exhausted = False
+        try:
+            for next_id in itertools.count():
+                while not exhausted and submitted - next_id < max_pending:
+                    try:
+                        chunk_id, chunk = next(chunks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    todo.put((chunk_id, chunk, 0, frozenset()))
+                    submitted += 1
+                if next_id >= submitted:
+                    return
+
+                with cond:
+                    while next_id not in done:
+                        if not state["alive"]:
+                            raise ChunkFailedError("No worker left")
+                        cond.wait()
+                    result = done.pop(next_id)
+                if isinstance(result, Exception):
+                    raise result
+                yield from result
+        finally:
+            state["stop"] = True
+            # Wake up workers blocked in recv rather than waiting for
+            # their timeout
+            with cond:
+                sockets = list(state["sockets"].values())
+            for sock in sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            for t in threads:
+                t.join()
+
+def main(args = None):
+    import argparse
+    import sys
+    from .audit import AuditLog
+    from .keychain import internal
+
+    parser = argparse.ArgumentParser(description = "Distributed 2D-Doc verification")
+    sub = parser.add_subparsers(dest = "command", required = True)
+
+    w = sub.add_parser("worker", help = "Serve verification requests")
+    w.add_argument("--bind", default = "127.0.0.1:7700",
+                   help = "Listen address, host:port (port 0 picks a free one)")
+    w.add_argument("--threads", type = int, default = None,
+                   help = "Verification threads per request")
+    w.add_argument("--test-ca", action = "store_true",
+                   help = "Load FR00 test CA certificate")
+    w.add_argument("--historical", action = "store_true",
+                   help = "Check certificate validity at document sign date")
+
+    c = sub.add_parser("coordinate", help = "Verify a file of codes, one per line")
+    c.add_argument("input", help = "Input file, one code per line")
+    c.add_argument("-w", "--worker", action = "append", required = True,
+                   help = "Worker address, host:port (repeat for each worker)")
+    c.add_argument("-o", "--output", default = None,
+                   help = "Output file for JSON lines results (default: stdout)")
+    c.add_argument("--chunk-size", type = int, default = 500)
+    c.add_argument("--retries", type = int, default = 3)
+    c.add_argument("--audit", default = None, metavar = "DB",
+                   help = "Also record results into this SQLite audit database")
+
+    parsed = parser.parse_args(args)
+
+    if parsed.command == "worker":
+        keychain = internal(include_test = parsed.test_ca,
+                            check_expiry = not parsed.test_ca)
+        with WorkerServer(parse_address(parsed.bind), keychain,
+                          threads = parsed.threads,
+                          historical = parsed.historical) as server:
+            host, port = server.server_address[:2]
+            print(f"Listening on {host}:{port}", flush = True)
+            server.serve_forever()
+        return
+
+    coordinator = Coordinator([parse_address(a) for a in parsed.worker],
+                              chunk_size = parsed.chunk_size,
+                              retries = parsed.retries)
+    out = open(parsed.output, "w") if parsed.output else sys.stdout
+    audit = AuditLog(parsed.audit) if parsed.audit else None
+    try:
+        with open(parsed.input, "r") as fd:
+            codes = (line.strip() for line in fd if line.strip())
+            results = coordinator.run(codes)
+            if audit is not None:
+                results = audit.record(results)
+            for result in results:
+                out.write(json.dumps(result) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if audit is not None:
+            audit.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from .header import Header
+from .header import Header, _c40_lengths
 from .message import C40Message
 from base64 import b32decode
 from cryptography.exceptions import InvalidSignature
@@ -13,6 +13,10 @@ Documentation representation.
 class TwoDDoc:
     """
     A 2D-Doc document
+
+    Documents may be parsed and verified from several threads at
+    once: the only state parsing shares are caches (header prefixes,
+    interned values), which are safe for concurrent use.
     """
     def __init__(self,
                  header, message,
@@ -24,35 +28,121 @@ class TwoDDoc:
         self.signature = signature
         self.signed_data = signed_data
         self.extra = extra
+        self._typed = None
 
     @classmethod
-    def from_code(cls, doc):
+    def from_code(cls, doc, limits = None):
         """
         Load a 2D-Doc from its ASCII form, as outputted by a barcode reader
+
+        `limits` (message.Limits, defaults to C40Message.limits) bounds
+        code length, field count and field size; LimitExceeded is
+        raised for codes over them.
         """
-        header = Header.from_code(doc)
-        if header.mode == "c40":
-            data, sign = doc[header.length:].split('\x1f', 1)
-            signature = b32decode(sign+"=")
-            message = C40Message.from_code(header.perimeter_id, data)
-            signed_data = (doc[:header.length]+data).encode("ascii")
-        else:
-            raise ValueError("Binary code not supported fully yet")
+        header, data, signature, signed_data = _split(doc, limits)
+        message = _message(header, data, limits)
+
+        return cls(header, message, signature,
+                   signed_data = signed_data)
 
+    @classmethod
+    def from_code_if_valid(cls, doc, keychain, historical = False, limits = None):
+        """
+        Verify-before-decode: check the signature over the raw code
+        with only the header parsed, and decode the message only if
+        the signature is valid. Returns None for a broken signature.
+        Key lookup errors are raised as by signature_is_valid().
+
+        `doc` may be an ASCII string or bytes. If historical is True,
+        the certificate valid at document sign date is used. `limits`
+        is as for from_code(), code length is checked before the
+        signature.
+        """
+        header, data, signature, signed_data = _split(doc, limits)
+        at = header.sign_date if historical else None
+        if not _signature_check(keychain, header, signature, signed_data, at):
+            return None
+        message = _message(header, data, limits)
         return cls(header, message, signature,
                    signed_data = signed_data)
 
-    def signature_is_valid(self, keychain):
+    def __reduce__(self):
+        """
+        Pickle through the compact tdd.wire encoding rather than the
+        whole object graph (definitions, groups, encodings), to keep
+        process pool transfers cheap.
+        """
+        from .wire import _loads_extra, dumps, loads
+        try:
+            return loads, (dumps(self),)
+        except TypeError:
+            # Extra attribute the encoding does not support, pickled as is
+            return _loads_extra, (dumps(self, extra = False), self.extra)
+
+    def typed(self):
+        """
+        Typed view of message fields, e.g. `doc.typed().date_fin_droits`.
+        Attribute names derive from definition names (see
+        data_definition.attribute_name), absent fields read as None.
+        The view is built once per document.
+        """
+        if self._typed is None:
+            from .data_definition import c40
+            self._typed = c40.view_get(self.message.perimeter_id)(self.message.dataset)
+        return self._typed
+
+    def signature_is_valid(self, keychain, at = None):
         """
         Check signature against given keychain. If key is not
         available, KeyError is raised.
+
+        `at` selects the certificate valid at a given date, defaults
+        to now. Use header sign date to verify archived documents.
         """
-        cert = keychain.lookup(self.header.ca_id, self.header.cert_id)
-        r = int.from_bytes(self.signature[:32], "big")
-        s = int.from_bytes(self.signature[32:], "big")
-        dss_sig = encode_dss_signature(r, s)
-        try:
-            cert.public_key().verify(dss_sig, self.signed_data, ec.ECDSA(hashes.SHA256()))
-        except InvalidSignature:
-            return False
-        return True
+        return _signature_check(keychain, self.header, self.signature,
+                                self.signed_data, at)
+
+def _split(doc, limits = None):
+    """
+    Split a C40 code (ASCII string or bytes) in parsed header, message
+    data (string or bytes, as given), signature and signed bytes,
+    leaving the message undecoded. Code length is checked against
+    limits first.
+    """
+    (limits or C40Message.limits).check_length(doc)
+    if isinstance(doc, str):
+        header = Header.from_code(doc)
+        if header.mode != "c40":
+            raise ValueError("Binary code not supported fully yet")
+        end = doc.index('\x1f', header.length)
+        signed_data = doc[:end].encode("ascii")
+        data = doc[header.length:end]
+        sign = doc[end + 1:]
+    else:
+        doc = bytes(doc)
+        if doc[:2] != b"DC":
+            Header.from_code(doc)
+            raise ValueError("Binary code not supported fully yet")
+        length = _c40_lengths.get(doc[2:4].decode("latin-1"), len(doc))
+        header = Header.from_code(doc[:length].decode("ascii"))
+        end = doc.index(b'\x1f', header.length)
+        signed_data = doc[:end]
+        data = signed_data[header.length:]
+        sign = doc[end + 1:].decode("ascii")
+    return header, data, b32decode(sign+"="), signed_data
+
+def _message(header, data, limits = None):
+    if not isinstance(data, str):
+        data = data.decode("ascii")
+    return C40Message.from_code(header.perimeter_id, data, limits)
+
+def _signature_check(keychain, header, signature, signed_data, at):
+    cert = keychain.lookup(header.ca_id, header.cert_id, at = at)
+    r = int.from_bytes(signature[:32], "big")
+    s = int.from_bytes(signature[32:], "big")
+    dss_sig = encode_dss_signature(r, s)
+    try:
+        cert.public_key().verify(dss_sig, signed_data, ec.ECDSA(hashes.SHA256()))
+    except InvalidSignature:
+        return False
+    return True
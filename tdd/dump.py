@@ -1,6 +1,6 @@
 __doc__ = "2D-Doc dumper helper"
 
-def dump(doc, keychain = None):
+def dump(doc, keychain = None, historical = False):
     from .doc import TwoDDoc
     from .data_definition import c40
     d = TwoDDoc.from_code(doc)
@@ -28,7 +28,8 @@ def dump(doc, keychain = None):
 
     if keychain:
         try:
-            if d.signature_is_valid(keychain):
+            at = d.header.sign_date if historical else None
+            if d.signature_is_valid(keychain, at = at):
                 print("Signature OK")
             else:
                 print("Signature broken")
@@ -37,20 +38,57 @@ def dump(doc, keychain = None):
 
 if __name__ == "__main__":
     import argparse
+    from .filter import HeaderFilter
     from .keychain import internal
 
     parser = argparse.ArgumentParser(description="Dump 2D-Doc content")
     parser.add_argument("files", nargs="+", metavar="code.txt",
                         help="2D-Doc text files to dump")
+    parser.add_argument("--lines", action="store_true",
+                        help="Files are archives of one code per line, possibly "
+                        "compressed (gzip, xz, bzip2, zstd), or directories of them")
     parser.add_argument("--test-ca", action="store_true",
                         help="Load FR00 test CA certificate")
+    parser.add_argument("--historical", action="store_true",
+                        help="Check certificate validity at document sign date")
+    parser.add_argument("--doctype", action="append", default=None,
+                        help="Only dump documents of this type (repeatable)")
+    parser.add_argument("--perimeter", action="append", type=int, default=None,
+                        help="Only dump documents of this perimeter (repeatable)")
+    parser.add_argument("--ca", action="append", default=None,
+                        help="Only dump documents signed by this CA (repeatable)")
+    parser.add_argument("--cert", action="append", default=None,
+                        help="Only dump documents signed by this certificate (repeatable)")
     args = parser.parse_args()
 
     keychain = internal(include_test=args.test_ca, check_expiry=not args.test_ca)
+    header_filter = None
+    if any(f is not None for f in (args.doctype, args.perimeter, args.ca, args.cert)):
+        header_filter = HeaderFilter(doc_types=args.doctype, perimeters=args.perimeter,
+                                     ca_ids=args.ca, cert_ids=args.cert)
 
-    for fn in args.files:
-        with open(fn, 'r') as fd:
-            blob = fd.read().strip()
-        print(f"{fn}:")
-        dump(blob, keychain)
+    if args.lines:
+        import sys
+        from .sources import read_codes
+
+        def bad_line(fn, line, error):
+            print(f"{fn}:{line}: {error}", file=sys.stderr)
+        codes = ((f"{fn}:{line}", blob)
+                 for fn, line, blob in read_codes(args.files, on_error=bad_line))
+    else:
+        def read(fn):
+            with open(fn, 'r') as fd:
+                return fd.read().strip()
+        codes = ((fn, read(fn)) for fn in args.files)
+
+    for name, blob in codes:
+        if header_filter is not None and not header_filter.matches_code(blob):
+            continue
+        print(f"{name}:")
+        try:
+            dump(blob, keychain, historical=args.historical)
+        except Exception as e:
+            if not args.lines:
+                raise
+            print("Error:", e)
         print()
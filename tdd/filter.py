@@ -0,0 +1,71 @@
+from .header import Header
+
+__doc__ = """
+Header level filtering of codes, so that uninteresting documents are
+skipped before message parsing and signature checking.
+"""
+__all__ = ["HeaderFilter", "filter_codes"]
+
+class HeaderFilter:
+    """
+    Predicate on document header. Each criterion is a collection of
+    accepted values, None accepts anything. `predicate` is an
+    optional extra callable taking a Header.
+
+    For C40 codes without extra predicate, criteria are evaluated
+    straight on the raw header characters, without building a Header.
+    """
+    def __init__(self, doc_types = None, perimeters = None,
+                 ca_ids = None, cert_ids = None, countries = None,
+                 predicate = None):
+        self.doc_types = frozenset(doc_types) if doc_types is not None else None
+        self.perimeters = frozenset(int(p) for p in perimeters) if perimeters is not None else None
+        self.ca_ids = frozenset(ca_ids) if ca_ids is not None else None
+        self.cert_ids = frozenset(cert_ids) if cert_ids is not None else None
+        self.countries = frozenset(countries) if countries is not None else None
+        self.predicate = predicate
+
+    def _match(self, doc_type_id, perimeter_id, ca_id, cert_id, country_id):
+        return (self.doc_types is None or doc_type_id in self.doc_types) \
+            and (self.perimeters is None or perimeter_id in self.perimeters) \
+            and (self.ca_ids is None or ca_id in self.ca_ids) \
+            and (self.cert_ids is None or cert_id in self.cert_ids) \
+            and (self.countries is None or country_id in self.countries)
+
+    def matches(self, header):
+        "Check a parsed header"
+        return self._match(header.doc_type_id, header.perimeter_id,
+                           header.ca_id, header.cert_id, header.country_id) \
+            and (self.predicate is None or self.predicate(header))
+
+    def matches_code(self, code):
+        """
+        Check a raw code (ASCII string or binary blob). Codes that are
+        not 2D-Docs never match.
+        """
+        if self.predicate is None and isinstance(code, str):
+            if code[0:2] != "DC" or len(code) < 22:
+                return False
+            version = code[2:4]
+            if version in ("01", "02"):
+                perimeter_id, country_id = 1, "FR"
+            elif version in ("03", "04") and code[22:24].isdigit():
+                perimeter_id = int(code[22:24])
+                country_id = code[24:26] if version == "04" else "FR"
+            else:
+                return False
+            return self._match(code[20:22], perimeter_id,
+                               code[4:8], code[8:12], country_id)
+        try:
+            header = Header.from_code(code)
+        except (ValueError, IndexError):
+            return False
+        return self.matches(header)
+
+    __call__ = matches_code
+
+def filter_codes(codes, header_filter):
+    "Lazily yield the codes of an iterable accepted by header_filter"
+    for code in codes:
+        if header_filter.matches_code(code):
+            yield code
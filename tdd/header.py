@@ -6,10 +6,23 @@ __all__ = ["Header"]
 
 EPOCH = date(2000, 1, 1)
 
+# Dates are 16-bit day counts from EPOCH, table is filled on first use
+# of each value.
+_epoch_dates = [None] * 0x10000
+
+def epoch_date(days):
+    "Date of a day count from EPOCH, as used by C40 dates"
+    if not 0 <= days < 0x10000:
+        return EPOCH + timedelta(days = days)
+    d = _epoch_dates[days]
+    if d is None:
+        d = _epoch_dates[days] = EPOCH + timedelta(days = days)
+    return d
+
 def date_parse_text(code):
     if code == "FFFF":
         return None
-    return EPOCH + timedelta(days = int(code, 16))
+    return epoch_date(int(code, 16))
 
 def date_parse_bin(code):
     if code == b"FFFF":
@@ -32,6 +45,41 @@ def date_encode(d, mode = "c40"):
     else:
         raise ValueError(mode)
 
+# Header length by version, for C40 mode
+_c40_lengths = {"01": 22, "02": 22, "03": 24, "04": 26}
+
+# Headers of a deployment share few distinct prefixes (everything but
+# dates), cache their parsed fields.
+PREFIX_CACHE_SIZE = 256
+_prefix_cache = {}
+
+def _c40_prefix_parse(code):
+    version = int(code[2:4], 10)
+    if not (1 <= version <= 4):
+        raise ValueError("Unsupported 2D-Doc version")
+    return (version,
+            code[4:8],
+            code[8:12],
+            code[20:22],
+            int(code[22:24]) if version >= 3 else 1,
+            code[24:26] if version >= 4 else "FR")
+
+def _c40_prefix(code):
+    length = _c40_lengths.get(code[2:4])
+    if length is None:
+        return _c40_prefix_parse(code)
+    key = code[2:12] + code[20:length]
+    prefix = _prefix_cache.get(key)
+    if prefix is None:
+        prefix = _c40_prefix_parse(code)
+        if len(_prefix_cache) >= PREFIX_CACHE_SIZE:
+            try:
+                del _prefix_cache[next(iter(_prefix_cache))]
+            except (KeyError, RuntimeError, StopIteration):
+                pass
+        _prefix_cache[key] = prefix
+    return prefix
+
 class Header:
     """
     2D-Doc header
@@ -51,19 +99,14 @@ class Header:
         """
         Parse a header from raw data, either ascii string (C40 mode) or
         blob (binary mode). Supports all versions from 1 to 4.
+
+        In C40 mode, fields other than dates are cached by header
+        prefix, and dates are resolved through a day table.
         """
         if isinstance(code, str) and code[0:2] == "DC":
-            version = int(code[2:4], 10)
-            if not (1 <= version <= 4):
-                raise ValueError("Unsupported 2D-Doc version")
-
-            ca_id = code[4:8]
-            cert_id = code[8:12]
+            version, ca_id, cert_id, doc_type_id, perimeter_id, country_id = _c40_prefix(code)
             emit_date = date_parse_text(code[12:16])
             sign_date = date_parse_text(code[16:20])
-            doc_type_id = code[20:22]
-            perimeter_id = int(code[22:24]) if version >= 3 else 1
-            country_id = code[24:26] if version >= 4 else "FR"
 
         elif isinstance(code, bytes) and code[0] == 0xdc:
             version = code[1]
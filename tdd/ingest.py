@@ -0,0 +1,345 @@
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+import ctypes.util
+import json
+import os
+from pathlib import Path
+import select
+import signal
+import struct
+import sys
+import tempfile
+import threading
+import time
+from .verify import verify
+
+__doc__ = """
+Watch-folder ingestion of scanned codes.
+
+Scanning stations drop .txt files holding one code each (the format
+tdd.dump reads) into shared folders. The ingestion command keeps one
+keychain loaded, watches the folders (inotify on Linux, polling
+elsewhere), verifies new files in a thread pool, and writes one JSON
+result per file, atomically (temporary file then rename), next to the
+input or into an output directory.
+
+Files already present when the command starts are processed unless
+their result is up to date, so that drops made while it was stopped
+are not lost.
+
+  $ python -m tdd.ingest /srv/drops/gate1 /srv/drops/gate2 --output-dir /srv/results
+"""
+__all__ = ["Ingestor", "InotifyWatcher", "PollingWatcher", "watcher"]
+
+SUFFIX = ".txt"
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+EVENT = struct.Struct("iIII")
+
+class InotifyWatcher:
+    """
+    Report files closed after writing, or moved into, watched
+    directories, through Linux inotify (via ctypes). Raises OSError
+    when inotify is not available.
+    """
+    def __init__(self, directories):
+        name = ctypes.util.find_library("c")
+        try:
+            libc = ctypes.CDLL(name, use_errno = True)
+            init = libc.inotify_init1
+            add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError("inotify is not available")
+        add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for d in directories:
+            wd = add_watch(self.fd, os.fsencode(d), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(errno, os.strerror(errno), str(d))
+            self.directories[wd] = Path(d)
+        self.overflowed = False
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds, return paths of ready files. If
+        the kernel queue overflowed, `overflowed` is set and events
+        were lost: callers should rescan directories.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        paths = []
+        off = 0
+        while off + EVENT.size <= len(buf):
+            wd, mask, _, length = EVENT.unpack_from(buf, off)
+            off += EVENT.size
+            name = buf[off:off + length].rstrip(b"\0")
+            off += length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+            elif wd in self.directories and name:
+                paths.append(self.directories[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """
+    Report files of watched directories that are new or changed,
+    once their size and modification time are stable over two scans
+    (so that files being written are not picked up half way).
+    """
+    overflowed = False
+
+    def __init__(self, directories, interval = 1.0):
+        self.directories = [Path(d) for d in directories]
+        self.interval = interval
+        self._seen = {}
+        self._reported = {}
+        self._last = None
+        # Files present at start are the caller's initial scan job
+        for path, stamp in self._scan():
+            self._seen[path] = self._reported[path] = stamp
+
+    def _scan(self):
+        for d in self.directories:
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for e in entries:
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                yield Path(e.path), (st.st_mtime_ns, st.st_size)
+
+    def wait(self, timeout):
+        if self._last is not None:
+            delay = self._last + self.interval - time.monotonic()
+            if delay > timeout:
+                time.sleep(timeout)
+                return []
+            if delay > 0:
+                time.sleep(delay)
+        self._last = time.monotonic()
+        paths = []
+        seen = {}
+        for path, stamp in self._scan():
+            seen[path] = stamp
+            if self._seen.get(path) == stamp and self._reported.get(path) != stamp:
+                self._reported[path] = stamp
+                paths.append(path)
+        self._seen = seen
+        self._reported = {p: s for p, s in self._reported.items() if p in seen}
+        return paths
+
+    def close(self):
+        pass
+
+def watcher(directories, polling = False, interval = 1.0):
+    "Inotify watcher if available and polling is False, polling watcher otherwise"
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directories)
+        except OSError:
+            pass
+    return PollingWatcher(directories, interval)
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir = path.parent, prefix = "." + path.name, suffix = ".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding = "utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+class Ingestor:
+    """
+    Verify dropped code files with one warm keychain and write their
+    results as JSON (Result.to_dict() plus the input file name).
+
+    Results go next to the input (`name.txt` gives `name.json`), or
+    into `output_dir`. They are also recorded into `audit` (a
+    tdd.audit.AuditLog) if given.
+    """
+    def __init__(self, keychain, output_dir = None, workers = None,
+                 historical = False, audit = None):
+        self.keychain = keychain
+        self.audit = audit
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.workers = workers
+        self.historical = historical
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._inflight = set()
+
+    def result_path(self, path):
+        path = Path(path)
+        directory = self.output_dir if self.output_dir is not None else path.parent
+        return directory / (path.stem + ".json")
+
+    def pending(self, directories):
+        "Code files of directories without an up to date result"
+        for d in directories:
+            for path in sorted(Path(d).glob("*" + SUFFIX)):
+                result = self.result_path(path)
+                try:
+                    if result.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+                        continue
+                except OSError:
+                    pass
+                yield path
+
+    def process(self, path):
+        """
+        Verify one code file and write its result. Returns the result
+        path, or None if the file could not be read.
+        """
+        path = Path(path)
+        try:
+            with open(path, "r") as fd:
+                code = fd.read().strip()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"{path}: {e}", file = sys.stderr)
+            with self._lock:
+                self.failed += 1
+            return None
+        r = verify(code, self.keychain, historical = self.historical)
+        if self.audit is not None:
+            self.audit.write(r)
+        d = r.to_dict()
+        d["file"] = path.name
+        result = self.result_path(path)
+        _write_atomic(result, json.dumps(d) + "\n")
+        with self._lock:
+            self.processed += 1
+        return result
+
+    def _submit(self, pool, path):
+        "Queue a file unless it is already queued or being processed"
+        with self._lock:
+            if path in self._inflight:
+                return
+            self._inflight.add(path)
+        future = pool.submit(self.process, path)
+        future.add_done_callback(lambda f: self._done(path, f))
+
+    def _done(self, path, future):
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            self._inflight.discard(path)
+            if error is not None:
+                self.failed += 1
+        if error is not None:
+            print(f"{path}: {type(error).__name__}: {error}", file = sys.stderr)
+
+    def run(self, directories, watch = None, stop = None, once = False):
+        """
+        Process pending files of directories, then, unless once is
+        True, files reported by `watch` (defaults to watcher()) until
+        the `stop` event is set.
+        """
+        directories = [Path(d) for d in directories]
+        if self.output_dir is not None:
+            self.output_dir.mkdir(parents = True, exist_ok = True)
+        stop = stop or threading.Event()
+        own_watch = watch is None and not once
+        if own_watch:
+            # Watch before the initial scan, so that no drop is missed
+            watch = watcher(directories)
+        try:
+            with ThreadPoolExecutor(max_workers = self.workers) as pool:
+                for path in self.pending(directories):
+                    self._submit(pool, path)
+                if once:
+                    return
+                while not stop.is_set():
+                    paths = watch.wait(0.5)
+                    if watch.overflowed:
+                        watch.overflowed = False
+                        paths = list(self.pending(directories))
+                    for path in paths:
+                        if path.suffix == SUFFIX:
+                            self._submit(pool, path)
+        finally:
+            if own_watch:
+                watch.close()
+
+def main(args = None):
+    import argparse
+    from .audit import AuditLog
+    from .keychain import internal
+
+    parser = argparse.ArgumentParser(description = "Verify code files dropped into directories")
+    parser.add_argument("directories", nargs = "+", metavar = "DIR",
+                        help = "Directories to watch")
+    parser.add_argument("--output-dir", default = None,
+                        help = "Directory for JSON results (default: next to inputs)")
+    parser.add_argument("--workers", type = int, default = None,
+                        help = "Verification threads")
+    parser.add_argument("--test-ca", action = "store_true",
+                        help = "Load FR00 test CA certificate")
+    parser.add_argument("--historical", action = "store_true",
+                        help = "Check certificate validity at document sign date")
+    parser.add_argument("--poll", type = float, default = None, metavar = "SECONDS",
+                        help = "Poll directories at this interval instead of using inotify")
+    parser.add_argument("--once", action = "store_true",
+                        help = "Process pending files and exit")
+    parser.add_argument("--audit", default = None, metavar = "DB",
+                        help = "Also record results into this SQLite audit database")
+    parsed = parser.parse_args(args)
+
+    keychain = internal(include_test = parsed.test_ca,
+                        check_expiry = not parsed.test_ca)
+    audit = AuditLog(parsed.audit) if parsed.audit else None
+    ingestor = Ingestor(keychain, output_dir = parsed.output_dir,
+                        workers = parsed.workers, historical = parsed.historical,
+                        audit = audit)
+    watch = None
+    if not parsed.once:
+        watch = watcher(parsed.directories, polling = parsed.poll is not None,
+                        interval = parsed.poll or 1.0)
+    stop = threading.Event()
+
+    def terminate(signum, frame):
+        # Stop watching; queued files are processed and audit rows
+        # flushed again on the way out
+        stop.set()
+        if audit is not None:
+            audit.flush()
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        ingestor.run(parsed.directories, watch = watch, stop = stop, once = parsed.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watch is not None:
+            watch.close()
+        if audit is not None:
+            audit.close()
+
+if __name__ == "__main__":
+    main()
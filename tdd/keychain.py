@@ -1,8 +1,14 @@
 from cryptography import x509
-from cryptography.x509.oid import NameOID
-from datetime import datetime, timezone
+from cryptography.x509.oid import NameOID, SignatureAlgorithmOID
+from bisect import bisect_right
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+from datetime import datetime, time, timezone
 from io import BytesIO
 from pathlib import Path
+import threading
 
 __doc__ = "Keychain management"
 
@@ -14,14 +20,244 @@ class ExpiredCertificateError(Exception):
     """Raised when a certificate has expired or is not yet valid."""
     pass
 
+class RevokedCertificateError(Exception):
+    """Raised when a certificate is listed in a loaded CRL."""
+    pass
+
+class CertEntry:
+    """
+    Index record of a certificate. Names and validity window are
+    extracted once at load time, so that lookup never has to walk
+    x509 structures.
+    """
+    __slots__ = ("issuer_cn", "subject_cn", "not_before", "not_after", "_cert")
+
+    def __init__(self, issuer_cn, subject_cn, not_before, not_after, cert = None):
+        self.issuer_cn = issuer_cn
+        self.subject_cn = subject_cn
+        self.not_before = not_before
+        self.not_after = not_after
+        self._cert = cert
+
+    @classmethod
+    def from_cert(cls, cert):
+        return cls(KeyChain._cn(cert.issuer), KeyChain._cn(cert.subject),
+                   cert.not_valid_before_utc, cert.not_valid_after_utc, cert)
+
+    @property
+    def cert(self):
+        return self._cert
+
+    def verify_issued_by(self, ca):
+        """
+        Check this certificate is signed by the CA entry. Raises
+        ValueError, TypeError or InvalidSignature otherwise.
+        """
+        ca_cert = ca.cert
+        if isinstance(ca_cert, x509.Certificate):
+            self.cert.verify_directly_issued_by(ca_cert)
+        else:
+            CompactCertEntry.from_cert(self.cert).verify_issued_by(ca)
+
+class LazyCertEntry(CertEntry):
+    """
+    Index record whose certificate is only parsed from its DER
+    encoding (bytes or memoryview) on first use.
+    """
+    __slots__ = ("der",)
+
+    def __init__(self, issuer_cn, subject_cn, not_before, not_after, der):
+        super().__init__(issuer_cn, subject_cn, not_before, not_after)
+        self.der = der
+
+    @property
+    def cert(self):
+        if self._cert is None:
+            if self.der is None:
+                raise ValueError(f"Certificate {self.subject_cn} released")
+            self._cert = x509.load_der_x509_certificate(bytes(self.der))
+        return self._cert
+
+    @property
+    def materialized(self):
+        return self._cert is not None
+
+class CompactCertEntry(CertEntry):
+    """
+    Minimal verification record of a certificate, for memory
+    constrained readers: no x509 object is kept, only names, validity
+    window, serial number, the DER encoded public key (parsed on
+    demand), the issuer name, and the digest (the body itself for
+    EdDSA) and signature of the certificate body so the issuer link
+    can still be checked on lookup.
+
+    The entry stands in for the certificate: `cert` returns the entry
+    itself, which provides public_key().
+    """
+    __slots__ = ("serial_number", "spki", "tbs_digest", "signature", "hash_name",
+                 "padding", "issuer_name", "subject_name", "issuer_entry")
+
+    @classmethod
+    def from_cert(cls, cert):
+        self = cls(KeyChain._cn(cert.issuer), KeyChain._cn(cert.subject),
+                   cert.not_valid_before_utc, cert.not_valid_after_utc)
+        algorithm = cert.signature_hash_algorithm
+        if algorithm is None:
+            # Ed25519 and Ed448 sign the certificate body itself
+            self.tbs_digest = cert.tbs_certificate_bytes
+            self.hash_name = None
+        else:
+            digest = hashes.Hash(algorithm)
+            digest.update(cert.tbs_certificate_bytes)
+            self.tbs_digest = digest.finalize()
+            self.hash_name = algorithm.name
+        if cert.signature_algorithm_oid == SignatureAlgorithmOID.RSASSA_PSS:
+            self.padding = cert.signature_algorithm_parameters
+        else:
+            self.padding = None
+        self.serial_number = cert.serial_number
+        self.spki = cert.public_key().public_bytes(
+            serialization.Encoding.DER,
+            serialization.PublicFormat.SubjectPublicKeyInfo)
+        self.signature = cert.signature
+        self.issuer_name = cert.issuer.public_bytes()
+        self.subject_name = cert.subject.public_bytes()
+        self.issuer_entry = None
+        return self
+
+    @property
+    def cert(self):
+        return self
+
+    @property
+    def not_valid_before_utc(self):
+        return self.not_before
+
+    @property
+    def not_valid_after_utc(self):
+        return self.not_after
+
+    def public_key(self):
+        return serialization.load_der_public_key(self.spki)
+
+    def verify_issued_by(self, ca):
+        if ca is self.issuer_entry:
+            return
+        ca_cert = ca.cert
+        if isinstance(ca_cert, CompactCertEntry):
+            ca_name = ca_cert.subject_name
+        else:
+            ca_name = ca_cert.subject.public_bytes()
+        if ca_name != self.issuer_name:
+            raise ValueError("Issuer name does not match CA subject")
+        key = ca_cert.public_key()
+        if self.hash_name is None:
+            if not isinstance(key, (ed25519.Ed25519PublicKey, ed448.Ed448PublicKey)):
+                raise TypeError("Unsupported CA key type")
+            key.verify(self.signature, self.tbs_digest)
+        else:
+            algorithm = Prehashed(_HASHES[self.hash_name]())
+            if isinstance(key, ec.EllipticCurvePublicKey):
+                key.verify(self.signature, self.tbs_digest, ec.ECDSA(algorithm))
+            elif isinstance(key, rsa.RSAPublicKey):
+                key.verify(self.signature, self.tbs_digest,
+                           self.padding or padding.PKCS1v15(), algorithm)
+            else:
+                raise TypeError("Unsupported CA key type")
+        self.issuer_entry = ca
+
+_HASHES = {h.name: h for h in (hashes.SHA1, hashes.SHA224, hashes.SHA256,
+                               hashes.SHA384, hashes.SHA512)}
+
+class ValidityIndex:
+    """
+    Certificates sharing the same issuer and subject common names,
+    sorted by start of validity. A prefix maximum of the ends of
+    validity bounds the backward walk, so that finding the certificate
+    valid at a given time is a bisection plus a short scan over
+    overlapping windows.
+    """
+    __slots__ = ("entries", "starts", "ends_max")
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: e.not_before)
+        self.starts = [e.not_before for e in self.entries]
+        self.ends_max = []
+        end = None
+        for e in self.entries:
+            end = e.not_after if end is None or e.not_after > end else end
+            self.ends_max.append(end)
+
+    def added(self, entry):
+        "Spawn a new index with an additional entry"
+        return ValidityIndex(self.entries + [entry])
+
+    def find(self, start, end = None):
+        """
+        Find the latest issued entry whose validity window overlaps
+        [start, end]. Returns None if there is none.
+        """
+        end = start if end is None else end
+        i = bisect_right(self.starts, end)
+        while i > 0 and self.ends_max[i - 1] >= start:
+            i -= 1
+            if self.entries[i].not_after >= start:
+                return self.entries[i]
+        return None
+
+    def last_end(self, end):
+        """
+        Latest end of validity of the entries started by end, None if
+        there is none.
+        """
+        i = bisect_right(self.starts, end)
+        return self.ends_max[i - 1] if i else None
+
+def _crl_signed_by(crl, issuer):
+    try:
+        return crl.is_signature_valid(issuer.cert.public_key())
+    except (TypeError, ValueError):
+        return False
+
+def _time_range(at):
+    """
+    Normalize a lookup time to a (start, end) UTC range. A date covers
+    the whole day, naive datetimes are taken as UTC.
+    """
+    if not isinstance(at, datetime):
+        return (datetime.combine(at, time.min, timezone.utc),
+                datetime.combine(at, time.max, timezone.utc))
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at, at
+
 class KeyChain:
     """
     Certificate store, indexes certificates through common name of
     issuer and subject. This is somehow 2D-Doc specific.
+
+    A keychain is safe for concurrent use: lookups do not lock and
+    only read immutable index values (ValidityIndex, tuples, frozen
+    sets), which loaders replace as a whole under a writer lock rather
+    than mutating them in place.
+
+    In compact mode, only the minimal verification record of each
+    certificate is kept (see CompactCertEntry), and lookup returns
+    that record instead of an x509 certificate.
     """
-    def __init__(self, check_expiry=True):
-        self.certs = []
+    def __init__(self, check_expiry=True, compact=False):
         self.check_expiry = check_expiry
+        self.compact = compact
+        self._lock = threading.Lock()
+        self._entries = []
+        # (issuer CN, subject CN) -> ValidityIndex
+        self._index = {}
+        # subject CN -> tuple of CertEntry, used to find issuers
+        self._subjects = {}
+        # Revoked serial numbers, indexed by CRL issuer common name
+        self.revoked = {}
+        self._crl_updates = {}
+        self._crl_sources = {}
 
     @staticmethod
     def _cn(name):
@@ -29,42 +265,96 @@ class KeyChain:
         attrs = name.get_attributes_for_oid(NameOID.COMMON_NAME)
         return attrs[0].value if attrs else None
 
-    def lookup(self, ca_cn, cert_cn):
+    @property
+    def certs(self):
+        """All certificates, in load order."""
+        return [e.cert for e in self._entries]
+
+    def _indexes(self, key):
+        "ValidityIndex of an (issuer CN, subject CN) key, per layer"
+        index = self._index.get(key)
+        return () if index is None else (index,)
+
+    def _issuers(self, subject_cn):
+        "Entries of a CA common name, candidate issuers"
+        return self._subjects.get(subject_cn, ())
+
+    def _is_revoked(self, issuer_cn, serial_number):
+        "Whether an issuer revoked a serial number"
+        return serial_number in self.revoked.get(issuer_cn, ())
+
+    def overlay(self, check_expiry=None):
+        """
+        Spawn an OverlayKeyChain on top of this one, for certificates
+        and CRLs that must not leak into this keychain (e.g. private
+        CAs of one tenant).
+        """
+        return OverlayKeyChain(self, check_expiry=check_expiry)
+
+    def entry_add(self, entry):
+        """Index a certificate entry."""
+        key = entry.issuer_cn, entry.subject_cn
+        with self._lock:
+            self._entries.append(entry)
+            index = self._index.get(key)
+            self._index[key] = ValidityIndex([entry]) if index is None else index.added(entry)
+            self._subjects[entry.subject_cn] = self._subjects.get(entry.subject_cn, ()) + (entry,)
+
+    def lookup(self, ca_cn, cert_cn, at=None):
         """
         Find a certificate by CA and subject common names.
+
+        When several certificates share the same names (key rotation),
+        the one valid at time `at` (a date or a datetime, defaults to
+        now) is returned. For archived documents, pass the document
+        sign date.
+
         Verifies the certificate is signed by the CA before returning.
         Raises KeyError if certificate or CA not found.
         Raises ExpiredCertificateError if check_expiry is True and
-        the certificate is expired or not yet valid.
-        """
-        cert = None
-        ca = None
-        for c in self.certs:
-            subject_cn = self._cn(c.subject)
-            issuer_cn = self._cn(c.issuer)
-            if issuer_cn == ca_cn and subject_cn == cert_cn:
-                cert = c
-            if subject_cn == ca_cn:
-                ca = c
-            if cert is not None and ca is not None:
-                break
-
-        if cert is None:
+        no certificate is valid at requested time.
+        Raises RevokedCertificateError if the certificate serial is
+        listed in a CRL loaded for the CA.
+        """
+        indexes = self._indexes((ca_cn, cert_cn))
+        if not indexes:
             raise KeyError((ca_cn, cert_cn))
 
-        if ca is not None:
-            cert.verify_directly_issued_by(ca)
-
-        if self.check_expiry:
-            now = datetime.now(timezone.utc)
-            if now < cert.not_valid_before_utc:
-                raise ExpiredCertificateError(
-                    f"Certificate {cert_cn} not yet valid "
-                    f"(valid from {cert.not_valid_before_utc})")
-            if now > cert.not_valid_after_utc:
+        start, end = _time_range(datetime.now(timezone.utc) if at is None else at)
+        if len(indexes) == 1:
+            index, = indexes
+            entry = index.find(start, end)
+        else:
+            found = [e for e in (i.find(start, end) for i in indexes) if e is not None]
+            entry = max(found, key=lambda e: e.not_before) if found else None
+        if entry is None:
+            if self.check_expiry:
+                first = min(i.starts[0] for i in indexes)
+                if end < first:
+                    raise ExpiredCertificateError(
+                        f"Certificate {cert_cn} not yet valid "
+                        f"(valid from {first})")
+                expired = max(e for e in (i.last_end(end) for i in indexes) if e is not None)
                 raise ExpiredCertificateError(
-                    f"Certificate {cert_cn} expired "
-                    f"(expired {cert.not_valid_after_utc})")
+                    f"Certificate {cert_cn} expired (expired {expired})")
+            entry = max((i.entries[-1] for i in indexes), key=lambda e: e.not_before)
+        cert = entry.cert
+
+        cas = self._issuers(ca_cn)
+        error = None
+        for ca in cas:
+            try:
+                entry.verify_issued_by(ca)
+                break
+            except (ValueError, TypeError, InvalidSignature) as e:
+                error = error or e
+        else:
+            if error is not None:
+                raise error
+
+        if self._is_revoked(ca_cn, cert.serial_number):
+            raise RevokedCertificateError(
+                f"Certificate {cert_cn} revoked by {ca_cn}")
 
         return cert
 
@@ -93,9 +383,11 @@ class KeyChain:
     def der_add(self, der):
         try:
             cert = x509.load_der_x509_certificate(der)
+            entry_cls = CompactCertEntry if self.compact else CertEntry
+            entry = entry_cls.from_cert(cert)
         except (ValueError, Exception):
             return
-        self.certs.append(cert)
+        self.entry_add(entry)
 
     def load_der_blob(self, data):
         """Load a DER blob, auto-detecting multipart vs individual certificate."""
@@ -104,25 +396,123 @@ class KeyChain:
         else:
             self.der_add(data)
 
+    def crl_add(self, data):
+        """
+        Load a CRL (DER or PEM) and index its revoked serial numbers
+        under the issuer common name, replacing any previous CRL of
+        the same issuer. A CRL older than the one already loaded, or
+        whose signature cannot be verified with a loaded issuer
+        certificate, is ignored (issuer certificates must be loaded
+        first). Returns the issuer common name if the index was
+        updated, None otherwise.
+        """
+        try:
+            if data.lstrip().startswith(b"-----BEGIN"):
+                crl = x509.load_pem_x509_crl(data)
+            else:
+                crl = x509.load_der_x509_crl(data)
+        except ValueError:
+            return None
+
+        issuer_cn = self._cn(crl.issuer)
+        # Unverifiable CRLs (issuer not loaded) could revoke anything
+        if not any(_crl_signed_by(crl, c) for c in self._issuers(issuer_cn)):
+            return None
+        revoked = frozenset(r.serial_number for r in crl)
+
+        with self._lock:
+            last_update = crl.last_update_utc
+            previous = self._crl_updates.get(issuer_cn)
+            if previous is not None and last_update < previous:
+                return None
+            self.revoked[issuer_cn] = revoked
+            self._crl_updates[issuer_cn] = last_update
+        return issuer_cn
+
+    def refresh_crls(self, directory):
+        """
+        Load .crl files from a directory (Path or importlib
+        Traversable). Files already loaded are only parsed again if
+        their modification time changed, and each CRL only replaces
+        the revoked set of its own issuer. Returns the list of issuer
+        common names whose revoked set was updated.
+        """
+        updated = []
+        for entry in sorted(directory.iterdir(), key=lambda e: e.name):
+            if not entry.name.endswith('.crl') or not entry.is_file():
+                continue
+            key = str(entry)
+            stamp = entry.stat().st_mtime_ns if hasattr(entry, "stat") else None
+            if stamp is not None and self._crl_sources.get(key) == stamp:
+                continue
+            with entry.open('rb') as f:
+                data = f.read()
+            issuer_cn = self.crl_add(data)
+            if issuer_cn is not None:
+                updated.append(issuer_cn)
+            self._crl_sources[key] = stamp
+        return updated
+
     def load_dir(self, directory):
-        """Load all .der files from a directory (Path or importlib Traversable)."""
+        """
+        Load all .der files from a directory (Path or importlib
+        Traversable), then the .crl files next to them.
+        """
         for entry in sorted(directory.iterdir(), key=lambda e: e.name):
             if not entry.name.endswith('.der') or not entry.is_file():
                 continue
             with entry.open('rb') as f:
                 self.load_der_blob(f.read())
+        self.refresh_crls(directory)
+
+class OverlayKeyChain(KeyChain):
+    """
+    Keychain layered on top of a base keychain. Certificates and CRLs
+    loaded into the overlay stay in the overlay, lookups see both: a
+    lookup probes the overlay index, then the base one, and picks the
+    latest issued certificate among them. CA certificates of either
+    layer can sign certificates of the other, and revoked sets of both
+    layers apply.
+
+    The base is shared, not copied: memory used by an overlay only
+    depends on what is loaded into it, and certificates later added
+    to the base are seen by all overlays. Overlays can be stacked.
+
+    check_expiry and compact default to the settings of the base.
+    """
+    def __init__(self, base, check_expiry=None):
+        super().__init__(check_expiry=base.check_expiry if check_expiry is None else check_expiry,
+                         compact=base.compact)
+        self.base = base
+
+    @property
+    def certs(self):
+        """All certificates, base ones first."""
+        return self.base.certs + super().certs
+
+    def _indexes(self, key):
+        return super()._indexes(key) + self.base._indexes(key)
+
+    def _issuers(self, subject_cn):
+        return self._subjects.get(subject_cn, ()) + self.base._issuers(subject_cn)
+
+    def _is_revoked(self, issuer_cn, serial_number):
+        return (serial_number in self.revoked.get(issuer_cn, ())
+                or self.base._is_revoked(issuer_cn, serial_number))
 
-def internal(include_test=False, check_expiry=True):
+def internal(include_test=False, check_expiry=True, compact=False):
     """
     Spawn a keychain with all built-in certificates loaded,
     then load any user-provisioned certificates from ~/.config/tdd/chains/.
+    CRLs (.crl files) found next to the certificates are loaded as well.
 
     If include_test is True, also load the FR00 test/spec CA certificate.
     If check_expiry is False, skip validity period checks on lookup.
+    If compact is True, only keep minimal verification records.
     """
     from importlib.resources import files
 
-    k = KeyChain(check_expiry=check_expiry)
+    k = KeyChain(check_expiry=check_expiry, compact=compact)
     chains = files('tdd.chains')
 
     for entry in sorted(chains.iterdir(), key=lambda e: e.name):
@@ -132,6 +522,7 @@ def internal(include_test=False, check_expiry=True):
             continue
         with entry.open('rb') as f:
             k.load_der_blob(f.read())
+    k.refresh_crls(chains)
 
     if USER_CHAINS_DIR.is_dir():
         k.load_dir(USER_CHAINS_DIR)
@@ -148,5 +539,5 @@ if __name__ == "__main__":
         for fn in sys.argv[1:]:
             k.load_der_blob(Path(fn).read_bytes())
 
-    for c in k.certs:
-        print(k._cn(c.issuer), k._cn(c.subject))
+    for e in k._entries:
+        print(e.issuer_cn, e.subject_cn)
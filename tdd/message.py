@@ -6,6 +6,12 @@ __doc__ = "Message part"
 GS = '\x1d'
 RS = '\x1e'
 
+def _parse(encoding, text):
+    value = encoding.parse(text)
+    if encoding.interner is not None:
+        value = encoding.interner(value)
+    return value
+
 class Data:
     "A data entry"
     def __init__(self, group, definition, value):
@@ -29,74 +35,241 @@ class Message:
         self.perimeter_id = perimeter_id
         self.dataset = list(dataset)
         
+class LimitExceeded(ValueError):
+    "Input exceeds a parsing limit"
+    pass
+
+class Limits:
+    """
+    Hard limits on untrusted input, checked before the corresponding
+    parsing work: total code length, number of fields of a message,
+    and size of a variable length field (on top of its definition
+    bounds). None disables a limit.
+    """
+    def __init__(self, max_length = 4096, max_fields = 256, max_field_size = 1024):
+        self.max_length = max_length
+        self.max_fields = max_fields
+        self.max_field_size = max_field_size
+
+    def check_length(self, code):
+        if self.max_length is not None and len(code) > self.max_length:
+            raise LimitExceeded(f"Code longer than {self.max_length}")
+
+class _Separators:
+    """
+    Next RS and GS positions of a code, cached so that each part of
+    the code is scanned once whatever the number of fields.
+    """
+    def __init__(self, code):
+        self.code = code
+        self._rs = -1
+        self._gs = -1
+
+    def rs(self, start):
+        if self._rs < start:
+            i = self.code.find(RS, start)
+            self._rs = i if i >= 0 else len(self.code)
+        return self._rs
+
+    def gs(self, start):
+        if self._gs < start:
+            i = self.code.find(GS, start)
+            self._gs = i if i >= 0 else len(self.code)
+        return self._gs
+
+# Character class of a variable field value, from its allowed format
+_CLASS_FORMAT = re.compile(r"\[[^\]\\]*\]\*")
+
+class Layout:
+    """
+    Compiled parser of a message made of a known sequence of fields,
+    in order, each present once.
+
+    The whole sequence is matched by one regular expression built from
+    field definitions: fixed fields as their exact size, variable ones
+    as their allowed characters up to their maximum size, each
+    optionally followed by a GS. Matches are those the generic parser
+    would make. Messages holding an RS, or that diverge from the
+    layout, are not matched.
+    """
+    def __init__(self, perimeter_id, ids):
+        self.perimeter_id = perimeter_id
+        self.ids = tuple(ids)
+        self.fields = []
+        self.max_field_size = 0
+        parts = []
+        for n, id in enumerate(self.ids, 1):
+            group, definition = data_definition.c40.datatype_get(perimeter_id, id)
+            self.fields.append((group, definition))
+            if definition.fixed is not None:
+                parts.append(f"{re.escape(id)}(.{{{definition.fixed}}})\x1d?")
+                continue
+            size_max = definition.encoding.size_max
+            if size_max is None:
+                self.max_field_size = None
+            elif self.max_field_size is not None:
+                self.max_field_size = max(self.max_field_size, size_max)
+            allowed = getattr(definition.encoding, "allowed_format", None)
+            if allowed is None:
+                chars = "[^\x1d\x1e]"
+            elif allowed.pattern == ".*":
+                chars = "[^\x1d\x1e\n]"
+            elif _CLASS_FORMAT.fullmatch(allowed.pattern):
+                chars = allowed.pattern[:-1]
+            else:
+                raise ValueError(f"Field {id} format cannot be compiled in a layout")
+            count = "*" if size_max is None else f"{{0,{size_max}}}"
+            # Lookahead and backreference make the value match atomic,
+            # as greedy as the generic parser
+            parts.append(f"{re.escape(id)}(?=({chars}{count}))\\{n}\x1d?")
+        self.pattern = re.compile("".join(parts) + "\\Z", re.DOTALL)
+
+    def parse(self, code, limits):
+        """
+        Dataset of code, or None if code does not follow the layout or
+        the generic parser should apply limits.
+        """
+        if limits.max_fields is not None and len(self.fields) > limits.max_fields:
+            return None
+        if limits.max_field_size is not None and (self.max_field_size is None
+                                                  or self.max_field_size > limits.max_field_size):
+            return None
+        if RS in code:
+            return None
+        m = self.pattern.match(code)
+        if m is None:
+            return None
+        return [FixedData(group, definition, _parse(definition.encoding, value))
+                for (group, definition), value in zip(self.fields, m.groups())]
+
 class C40Message(Message):
-    "A C40 message"
+    """
+    A C40 message
+
+    Parsing walks the code by offset, without re-slicing the remaining
+    message per field, so that it runs in linear time. `limits`
+    (a Limits) applies when from_code() is not given any.
+
+    Layouts registered with layout_add() are tried first, the generic
+    parser is used when none matches.
+    """
+    limits = Limits()
+    layouts = {}
+
     def encode(self, max_length = None):
         raise NotImplementedError()
 
     @classmethod
-    def from_code(cls, perimeter_id, code):
+    def from_code(cls, perimeter_id, code, limits = None):
         """
         Load a message from a C40 code string, for a given perimeter ID.
+        Raises LimitExceeded if code is over limits.
         """
+        limits = limits or cls.limits
+        limits.check_length(code)
+        for layout in cls.layouts.get((perimeter_id, code[:2]), ()):
+            dataset = layout.parse(code, limits)
+            if dataset is not None:
+                return cls(perimeter_id, dataset)
+        max_fields = limits.max_fields
         self = cls(perimeter_id, [])
-        while code:
-            data, code = self.code_extract(code)
+        separators = _Separators(code)
+        pos = 0
+        while pos < len(code):
+            if max_fields is not None and len(self.dataset) >= max_fields:
+                raise LimitExceeded(f"More than {max_fields} fields")
+            data, pos = self._extract(code, pos, separators, limits.max_field_size)
             self.dataset.append(data)
         return self
 
+    @classmethod
+    def layout_add(cls, perimeter_id, ids):
+        """
+        Compile and register a Layout for a sequence of field ids of a
+        perimeter. Returns the layout.
+        """
+        layout = Layout(perimeter_id, ids)
+        key = (perimeter_id, layout.ids[0])
+        cls.layouts[key] = cls.layouts.get(key, ()) + (layout,)
+        return layout
+
+    @classmethod
+    def layout_remove(cls, layout):
+        key = (layout.perimeter_id, layout.ids[0])
+        remaining = tuple(l for l in cls.layouts.get(key, ()) if l is not layout)
+        if remaining:
+            cls.layouts[key] = remaining
+        else:
+            cls.layouts.pop(key, None)
+
+    @staticmethod
+    def _fixed(group, definition, code, pos):
+        start = pos + 2
+        end = start + definition.fixed
+        value = _parse(definition.encoding, code[start:end])
+        if code[end:end + 1] == GS:
+            end += 1
+        return FixedData(group, definition, value), end
+
+    @staticmethod
+    def _variable(group, definition, code, pos, separators, max_field_size = None):
+        start = pos + 2
+        encoding = definition.encoding
+        end = len(code)
+        if encoding.size_max is not None:
+            end = min(end, start + encoding.size_max)
+
+        # Not found separators are at len(code)
+        data_end = separators.rs(start)
+        if data_end >= end:
+            data_end = min(end, separators.gs(start))
+
+        if max_field_size is not None and data_end - start > max_field_size:
+            raise LimitExceeded(f"Field {definition.id} longer than {max_field_size}")
+
+        allowed_format = getattr(encoding, "allowed_format", None)
+        if allowed_format is not None:
+            m = allowed_format.match(code, start, data_end)
+            if m is None:
+                raise ValueError(f"Field {definition.id} does not match its format")
+            value_end = m.end()
+        else:
+            value_end = data_end
+
+        data = FixedData(group, definition, _parse(encoding, code[start:value_end]))
+        if code[value_end:value_end + 1] in (RS, GS):
+            value_end += 1
+        return data, value_end
+
+    def _extract(self, code, pos, separators, max_field_size = None):
+        group, definition = data_definition.c40.datatype_get(self.perimeter_id, code[pos:pos + 2])
+        if definition.fixed is not None:
+            return self._fixed(group, definition, code, pos)
+        return self._variable(group, definition, code, pos, separators, max_field_size)
+
     @classmethod
     def fixed_parse(cls, group, definition, code):
         """
         Parse a fixed size data item in the stream
         """
-        value = definition.encoding.parse(code[2:2 + definition.fixed])
-        data = FixedData(group, definition, value)
-        if code[2 + definition.fixed : 2 + definition.fixed + 1] == GS:
-            return data, code[2 + definition.fixed + 1 : ]
-        return data, code[2 + definition.fixed : ]
+        data, pos = cls._fixed(group, definition, code, 0)
+        return data, code[pos:]
 
     @classmethod
     def variable_parse(cls, group, definition, code):
         """
         Parse a variable size data item in the stream
         """
-        end_index = definition.encoding.size_max + 2 \
-            if definition.encoding.size_max is not None \
-            else len(code)
-
-        try:
-            data_end = code.index(RS, 2, end_index)
-            complete = False
-        except:
-            complete = True
-            try:
-                data_end = code.index(GS, 2, end_index)
-            except:
-                data_end = end_index
-
-        if hasattr(definition.encoding, "allowed_format"):
-            value = re.match(r'^(' + definition.encoding.allowed_format.pattern + r')', code[2:data_end]).group(1)
-        else:
-            value = code[2:data_end]
-
-        parsed = definition.encoding.parse(value)
-        data = FixedData(group, definition, parsed)
-        try:
-            next_data = code[2 + len(value)]
-        except:
-            return data, ""
-        if next_data in [RS, GS]:
-            return data, code[2 + len(value) + 1:]
-        else:
-            return data, code[2 + len(value):]
+        data, pos = cls._variable(group, definition, code, 0, _Separators(code))
+        return data, code[pos:]
 
     def code_extract(self, code):
         """
         Parse next data item in the stream
         """
-        group, definition = data_definition.c40.datatype_get(self.perimeter_id, code[:2])
-        if definition.fixed is not None:
-            return self.fixed_parse(group, definition, code)
-        return self.variable_parse(group, definition, code)
+        data, pos = self._extract(code, 0, _Separators(code))
+        return data, code[pos:]
 
+# Vaccination certificates (L1) and test results (B2)
+C40Message.layout_add(1, ("L0", "L1", "L2", "L3", "L4", "L5", "L6", "L7", "L8", "L9", "LA"))
+C40Message.layout_add(1, ("F0", "F1", "F2", "F3", "F4", "F5", "F6"))
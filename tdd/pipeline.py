@@ -0,0 +1,197 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import threading
+import types
+from .doc import TwoDDoc
+from .stream import frame
+from .verify import Result
+
+__doc__ = """
+Composable streaming pipelines.
+
+A pipeline chains generator stages over a source iterable. Inline
+stages (the default) run in whichever thread pulls from them, as plain
+generator composition: that suits parsing, which holds the GIL anyway. Stages
+given `workers` run in a thread pool fed by a thread of their own,
+which suits signature checking (`cryptography` releases the GIL).
+
+Between a threaded stage and its consumer sits a bounded queue of
+pending items, kept in input order. When the consumer (ultimately the
+sink) is slow, the queue fills, the feeding thread blocks, and the
+upstream stages stop being pulled: memory use stays bounded whatever
+the source size.
+
+  >>> p = Pipeline(open("codes.txt")).map(str.strip).filter(None)
+  >>> for r in verification(p, keychain, workers = 4):
+  ...     ...
+  >>> archive.append(verification(frame(chunks), keychain))
+"""
+__all__ = ["Pipeline", "parse", "checker", "verification"]
+
+MAXSIZE = 64
+
+_END = object()
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+def _threaded(items, fn, workers, maxsize, flat):
+    """
+    Generator applying fn to items in a thread pool, yielding results
+    in input order, with at most maxsize results pending.
+    """
+    if flat:
+        # Run generators in the pool too, not in the consumer
+        fn = lambda item, fn = fn: list(fn(item))
+    pending = queue.Queue(maxsize)
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers = workers)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def feed():
+        try:
+            for item in items:
+                if stop.is_set() or not put(pool.submit(fn, item)):
+                    break
+            else:
+                put(_END)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            # Stop upstream threaded stages as well
+            if isinstance(items, types.GeneratorType):
+                items.close()
+
+    feeder = threading.Thread(target = feed, daemon = True)
+    feeder.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            if flat:
+                yield from item.result()
+            else:
+                yield item.result()
+    finally:
+        stop.set()
+        pool.shutdown(wait = False, cancel_futures = True)
+
+class Pipeline:
+    """
+    Chain of stages over a source iterable. Each stage method returns
+    a new pipeline; nothing runs until the pipeline is iterated (or
+    run()). A pipeline is iterated once.
+
+    Stage methods take `workers`: 0 (default) runs the stage inline,
+    a positive count runs it in that many threads with at most
+    `maxsize` (defaults to the pipeline's) results pending, in input
+    order. Exceptions raised by a stage propagate to the consumer.
+    """
+    def __init__(self, source, maxsize = MAXSIZE):
+        self._items = source
+        self.maxsize = maxsize
+
+    def _chain(self, items):
+        return Pipeline(items, self.maxsize)
+
+    def _stage(self, fn, workers, maxsize, flat):
+        if not workers:
+            if flat:
+                return self._chain(y for x in self._items for y in fn(x))
+            return self._chain(map(fn, self._items))
+        return self._chain(_threaded(iter(self._items), fn, workers,
+                                     maxsize or self.maxsize, flat))
+
+    def map(self, fn, workers = 0, maxsize = None):
+        "Replace each item by fn(item)"
+        return self._stage(fn, workers, maxsize, False)
+
+    def flat_map(self, fn, workers = 0, maxsize = None):
+        "Replace each item by the items of the iterable fn(item)"
+        return self._stage(fn, workers, maxsize, True)
+
+    def filter(self, predicate):
+        "Keep items for which predicate is true (truthy items if None)"
+        return self._chain(filter(predicate, self._items))
+
+    def each(self, fn, workers = 0, maxsize = None):
+        "Call fn on each item (a side effect, as a sink) and pass it through"
+        def tap(item):
+            fn(item)
+            return item
+        return self._stage(tap, workers, maxsize, False)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def run(self, sink = None):
+        """
+        Consume the pipeline, calling sink (if given) on each item.
+        Returns the number of items.
+        """
+        count = 0
+        for item in self:
+            if sink is not None:
+                sink(item)
+            count += 1
+        return count
+
+    @classmethod
+    def from_chunks(cls, chunks, on_header = None, maxsize = MAXSIZE):
+        "Pipeline of codes framed out of byte chunks (see tdd.stream)"
+        return cls(frame(chunks, on_header = on_header), maxsize)
+
+def parse(code):
+    """
+    Parsing stage: Result holding the document, or the parsing error,
+    with the signature not checked yet.
+    """
+    try:
+        return Result(code, TwoDDoc.from_code(code))
+    except Exception as e:
+        return Result(code, error = e)
+
+def checker(keychain, historical = False):
+    """
+    Signature checking stage for parse() results. If historical is
+    True, certificate validity is checked at document sign date.
+    """
+    def check(result):
+        if result.doc is None or result.error is not None:
+            return result
+        doc = result.doc
+        try:
+            at = doc.header.sign_date if historical else None
+            result.valid = doc.signature_is_valid(keychain, at = at)
+        except Exception as e:
+            result.error = e
+        return result
+    return check
+
+def verification(codes, keychain, workers = None, header_filter = None,
+                 historical = False, maxsize = MAXSIZE):
+    """
+    Pipeline of verification Results of codes, in input order: header
+    prefiltering (a tdd.filter.HeaderFilter) and parsing inline,
+    signature checking in `workers` threads.
+    """
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) + 4)
+    p = codes if isinstance(codes, Pipeline) else Pipeline(codes, maxsize)
+    if header_filter is not None:
+        p = p.filter(header_filter.matches_code)
+    return p.map(parse).map(checker(keychain, historical), workers = workers,
+                            maxsize = maxsize)
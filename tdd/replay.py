@@ -0,0 +1,209 @@
+from collections import OrderedDict
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+__doc__ = """
+Detection of documents presented several times.
+
+Documents are keyed on the SHA-256 of their signature (the same
+attestation shown twice) or of their signed data (same content, even
+if signed again). Two tiers remember keys:
+
+* an exact tier, an insertion ordered map of the most recent keys,
+  bounded in size and in age,
+* a Bloom filter tier covering a long time window, split into
+  generations that are recycled as time passes. It answers "probably
+  seen" with a configurable false positive rate, and never misses a
+  key seen within the window.
+
+The Bloom tier lives in a memory-mapped file when a path is given, so
+that it survives restarts. The exact tier is held in memory only:
+after a restart, replays of older documents are reported as probable.
+
+  >>> detector = ReplayDetector(window = 30 * 86400, path = "replay.bin")
+  >>> detector.check(doc)
+  >>> detector.check(doc)
+  'exact'
+"""
+__all__ = ["ReplayDetector", "EXACT", "PROBABLE"]
+
+EXACT = "exact"
+PROBABLE = "probable"
+
+MAGIC = b"TDDR"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHIQd")
+SLOT = struct.Struct("<q")
+
+class ReplayDetector:
+    """
+    Replay detector.
+
+    `window` (seconds) is how long the Bloom tier remembers keys, at
+    least. It is split in `generations` time slots, the oldest one is
+    cleared when a new slot starts. `capacity` is the expected number
+    of keys per slot, `error_rate` the target false positive rate of
+    one slot.
+
+    `exact_size` and `exact_window` (seconds, defaults to `window`)
+    bound the exact tier.
+
+    `key` selects what identifies a document: "signature" or
+    "signed_data".
+
+    With a `path`, the Bloom tier is stored in that file, created if
+    missing. An existing file must have been created with the same
+    window, generations, capacity and error rate.
+    """
+    def __init__(self, window = 86400.0, generations = 8, capacity = 100000,
+                 error_rate = 1e-4, exact_size = 100000, exact_window = None,
+                 key = "signature", path = None):
+        if generations < 2:
+            raise ValueError("At least two generations are needed")
+        if key not in ("signature", "signed_data"):
+            raise ValueError(f"Unknown key {key!r}")
+        self.key = key
+        self.window = float(window)
+        self.generations = generations
+        self.span = self.window / (generations - 1)
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.bits = (bits + 7) // 8 * 8
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.exact_size = exact_size
+        self.exact_window = self.window if exact_window is None else float(exact_window)
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._exact = OrderedDict()
+        self._fd = None
+        self._map_open(path)
+
+    def _map_open(self, path):
+        gen_bytes = self.bits // 8
+        self._slots = HEADER.size
+        self._data = self._slots + self.generations * SLOT.size
+        size = self._data + self.generations * gen_bytes
+        header = HEADER.pack(MAGIC, VERSION, self.generations, self.hashes,
+                             self.bits, self.span)
+
+        if path is None:
+            self._map = mmap.mmap(-1, size)
+            fresh = True
+        else:
+            self._fd = open(path, "a+b")
+            existing = os.fstat(self._fd.fileno()).st_size
+            fresh = existing == 0
+            if fresh:
+                self._fd.truncate(size)
+            elif existing != size:
+                self._fd.close()
+                raise ValueError("Replay file does not match detector parameters")
+            self._map = mmap.mmap(self._fd.fileno(), size)
+
+        if fresh:
+            self._map[:HEADER.size] = header
+            for g in range(self.generations):
+                SLOT.pack_into(self._map, self._slots + g * SLOT.size, -1)
+        elif self._map[:HEADER.size] != header:
+            self.close()
+            raise ValueError("Replay file does not match detector parameters")
+
+    def close(self):
+        if self._map is not None:
+            if self._fd is not None:
+                self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def digest(self, doc):
+        """
+        Key of a document. Raises ValueError if the key is signed_data
+        and the document was restored without it (e.g. from an
+        archive, or from tdd.wire with signed_data = False).
+        """
+        data = doc.signature if self.key == "signature" else doc.signed_data
+        if data is None:
+            raise ValueError(f"Document has no {self.key} to key replays on")
+        return hashlib.sha256(data).digest()
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def _bloom_check_add(self, positions, now, add):
+        m = self._map
+        gen_bytes = self.bits // 8
+        current = int(now // self.span)
+        found = False
+        for g in range(self.generations):
+            slot, = SLOT.unpack_from(m, self._slots + g * SLOT.size)
+            if current - self.generations < slot <= current:
+                base = self._data + g * gen_bytes
+                if all(m[base + (p >> 3)] & (1 << (p & 7)) for p in positions):
+                    found = True
+                    break
+        if add:
+            g = current % self.generations
+            off = self._slots + g * SLOT.size
+            base = self._data + g * gen_bytes
+            if SLOT.unpack_from(m, off)[0] != current:
+                m[base:base + gen_bytes] = bytes(gen_bytes)
+                SLOT.pack_into(m, off, current)
+            for p in positions:
+                m[base + (p >> 3)] |= 1 << (p & 7)
+        return found
+
+    def check_digest(self, digest, now = None, add = True):
+        """
+        Check a key, and remember it unless `add` is False. Returns
+        None for a new key, EXACT or PROBABLE for a replay.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            exact = self._exact
+            horizon = now - self.exact_window
+            while exact:
+                oldest = next(iter(exact))
+                if exact[oldest] >= horizon:
+                    break
+                del exact[oldest]
+
+            probable = self._bloom_check_add(self._positions(digest), now, add)
+            if digest in exact:
+                result = EXACT
+            elif probable:
+                result = PROBABLE
+            else:
+                result = None
+            if add:
+                exact[digest] = now
+                exact.move_to_end(digest)
+                if len(exact) > self.exact_size:
+                    exact.popitem(last = False)
+            return result
+
+    def check(self, doc, now = None, add = True):
+        """
+        Check a document (TwoDDoc, or anything with signature and
+        signed_data attributes). `now` is a POSIX timestamp, defaults
+        to the current time.
+        """
+        return self.check_digest(self.digest(doc), now, add)
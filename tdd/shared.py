@@ -0,0 +1,180 @@
+from cryptography.hazmat.primitives.serialization import Encoding
+from datetime import datetime, timedelta, timezone
+from multiprocessing import shared_memory
+import struct
+import sys
+from .keychain import KeyChain, LazyCertEntry, OverlayKeyChain
+
+__doc__ = """
+Keychain shared between processes.
+
+A parent process publishes its keychain index and the DER encoding of
+every certificate into a shared memory segment once. Worker processes
+(forked or spawned) attach to the segment by name: they only decode
+the small index, and parse certificates lazily, when a lookup actually
+needs them.
+
+  >>> segment = publish(internal())               # parent
+  >>> keychain = SharedKeyChain.attach(segment.name)  # workers
+
+Segment layout (little endian):
+
+* header: magic, format version, check_expiry flag, entry count,
+  revoked issuer count,
+* per entry: validity window (epoch microseconds), DER offset and
+  length, issuer and subject common names,
+* per revoked issuer: CRL last update (epoch microseconds, -1 if
+  unknown), issuer common name, serial count, then length-prefixed
+  big-endian serials,
+* DER blobs.
+"""
+__all__ = ["SharedKeyChain", "publish"]
+
+MAGIC = b"TDDK"
+VERSION = 2
+
+HEADER = struct.Struct("<4sBBxxII")
+ENTRY = struct.Struct("<qqIIHH")
+ISSUER = struct.Struct("<qHI")
+
+EPOCH = datetime(1970, 1, 1, tzinfo = timezone.utc)
+
+def _us(dt):
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def _dt(us):
+    return EPOCH + timedelta(microseconds = us)
+
+def _serialize(keychain):
+    if keychain.compact:
+        raise ValueError("Compact keychains keep no DER material to share")
+    if isinstance(keychain, OverlayKeyChain):
+        raise ValueError("Publish the base keychain, and overlay it in workers")
+    index = bytearray()
+    blobs = bytearray()
+    entries = keychain._entries
+
+    for e in entries:
+        der = e.cert.public_bytes(Encoding.DER)
+        issuer = (e.issuer_cn or "").encode("utf-8")
+        subject = (e.subject_cn or "").encode("utf-8")
+        index += ENTRY.pack(_us(e.not_before), _us(e.not_after),
+                            len(blobs), len(der), len(issuer), len(subject))
+        index += issuer + subject
+        blobs += der
+
+    revoked = dict(keychain.revoked)
+    for issuer_cn, serials in revoked.items():
+        issuer = (issuer_cn or "").encode("utf-8")
+        last_update = keychain._crl_updates.get(issuer_cn)
+        index += ISSUER.pack(-1 if last_update is None else _us(last_update),
+                             len(issuer), len(serials)) + issuer
+        for serial in serials:
+            raw = serial.to_bytes((serial.bit_length() + 7) // 8 or 1, "big")
+            index += bytes([len(raw)]) + raw
+
+    header = HEADER.pack(MAGIC, VERSION, keychain.check_expiry,
+                         len(entries), len(revoked))
+    return header + index, blobs
+
+def publish(keychain, name = None):
+    """
+    Copy keychain index and certificates into a new shared memory
+    segment. The caller owns the returned SharedMemory object: it
+    must close() and unlink() it when workers are done.
+    """
+    index, blobs = _serialize(keychain)
+    size = len(index) + len(blobs)
+    segment = shared_memory.SharedMemory(name = name, create = True, size = size)
+    segment.buf[:len(index)] = index
+    segment.buf[len(index):size] = blobs
+    return segment
+
+def _open(name):
+    """
+    Attach to an existing segment without letting this process'
+    resource tracker unlink it on exit, which is the owner's job.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name = name, track = False)
+    segment = shared_memory.SharedMemory(name = name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment
+
+class SharedKeyChain(KeyChain):
+    """
+    Keychain backed by a shared memory segment built by publish().
+    Certificates are parsed on first use only. Certificates added
+    locally with der_add() stay private to the process.
+    """
+    def __init__(self, segment, check_expiry = True):
+        super().__init__(check_expiry = check_expiry)
+        self.segment = segment
+        self.closed = False
+
+    @classmethod
+    def attach(cls, name, check_expiry = None):
+        """
+        Attach to a published segment. check_expiry defaults to the
+        setting of the published keychain.
+        """
+        segment = _open(name)
+        buf = segment.buf
+        magic, version, published_expiry, count, issuers = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            segment.close()
+            raise ValueError("Not a shared keychain segment")
+
+        self = cls(segment, published_expiry if check_expiry is None else check_expiry)
+
+        offset = HEADER.size
+        records = []
+        for _ in range(count):
+            nb, na, der_off, der_len, il, sl = ENTRY.unpack_from(buf, offset)
+            offset += ENTRY.size
+            issuer = bytes(buf[offset:offset + il]).decode("utf-8")
+            offset += il
+            subject = bytes(buf[offset:offset + sl]).decode("utf-8")
+            offset += sl
+            records.append((issuer or None, subject or None, _dt(nb), _dt(na), der_off, der_len))
+
+        for _ in range(issuers):
+            last_update, il, n = ISSUER.unpack_from(buf, offset)
+            offset += ISSUER.size
+            issuer = bytes(buf[offset:offset + il]).decode("utf-8") or None
+            offset += il
+            serials = []
+            for _ in range(n):
+                sl = buf[offset]
+                serials.append(int.from_bytes(buf[offset + 1:offset + 1 + sl], "big"))
+                offset += 1 + sl
+            self.revoked[issuer] = frozenset(serials)
+            if last_update >= 0:
+                self._crl_updates[issuer] = _dt(last_update)
+
+        for issuer, subject, nb, na, der_off, der_len in records:
+            der = buf[offset + der_off:offset + der_off + der_len]
+            self.entry_add(LazyCertEntry(issuer, subject, nb, na, der))
+
+        return self
+
+    def lookup(self, ca_cn, cert_cn, at = None):
+        if self.closed:
+            raise ValueError("Shared keychain is closed")
+        return super().lookup(ca_cn, cert_cn, at)
+
+    def close(self):
+        """
+        Detach from the segment. Lookups raise ValueError afterwards.
+        """
+        self.closed = True
+        for e in self._entries:
+            if isinstance(e, LazyCertEntry) and isinstance(e.der, memoryview):
+                e.der.release()
+                e.der = None
+        self.segment.close()
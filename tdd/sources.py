@@ -0,0 +1,195 @@
+import bz2
+import gzip
+import lzma
+import os
+from pathlib import Path
+import queue
+import threading
+
+__doc__ = """
+Streaming readers of code archives: newline-delimited code files,
+plain or compressed (gzip, xz, bzip2, zstd), and directories of them.
+
+Decompression runs in a background thread, a few chunks ahead of the
+consumer through a bounded queue, so it overlaps with parsing (zlib,
+lzma and bz2 release the GIL while decompressing) and memory stays
+constant whatever the archive size. Reading zstd files needs the
+zstandard package (pip install tdd[zstd]).
+
+  >>> for path, line, code in read_codes(["archives/2024/", "extra.txt.gz"]):
+  ...     ...
+
+  $ python -m tdd.dump --lines --test-ca archives/
+"""
+__all__ = ["open_archive", "read_lines", "read_codes", "archive_files"]
+
+CHUNK_SIZE = 1 << 20
+DEPTH = 4
+
+# Longest line kept, longer ones cannot be codes
+MAX_LENGTH = 4096
+
+SUFFIXES = (".txt", ".gz", ".xz", ".lzma", ".bz2", ".zst")
+
+_MAGIC = (
+    (b"\x1f\x8b", "gz"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"BZh", "bz2"),
+    (b"\x28\xb5\x2f\xfd", "zst"),
+)
+
+def _compression(path):
+    with open(path, "rb") as f:
+        head = f.read(6)
+    for magic, kind in _MAGIC:
+        if head.startswith(magic):
+            return kind
+    if Path(path).suffix == ".lzma":
+        return "lzma"
+    return None
+
+def open_archive(path):
+    """
+    Open a code archive for binary reading, decompressing it if its
+    content is gzip, xz, bzip2 or zstd compressed (legacy .lzma files
+    are recognized by suffix).
+    """
+    kind = _compression(path)
+    if kind == "gz":
+        return gzip.open(path, "rb")
+    if kind in ("xz", "lzma"):
+        return lzma.open(path, "rb")
+    if kind == "bz2":
+        return bz2.open(path, "rb")
+    if kind == "zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"{path}: reading zstd archives needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames = True, closefd = True)
+    return open(path, "rb")
+
+def _chunks(fd, chunk_size, depth):
+    """
+    Yield chunks read from fd by a background thread, at most depth
+    chunks ahead.
+    """
+    chunks = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout = 0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read():
+        try:
+            while not stop.is_set():
+                data = fd.read(chunk_size)
+                if not data:
+                    break
+                put(data)
+            put(None)
+        except BaseException as e:
+            put(e)
+
+    reader = threading.Thread(target = read, daemon = True)
+    reader.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+def _code(path, number, line, on_error):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return line.decode("ascii")
+    except UnicodeDecodeError:
+        if on_error is not None:
+            on_error(path, number, "not an ASCII line")
+        return None
+
+def read_lines(path, chunk_size = CHUNK_SIZE, depth = DEPTH,
+               max_length = MAX_LENGTH, on_error = None):
+    """
+    Yield (line number, code) of the non-empty lines of an archive,
+    decompressed in a background thread.
+
+    Lines longer than max_length and lines that are not ASCII are
+    skipped, and reported to on_error(path, line number, message) if
+    given.
+    """
+    with open_archive(path) as fd:
+        number = 0
+        # Start of the current line, never longer than max_length
+        rest = b""
+        skipping = False
+        for data in _chunks(fd, chunk_size, depth):
+            parts = data.split(b"\n")
+            for i, part in enumerate(parts):
+                if i:
+                    number += 1
+                    if skipping:
+                        if on_error is not None:
+                            on_error(path, number, f"line longer than {max_length}")
+                    else:
+                        code = _code(path, number, rest, on_error)
+                        if code is not None:
+                            yield number, code
+                    rest = b""
+                    skipping = False
+                if skipping:
+                    continue
+                if len(rest) + len(part) > max_length:
+                    rest = b""
+                    skipping = True
+                else:
+                    rest += part
+        number += 1
+        if skipping:
+            if on_error is not None:
+                on_error(path, number, f"line longer than {max_length}")
+        else:
+            code = _code(path, number, rest, on_error)
+            if code is not None:
+                yield number, code
+
+def archive_files(inputs):
+    """
+    Expand files and directories into archive paths. Directories are
+    walked recursively, in sorted order, for files with an archive
+    suffix.
+    """
+    for p in inputs:
+        p = Path(p)
+        if not p.is_dir():
+            yield p
+            continue
+        for root, dirs, files in os.walk(p):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(SUFFIXES):
+                    yield Path(root) / name
+
+def read_codes(inputs, chunk_size = CHUNK_SIZE, depth = DEPTH,
+               max_length = MAX_LENGTH, on_error = None):
+    """
+    Yield (path, line number, code) of all archives of inputs. Bad
+    lines are handled as by read_lines().
+    """
+    for path in archive_files(inputs):
+        for number, code in read_lines(path, chunk_size, depth, max_length, on_error):
+            yield path, number, code
@@ -0,0 +1,273 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import re
+import threading
+import time
+from .header import Header, _c40_lengths
+
+__doc__ = """
+Framing of 2D-Doc codes out of scanner byte streams.
+
+Barcode scanners (HID, serial) deliver codes as a continuous byte
+stream, with terminators between codes and reads split anywhere.
+Framer picks C40 codes out of it: a code starts with "DC", its message
+ends at the \\x1f separator, and its base32 signature ends at the first
+byte that is not base32 (usually a CR/LF terminator).
+
+The header is parsed as soon as its bytes are in, and handed to an
+optional `on_header` callback, so that the certificate lookup can run
+in the background while the rest of the code is still arriving. The
+Prefetcher caches the looked up certificates, and stands in for the
+keychain at verification:
+
+  >>> chain = prefetch(keychain)
+  >>> framer = Framer(on_header = chain)
+  >>> for code in framer.feed(data):
+  ...     TwoDDoc.from_code(code).signature_is_valid(chain)
+
+  >>> async for code in read_codes(reader, on_header = chain):
+  ...     TwoDDoc.from_code(code).signature_is_valid(chain)
+"""
+__all__ = ["Framer", "Prefetcher", "frame", "read_codes", "prefetch"]
+
+# Longest code accepted before resynchronizing on the next "DC"
+MAX_LENGTH = 4096
+
+# Unpadded base32 lengths of P-256, P-384 and P-521 signatures
+SIGNATURE_LENGTHS = (103, 154, 212)
+
+_SEEK, _HEADER, _MESSAGE, _SIGNATURE = range(4)
+
+# Bytes that end a message: separator, or terminators of a truncated scan
+_message_end = re.compile(rb"[\x00\x04\n\r\x1f]")
+_signature_end = re.compile(rb"[^A-Z2-7]")
+
+class Framer:
+    """
+    Incremental code framer. feed() takes bytes as they are read and
+    returns the codes completed by them, as strings suitable for
+    TwoDDoc.from_code. Garbage between codes, truncated codes and
+    unsupported headers are skipped.
+
+    `on_header` is called with the parsed Header of each code before
+    its message and signature are complete. Its return value is
+    kept, when not None, until collected with pending().
+    """
+    def __init__(self, on_header = None, max_length = MAX_LENGTH):
+        self.on_header = on_header
+        self.max_length = max_length
+        self._buf = bytearray()
+        self._state = _SEEK
+        self._pos = 0
+        self._sig_start = 0
+        self._pending = []
+        self._codes = []
+
+    def _reset(self, drop):
+        del self._buf[:drop]
+        self._state = _SEEK
+        self._pos = 0
+
+    def _header(self, header):
+        if self.on_header is not None:
+            r = self.on_header(header)
+            if r is not None:
+                self._pending.append(r)
+
+    def _advance(self):
+        buf = self._buf
+        while True:
+            if self._state == _SEEK:
+                start = buf.find(b"DC")
+                if start < 0:
+                    # Keep a trailing "D", it may start the next code
+                    del buf[:len(buf) - 1 if buf.endswith(b"D") else len(buf)]
+                    return
+                del buf[:start]
+                self._state = _HEADER
+
+            if self._state == _HEADER:
+                if len(buf) < 4:
+                    return
+                length = _c40_lengths.get(buf[2:4].decode("latin-1"))
+                if length is None:
+                    self._reset(1)
+                    continue
+                if len(buf) < length:
+                    return
+                try:
+                    header = Header.from_code(buf[:length].decode("ascii"))
+                except (ValueError, UnicodeDecodeError):
+                    self._reset(1)
+                    continue
+                self._pos = length
+                self._state = _MESSAGE
+                self._header(header)
+
+            if self._state == _MESSAGE:
+                m = _message_end.search(buf, self._pos)
+                if m is None:
+                    self._pos = len(buf)
+                    if len(buf) > self.max_length:
+                        self._reset(1)
+                        continue
+                    return
+                if buf[m.start()] != 0x1f:
+                    self._reset(m.start())
+                    continue
+                self._sig_start = self._pos = m.end()
+                self._state = _SIGNATURE
+
+            if self._state == _SIGNATURE:
+                limit = self._sig_start + SIGNATURE_LENGTHS[-1] + 2
+                m = _signature_end.search(buf, self._pos, limit + 1)
+                if m is None:
+                    if len(buf) > limit:
+                        # Longer than any signature
+                        self._reset(1)
+                        continue
+                    self._pos = len(buf)
+                    return
+                end = m.start()
+                # Without terminator, the signature runs into the "DC"
+                # of the next code, up to its version digits
+                for length in SIGNATURE_LENGTHS:
+                    cut = self._sig_start + length
+                    if end == cut + 2 and buf[cut:end] == b"DC":
+                        end = cut
+                        break
+                if end - self._sig_start > SIGNATURE_LENGTHS[-1]:
+                    self._reset(end)
+                    continue
+                self._emit(end)
+
+    def _emit(self, end):
+        if end > self._sig_start:
+            self._codes.append(self._buf[:end].decode("latin-1"))
+        self._reset(end)
+
+    def feed(self, data):
+        "Append bytes read from the stream, return the completed codes"
+        self._codes = []
+        self._buf += data
+        self._advance()
+        return self._codes
+
+    def close(self):
+        """
+        End of stream: return the last code if only its terminator is
+        missing. The framer is reset.
+        """
+        self._codes = []
+        if self._state == _SIGNATURE:
+            self._emit(len(self._buf))
+        self._buf.clear()
+        self._reset(0)
+        return self._codes
+
+    def pending(self):
+        "Return and forget on_header return values collected so far"
+        pending, self._pending = self._pending, []
+        return pending
+
+class Prefetcher:
+    """
+    on_header callback looking up the signing certificate of each code
+    in a background thread, ahead of verification.
+
+    Lookups are cached by (CA, certificate, at) for `ttl` seconds, up
+    to `max_size` entries. The prefetcher has the keychain lookup()
+    method: pass it in place of the keychain to verification, which
+    then gets the prefetched certificate, or the lookup error.
+
+    Certificates are prefetched for `at` (defaults to now), which also
+    applies to lookups not given one. If historical is True, they are
+    prefetched at the sign date of each document instead: verification
+    must then pass that date too, as signature_is_valid(chain, at =
+    doc.header.sign_date) does.
+    """
+    def __init__(self, keychain, at = None, historical = False, ttl = 60.0,
+                 max_size = 1024, executor = None):
+        self.keychain = keychain
+        self.at = at
+        self.historical = historical
+        self.ttl = ttl
+        self.max_size = max_size
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers = 2)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def _future(self, ca_cn, cert_cn, at):
+        if at is None:
+            at = self.at
+        key = (ca_cn, cert_cn, at)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._cache.move_to_end(key)
+                return entry[1]
+            future = self.executor.submit(self.keychain.lookup, ca_cn, cert_cn, at = at)
+            self._cache[key] = (now, future)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last = False)
+            return future
+
+    def __call__(self, header):
+        self._future(header.ca_id, header.cert_id,
+                     header.sign_date if self.historical else None)
+
+    def lookup(self, ca_cn, cert_cn, at = None):
+        "Certificate of the keychain, prefetched if possible"
+        return self._future(ca_cn, cert_cn, at).result()
+
+    def close(self):
+        if self._own_executor:
+            self.executor.shutdown(wait = False)
+
+def prefetch(keychain, at = None, historical = False):
+    """
+    Prefetcher of keychain certificates for codes to verify at `at`, or
+    at their sign date if historical is True
+    """
+    return Prefetcher(keychain, at = at, historical = historical)
+
+def frame(chunks, on_header = None, max_length = MAX_LENGTH):
+    "Yield codes framed from an iterable of byte chunks"
+    framer = Framer(on_header = on_header, max_length = max_length)
+    for data in chunks:
+        yield from framer.feed(data)
+    yield from framer.close()
+
+async def read_codes(reader, on_header = None, chunk_size = 4096,
+                     max_length = MAX_LENGTH):
+    """
+    Asynchronously yield codes read from `reader`, any object with an
+    awaitable read(n) returning b"" at end of stream, such as
+    asyncio.StreamReader.
+
+    If `on_header` returns an awaitable, it is scheduled as a task so
+    that it runs while the rest of the code is read.
+    """
+    framer = Framer(on_header = on_header, max_length = max_length)
+    tasks = set()
+    try:
+        while True:
+            data = await reader.read(chunk_size)
+            codes = framer.feed(data) if data else framer.close()
+            for r in framer.pending():
+                if inspect.isawaitable(r):
+                    task = asyncio.ensure_future(r)
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            for code in codes:
+                yield code
+            if not data:
+                return
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,307 @@
+from base64 import b32encode
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.x509.oid import NameOID
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+import random
+from . import data_definition
+from .header import Header
+from .keychain import KeyChain
+from .message import C40Message, GS
+
+__doc__ = """
+Synthetic signed documents, for load testing.
+
+Authority generates a throw-away EC CA and signing certificate.
+Generator walks all field definitions of a perimeter, keeps the ones
+for which it can produce values that parse back, and emits randomized
+documents signed by the authority, mixing in corrupted variants at a
+configurable rate.
+
+  >>> authority = Authority()
+  >>> keychain = authority.keychain()
+  >>> for code, corruption in Generator(authority, corrupt_rate = 0.05).generate(1000):
+  ...     ...
+
+  $ python -m tdd.synth -n 1000000 --chains chains/ -o corpus.txt
+"""
+__all__ = ["Authority", "Generator", "CORRUPTIONS"]
+
+# Ways to corrupt a document: altered field value, altered signature,
+# unknown certificate
+CORRUPTIONS = ("message", "signature", "certificate")
+
+# Characters generated in text fields, candidates are filtered by each
+# format's allowed_format
+_TEXT_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -/.,@'"
+_DIGITS = "0123456789"
+_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_HEX = "0123456789ABCDEF"
+_BASE32 = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+_BASE36 = _DIGITS + _LETTERS
+
+# Longest value generated for unbounded fields
+MAX_VARIABLE = 40
+
+EPOCH = date(2000, 1, 1)
+
+def _name(cn):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+
+class Authority:
+    """
+    Throw-away certificate authority: a self-signed CA named `ca_id`
+    and a signing certificate named `cert_id`, both P-256, valid from
+    `not_before` to ten years from now.
+    """
+    def __init__(self, ca_id = "FRSY", cert_id = "0001",
+                 not_before = datetime(2020, 1, 1, tzinfo = timezone.utc)):
+        self.ca_id = ca_id
+        self.cert_id = cert_id
+        self.not_before = not_before
+        self.not_after = datetime.now(timezone.utc) + timedelta(days = 3650)
+        self.ca_key = ec.generate_private_key(ec.SECP256R1())
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.ca = self._build(ca_id, ca_id, self.ca_key.public_key())
+        self.cert = self._build(ca_id, cert_id, self.key.public_key())
+
+    def _build(self, issuer_cn, subject_cn, public_key):
+        return x509.CertificateBuilder() \
+            .issuer_name(_name(issuer_cn)) \
+            .subject_name(_name(subject_cn)) \
+            .public_key(public_key) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(self.not_before) \
+            .not_valid_after(self.not_after) \
+            .sign(self.ca_key, hashes.SHA256())
+
+    def ders(self):
+        "DER encodings of CA and signing certificates"
+        return [c.public_bytes(serialization.Encoding.DER) for c in (self.ca, self.cert)]
+
+    def keychain(self, check_expiry = True):
+        "Keychain holding the authority certificates only"
+        k = KeyChain(check_expiry = check_expiry)
+        for der in self.ders():
+            k.der_add(der)
+        return k
+
+    def write(self, directory):
+        """
+        Write certificates as .der files into directory, loadable with
+        KeyChain.load_dir().
+        """
+        directory = Path(directory)
+        directory.mkdir(parents = True, exist_ok = True)
+        ca, cert = self.ders()
+        (directory / f"{self.ca_id}.der").write_bytes(ca)
+        (directory / f"{self.ca_id}_{self.cert_id}.der").write_bytes(cert)
+
+    def sign(self, data):
+        "2D-Doc signature of data: base32 of r || s, without padding"
+        r, s = decode_dss_signature(self.key.sign(data, ec.ECDSA(hashes.SHA256())))
+        return b32encode(r.to_bytes(32, "big") + s.to_bytes(32, "big")).decode("ascii").rstrip("=")
+
+def _random_date(rng):
+    return EPOCH + timedelta(days = rng.randrange(0, 14600))
+
+def _length(rng, encoding, default_min = 1):
+    lo = max(default_min, encoding.size_min or 0)
+    hi = encoding.size_max if encoding.size_max is not None else max(lo, MAX_VARIABLE)
+    return lo if lo >= hi else rng.randint(lo, min(hi, lo + MAX_VARIABLE))
+
+def _chars(rng, alphabet, n):
+    return "".join(rng.choice(alphabet) for _ in range(n))
+
+def _text(rng, encoding):
+    n = _length(rng, encoding)
+    pattern = getattr(encoding, "allowed_format", None)
+    if isinstance(encoding, data_definition.EORI):
+        return _chars(rng, _LETTERS, 2) + _chars(rng, _DIGITS, max(1, n - 2))
+    alphabet = "".join(c for c in _TEXT_CHARS if pattern is None or pattern.fullmatch(c))
+    return _chars(rng, alphabet, n)
+
+def _base32(rng, encoding):
+    # Only some base32 lengths decode (full bytes)
+    n = _length(rng, encoding, 2)
+    while n % 8 not in (0, 2, 4, 5, 7):
+        n += 1
+    return _chars(rng, _BASE32, n)
+
+_GENERATORS = {
+    data_definition.Date4: lambda rng, e: e.serialize(_random_date(rng)),
+    data_definition.Boolean: lambda rng, e: rng.choice("01"),
+    data_definition.JJMMAAAA: lambda rng, e: e.serialize(_random_date(rng)),
+    data_definition.JJMMAAAAHHMM: lambda rng, e: e.serialize(datetime.combine(
+        _random_date(rng), datetime.min.time()) + timedelta(minutes = rng.randrange(1440))),
+    data_definition.HexInt: lambda rng, e: _chars(rng, _HEX, _length(rng, e)),
+    data_definition.Time6: lambda rng, e: f"{rng.randrange(24):02d}{rng.randrange(60):02d}{rng.randrange(60):02d}",
+    data_definition.HHMM: lambda rng, e: f"{rng.randrange(24):02d}{rng.randrange(60):02d}",
+    data_definition.StringBase32: _base32,
+    data_definition.Base36: lambda rng, e: _chars(rng, _BASE36, _length(rng, e)),
+}
+
+def value_text(rng, definition):
+    "Random serialized value for a definition"
+    generator = _GENERATORS.get(type(definition.encoding), None)
+    if generator is None:
+        return _text(rng, definition.encoding)
+    return generator(rng, definition.encoding)
+
+def _field(definition, text, last):
+    if definition.fixed is None and not last:
+        return definition.id + text + GS
+    return definition.id + text
+
+class Generator:
+    """
+    Randomized document generator for a perimeter (only C40 perimeter
+    1 is defined).
+
+    Each document picks a document type in turn among `doc_types`
+    (defaults to all types of the perimeter), a random group of
+    fields, and up to `max_fields` fields of this group, with random
+    values complying with each format's character set and size bounds.
+
+    Definitions whose generated values do not parse back identically
+    are left out, they are listed in `skipped`.
+    """
+    def __init__(self, authority, seed = None, corrupt_rate = 0.0,
+                 doc_types = None, perimeter_id = 1, max_fields = 6,
+                 checks = 16):
+        self.authority = authority
+        self.rng = random.Random(seed)
+        self.corrupt_rate = corrupt_rate
+        self.perimeter_id = perimeter_id
+        self.max_fields = max_fields
+        perimeter = data_definition.c40.perimeters[perimeter_id]
+        self.doc_types = list(doc_types) if doc_types is not None else list(perimeter.doctypes)
+        self.skipped = []
+        self.groups = []
+        for group in perimeter.groups:
+            definitions = []
+            for d in group.definitions:
+                if self._round_trips(d, checks):
+                    definitions.append(d)
+                else:
+                    self.skipped.append(d.id)
+            if definitions:
+                self.groups.append(definitions)
+
+    def _round_trips(self, definition, checks):
+        """
+        Check generated values of a definition parse back to that
+        definition with the same text, followed by another field.
+        """
+        _, probe = data_definition.c40.datatype_get(self.perimeter_id, "01")
+        for _ in range(checks):
+            text = value_text(self.rng, definition)
+            code = _field(definition, text, False) + _field(probe, "1", True)
+            try:
+                dataset = C40Message.from_code(self.perimeter_id, code).dataset
+                if [d.definition for d in dataset] != [definition, probe]:
+                    return False
+                if definition.encoding.parse(text) != dataset[0].value:
+                    return False
+            except (ValueError, IndexError, TypeError):
+                return False
+        return True
+
+    def _message(self):
+        rng = self.rng
+        definitions = rng.choice(self.groups)
+        count = rng.randint(1, min(self.max_fields, len(definitions)))
+        chosen = sorted(rng.sample(range(len(definitions)), count))
+        return "".join(_field(definitions[i], value_text(rng, definitions[i]), n == count - 1)
+                       for n, i in enumerate(chosen))
+
+    def document(self, doc_type_id):
+        "One signed code of a given document type"
+        rng = self.rng
+        authority = self.authority
+        start = max(authority.not_before.date(), EPOCH)
+        span = (date.today() - start).days
+        sign_date = start + timedelta(days = rng.randrange(span + 1))
+        emit_date = sign_date - timedelta(days = rng.randrange(30))
+        header = Header(4, authority.ca_id, authority.cert_id, emit_date, sign_date,
+                        doc_type_id, self.perimeter_id, "FR").to_code()
+        data = header + self._message()
+        return data + "\x1f" + authority.sign(data.encode("ascii"))
+
+    def corrupt(self, code, corruption):
+        "Altered copy of a code, see CORRUPTIONS"
+        rng = self.rng
+        data, sign = code.split("\x1f", 1)
+        if corruption == "signature":
+            # The last character partly holds padding bits, leave it
+            i = rng.randrange(len(sign) - 1)
+            sign = sign[:i] + rng.choice(_BASE32.replace(sign[i], "")) + sign[i + 1:]
+        elif corruption == "certificate":
+            data = data[:8] + "ZZZZ" + data[12:]
+        else:
+            i = rng.randrange(28, len(data)) if len(data) > 28 else len(data) - 1
+            c = data[i]
+            pool = _DIGITS if c.isdigit() else _LETTERS if c.isalpha() else None
+            if pool is None:
+                return self.corrupt(code, "signature")
+            data = data[:i] + rng.choice(pool.replace(c, "")) + data[i + 1:]
+        return data + "\x1f" + sign
+
+    def generate(self, count):
+        """
+        Yield (code, corruption) pairs, corruption is None for valid
+        documents, one of CORRUPTIONS otherwise.
+        """
+        for n in range(count):
+            code = self.document(self.doc_types[n % len(self.doc_types)])
+            if self.corrupt_rate and self.rng.random() < self.corrupt_rate:
+                corruption = self.rng.choice(CORRUPTIONS)
+                yield self.corrupt(code, corruption), corruption
+            else:
+                yield code, None
+
+def main(args = None):
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description = "Generate synthetic signed 2D-Docs")
+    parser.add_argument("-n", "--count", type = int, default = 1000,
+                        help = "Number of documents")
+    parser.add_argument("-o", "--output", default = None,
+                        help = "Output file, one code per line (default: stdout)")
+    parser.add_argument("--chains", required = True,
+                        help = "Directory to write the test CA and certificate to")
+    parser.add_argument("--labels", default = None,
+                        help = "Output file for per code corruption labels ('valid' or kind)")
+    parser.add_argument("--corrupt-rate", type = float, default = 0.0,
+                        help = "Fraction of corrupted documents")
+    parser.add_argument("--doctype", action = "append", default = None,
+                        help = "Only generate this document type (repeatable)")
+    parser.add_argument("--seed", type = int, default = None,
+                        help = "Random seed for document contents")
+    parsed = parser.parse_args(args)
+
+    authority = Authority()
+    authority.write(parsed.chains)
+    generator = Generator(authority, seed = parsed.seed,
+                          corrupt_rate = parsed.corrupt_rate,
+                          doc_types = parsed.doctype)
+
+    out = open(parsed.output, "w", encoding = "ascii") if parsed.output else sys.stdout
+    labels = open(parsed.labels, "w") if parsed.labels else None
+    try:
+        for code, corruption in generator.generate(parsed.count):
+            out.write(code + "\n")
+            if labels is not None:
+                labels.write((corruption or "valid") + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if labels is not None:
+            labels.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .doc import TwoDDoc, _message, _signature_check, _split
+from .filter import filter_codes
+import os
+
+__doc__ = "Batch verification helpers"
+__all__ = ["Result", "verify", "verify_many"]
+
+class Result:
+    """
+    Outcome of the verification of a code. `doc` is None if the code
+    could not be parsed, or when its message was not decoded because
+    of a broken signature (then only `header` is set). `error` holds
+    the exception that stopped parsing or key lookup, if any.
+    """
+    def __init__(self, code, doc = None, valid = False, error = None,
+                 header = None):
+        self.code = code
+        self.doc = doc
+        self.valid = valid
+        self.error = error
+        self._header = header
+
+    @property
+    def header(self):
+        return self.doc.header if self.doc is not None else self._header
+
+    @property
+    def reason(self):
+        "Human readable failure reason, None for a valid signature"
+        if self.valid:
+            return None
+        if self.error is not None:
+            return f"{type(self.error).__name__}: {self.error}"
+        return "Signature broken"
+
+    def to_dict(self):
+        """
+        Plain summary (header fields, validity, failure reason), with
+        dates in ISO format, suitable for JSON.
+        """
+        h = self.header
+        d = {
+            "valid": self.valid,
+            "reason": self.reason,
+        }
+        if h is not None:
+            d.update(version = h.version,
+                     country_id = h.country_id,
+                     ca_id = h.ca_id,
+                     cert_id = h.cert_id,
+                     emit_date = h.emit_date.isoformat() if h.emit_date else None,
+                     sign_date = h.sign_date.isoformat() if h.sign_date else None,
+                     doc_type_id = h.doc_type_id,
+                     perimeter_id = h.perimeter_id)
+        return d
+
+def verify(code, keychain, historical = False, decode_invalid = True):
+    """
+    Parse a code and check its signature against keychain. Never
+    raises for a bad code, the failure is reported in the result.
+
+    If historical is True, certificate validity is checked at
+    document sign date rather than now.
+
+    If decode_invalid is False, the signature is checked over the raw
+    code first and the message is only decoded for valid documents
+    (see TwoDDoc.from_code_if_valid), which makes rejecting forgeries
+    cheaper.
+    """
+    if not decode_invalid:
+        return _verify_raw(code, keychain, historical)
+
+    try:
+        doc = TwoDDoc.from_code(code)
+    except Exception as e:
+        return Result(code, error = e)
+
+    try:
+        at = doc.header.sign_date if historical else None
+        valid = doc.signature_is_valid(keychain, at = at)
+    except Exception as e:
+        return Result(code, doc, error = e)
+
+    return Result(code, doc, valid)
+
+def _verify_raw(code, keychain, historical):
+    try:
+        header, data, signature, signed_data = _split(code)
+    except Exception as e:
+        return Result(code, error = e)
+
+    try:
+        at = header.sign_date if historical else None
+        if not _signature_check(keychain, header, signature, signed_data, at):
+            return Result(code, header = header)
+    except Exception as e:
+        return Result(code, header = header, error = e)
+
+    try:
+        message = _message(header, data)
+    except Exception as e:
+        return Result(code, header = header, error = e)
+    return Result(code, TwoDDoc(header, message, signature, signed_data = signed_data), True)
+
+def verify_many(codes, keychain, workers = None, historical = False,
+                header_filter = None, decode_invalid = True):
+    """
+    Verify codes in a thread pool, yielding results in input order.
+    If a header_filter (tdd.filter.HeaderFilter) is given, codes it
+    rejects are dropped before any parsing. decode_invalid is passed
+    to verify().
+
+    Signature checking in `cryptography` releases the GIL, so this
+    scales over cores without the pickling costs of a process pool.
+    Codes are consumed lazily, with at most a few pending items per
+    worker, so input may be an unbounded iterator.
+    """
+    if header_filter is not None:
+        codes = filter_codes(codes, header_filter)
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        window = workers * 4
+        pending = deque()
+        for code in codes:
+            pending.append(pool.submit(verify, code, keychain, historical,
+                                       decode_invalid))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,257 @@
+from datetime import date, datetime, time, timedelta, timezone
+from . import data_definition
+from .header import Header
+from .message import C40Message, FixedData, VariableData
+
+__doc__ = """
+Compact binary encoding of parsed documents.
+
+Documents cross process boundaries (process pools, archives) much
+cheaper in this form than as pickled object graphs: fields reference
+their definition by (perimeter, field id) only, and values are tagged
+binary items (varint integers, date ordinals, length-prefixed strings).
+Decoding looks definitions up again in data_definition.c40.
+
+TwoDDoc pickles through this encoding.
+
+  >>> blob = dumps(doc)
+  >>> doc = loads(blob)
+"""
+__all__ = ["dumps", "loads"]
+
+VERSION = 2
+
+FLAG_SIGNED_DATA = 1
+FLAG_EXTRA = 2
+FLAG_INCOMPLETE = 1
+
+# Value tags
+T_NONE, T_FALSE, T_TRUE, T_INT, T_STR, T_BYTES, T_DATE, T_DATETIME, T_TIME = range(9)
+# Aware datetime and time (UTC offset in seconds follows), containers
+T_DATETIME_TZ, T_TIME_TZ, T_LIST, T_DICT = range(9, 13)
+# Marks a VariableData entry in a dataset
+T_VARIABLE = 0xff
+
+def varint(buf, v):
+    while v >= 0x80:
+        buf.append((v & 0x7f) | 0x80)
+        v >>= 7
+    buf.append(v)
+
+def read_varint(buf, off):
+    v = 0
+    shift = 0
+    while True:
+        b = buf[off]
+        off += 1
+        v |= (b & 0x7f) << shift
+        if b < 0x80:
+            return v, off
+        shift += 7
+
+def _zigzag(buf, v):
+    varint(buf, v << 1 if v >= 0 else (-v << 1) - 1)
+
+def _read_zigzag(buf, off):
+    z, off = read_varint(buf, off)
+    return (-((z + 1) >> 1) if z & 1 else z >> 1), off
+
+def _microseconds(v):
+    return ((v.hour * 60 + v.minute) * 60 + v.second) * 1000000 + v.microsecond
+
+def _offset(v):
+    "UTC offset of an aware datetime or time in seconds, None if naive"
+    offset = v.utcoffset()
+    if offset is None:
+        return None
+    if offset.microseconds:
+        raise TypeError("Cannot encode sub-second UTC offsets")
+    return offset.days * 86400 + offset.seconds
+
+def encode_value(buf, v):
+    if v is None:
+        buf.append(T_NONE)
+    elif v is True or v is False:
+        buf.append(T_TRUE if v else T_FALSE)
+    elif isinstance(v, int):
+        buf.append(T_INT)
+        _zigzag(buf, v)
+    elif isinstance(v, str):
+        raw = v.encode("utf-8")
+        buf.append(T_STR)
+        varint(buf, len(raw))
+        buf += raw
+    elif isinstance(v, (bytes, bytearray)):
+        buf.append(T_BYTES)
+        varint(buf, len(v))
+        buf += v
+    elif isinstance(v, datetime):
+        offset = _offset(v)
+        buf.append(T_DATETIME if offset is None else T_DATETIME_TZ)
+        varint(buf, v.toordinal())
+        varint(buf, _microseconds(v))
+        if offset is not None:
+            _zigzag(buf, offset)
+    elif isinstance(v, date):
+        buf.append(T_DATE)
+        varint(buf, v.toordinal())
+    elif isinstance(v, time):
+        offset = _offset(v)
+        buf.append(T_TIME if offset is None else T_TIME_TZ)
+        varint(buf, _microseconds(v))
+        if offset is not None:
+            _zigzag(buf, offset)
+    elif isinstance(v, (list, tuple)):
+        buf.append(T_LIST)
+        varint(buf, len(v))
+        for item in v:
+            encode_value(buf, item)
+    elif isinstance(v, dict):
+        buf.append(T_DICT)
+        varint(buf, len(v))
+        for key, item in v.items():
+            encode_value(buf, key)
+            encode_value(buf, item)
+    else:
+        raise TypeError(f"Cannot encode {type(v).__name__} value")
+
+def decode_value(buf, off):
+    tag = buf[off]
+    off += 1
+    if tag == T_NONE:
+        return None, off
+    if tag == T_FALSE:
+        return False, off
+    if tag == T_TRUE:
+        return True, off
+    if tag == T_INT:
+        return _read_zigzag(buf, off)
+    if tag in (T_STR, T_BYTES):
+        n, off = read_varint(buf, off)
+        raw = bytes(buf[off:off + n])
+        return (raw.decode("utf-8") if tag == T_STR else raw), off + n
+    if tag == T_DATE:
+        o, off = read_varint(buf, off)
+        return date.fromordinal(o), off
+    if tag in (T_DATETIME, T_DATETIME_TZ):
+        o, off = read_varint(buf, off)
+        us, off = read_varint(buf, off)
+        v = datetime.combine(date.fromordinal(o), time()) + timedelta(microseconds = us)
+        if tag == T_DATETIME_TZ:
+            offset, off = _read_zigzag(buf, off)
+            v = v.replace(tzinfo = timezone(timedelta(seconds = offset)))
+        return v, off
+    if tag in (T_TIME, T_TIME_TZ):
+        us, off = read_varint(buf, off)
+        v = (datetime.min + timedelta(microseconds = us)).time()
+        if tag == T_TIME_TZ:
+            offset, off = _read_zigzag(buf, off)
+            v = v.replace(tzinfo = timezone(timedelta(seconds = offset)))
+        return v, off
+    if tag == T_LIST:
+        n, off = read_varint(buf, off)
+        items = []
+        for _ in range(n):
+            item, off = decode_value(buf, off)
+            items.append(item)
+        return items, off
+    if tag == T_DICT:
+        n, off = read_varint(buf, off)
+        items = {}
+        for _ in range(n):
+            key, off = decode_value(buf, off)
+            items[key], off = decode_value(buf, off)
+        return items, off
+    raise ValueError(f"Bad value tag {tag}")
+
+HEADER_FIELDS = ("version", "ca_id", "cert_id", "emit_date", "sign_date",
+                 "doc_type_id", "perimeter_id", "country_id")
+
+def encode_header(buf, header):
+    for name in HEADER_FIELDS:
+        encode_value(buf, getattr(header, name))
+
+def decode_header(buf, off):
+    values = {}
+    for name in HEADER_FIELDS:
+        values[name], off = decode_value(buf, off)
+    return Header(**values), off
+
+def encode_dataset(buf, dataset):
+    """
+    Encode data entries as field id and value. VariableData entries
+    are prefixed with a flag byte, so field ids of plain entries are
+    always preceded by their string tag (T_STR).
+    """
+    varint(buf, len(dataset))
+    for d in dataset:
+        if isinstance(d, VariableData):
+            buf.append(T_VARIABLE)
+            buf.append(0 if d.complete else FLAG_INCOMPLETE)
+        encode_value(buf, d.definition.id)
+        encode_value(buf, d.value)
+
+def decode_message(buf, off, perimeter_id):
+    count, off = read_varint(buf, off)
+    message = C40Message(perimeter_id, [])
+    datatype_get = data_definition.c40.datatype_get
+    for _ in range(count):
+        flags = None
+        if buf[off] == T_VARIABLE:
+            flags = buf[off + 1]
+            off += 2
+        field_id, off = decode_value(buf, off)
+        value, off = decode_value(buf, off)
+        group, definition = datatype_get(perimeter_id, field_id)
+        if flags is None:
+            message.dataset.append(FixedData(group, definition, value))
+        else:
+            message.dataset.append(VariableData(group, definition, value,
+                                                complete = not flags & FLAG_INCOMPLETE))
+    return message, off
+
+def dumps(doc, signed_data = True, extra = True):
+    """
+    Encode a document. Signed data is kept by default, so that
+    signature can still be checked after decoding. So is the `extra`
+    attribute, which must then be made of encodable values (None,
+    booleans, integers, strings, bytes, dates and times, lists and
+    dicts of them).
+    """
+    buf = bytearray()
+    buf.append(VERSION)
+    keep = signed_data and doc.signed_data is not None
+    keep_extra = extra and doc.extra is not None
+    buf.append((FLAG_SIGNED_DATA if keep else 0) | (FLAG_EXTRA if keep_extra else 0))
+    encode_header(buf, doc.header)
+    encode_value(buf, doc.signature)
+    if keep:
+        encode_value(buf, doc.signed_data)
+    if keep_extra:
+        encode_value(buf, doc.extra)
+    encode_dataset(buf, doc.message.dataset)
+    return bytes(buf)
+
+def loads(blob):
+    "Decode a document encoded with dumps()"
+    from .doc import TwoDDoc
+    if blob[0] not in (1, VERSION):
+        raise ValueError("Unsupported wire format version")
+    flags = blob[1]
+    header, off = decode_header(blob, 2)
+    signature, off = decode_value(blob, off)
+    signed_data = None
+    if flags & FLAG_SIGNED_DATA:
+        signed_data, off = decode_value(blob, off)
+    extra = None
+    if flags & FLAG_EXTRA:
+        extra, off = decode_value(blob, off)
+    message, off = decode_message(blob, off, header.perimeter_id)
+    return TwoDDoc(header, message, signature, signed_data = signed_data,
+                   extra = extra)
+
+def _loads_extra(blob, extra):
+    "Decode a document pickled with an extra attribute the wire format cannot encode"
+    doc = loads(blob)
+    doc.extra = extra
+    return doc
@@ -38,3 +38,75 @@ def keychain():
     """
     from tdd.keychain import internal
     return internal(include_test=True, check_expiry=False)
+
+
+class PKI:
+    """
+    Throw-away certificate authority issuing 2D-Doc style certificates
+    (CA and certificate identified by their common name).
+    """
+    def __init__(self, ca_cn="FRZZ"):
+        from cryptography.hazmat.primitives.asymmetric import ec
+        self.ca_key = ec.generate_private_key(ec.SECP256R1())
+        self.ca_cn = ca_cn
+        self.ca = self._build(ca_cn, ca_cn, self.ca_key.public_key(), self.ca_key)
+
+    @staticmethod
+    def _name(cn):
+        from cryptography import x509
+        from cryptography.x509.oid import NameOID
+        return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+
+    def _build(self, issuer_cn, subject_cn, public_key, signing_key,
+               not_before=None, not_after=None, serial=None):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes
+        from datetime import datetime, timedelta, timezone
+        now = datetime.now(timezone.utc)
+        return x509.CertificateBuilder() \
+            .issuer_name(self._name(issuer_cn)) \
+            .subject_name(self._name(subject_cn)) \
+            .public_key(public_key) \
+            .serial_number(serial or x509.random_serial_number()) \
+            .not_valid_before(not_before or now - timedelta(days=1)) \
+            .not_valid_after(not_after or now + timedelta(days=365)) \
+            .sign(signing_key, hashes.SHA256())
+
+    def issue(self, cn, not_before=None, not_after=None, serial=None):
+        """Issue a certificate, returns (private key, certificate)."""
+        from cryptography.hazmat.primitives.asymmetric import ec
+        key = ec.generate_private_key(ec.SECP256R1())
+        cert = self._build(self.ca_cn, cn, key.public_key(), self.ca_key,
+                           not_before, not_after, serial)
+        return key, cert
+
+    def crl(self, serials, last_update=None):
+        """Build a DER CRL revoking given serial numbers."""
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from datetime import datetime, timedelta, timezone
+        last_update = last_update or datetime.now(timezone.utc)
+        builder = x509.CertificateRevocationListBuilder() \
+            .issuer_name(self._name(self.ca_cn)) \
+            .last_update(last_update) \
+            .next_update(last_update + timedelta(days=7))
+        for serial in serials:
+            builder = builder.add_revoked_certificate(
+                x509.RevokedCertificateBuilder()
+                .serial_number(serial)
+                .revocation_date(last_update)
+                .build())
+        return builder.sign(self.ca_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+    @staticmethod
+    def der(cert):
+        from cryptography.hazmat.primitives import serialization
+        return cert.public_bytes(serialization.Encoding.DER)
+
+
+@pytest.fixture
+def pki():
+    """
+    A fresh throw-away certificate authority.
+    """
+    return PKI()
@@ -0,0 +1,113 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from tdd.archive import Archive
+from tdd.verify import verify
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+
+def test_archive_roundtrip_and_query(tmp_path, keychain):
+    results = [verify(p.read_text().strip(), keychain)
+               for p in sorted(SAMPLES.rglob("*.txt"))]
+    results.append(verify("garbage", keychain))
+    path = tmp_path / "audit.tdda"
+
+    with Archive(path) as a:
+        half = len(results) // 2
+        assert a.append(results[:half]) == half
+        assert a.append(results[half:]) == len(results) - half - 1
+        assert len(a.segments) == 2
+
+    with Archive(path) as a:
+        records = list(a)
+        assert len(records) == len(results) - 1
+        for record, result in zip(records, results):
+            assert record.valid == result.valid
+            assert record.doc.signature == result.doc.signature
+            for name in ("ca_id", "cert_id", "sign_date", "emit_date", "doc_type_id", "perimeter_id"):
+                assert getattr(record.header, name) == getattr(result.header, name)
+            assert [(d.definition.id, d.value) for d in record.doc.message.dataset] == \
+                [(d.definition.id, d.value) for d in result.doc.message.dataset]
+
+        docs = [r.doc for r in results if r.doc is not None]
+
+        def expect(pred):
+            return [d.signature for d in docs if pred(d.header)]
+
+        assert [r.doc.signature for r in a.query(doc_type_id="01")] == \
+            expect(lambda h: h.doc_type_id == "01")
+        assert [r.doc.signature for r in a.query(ca_id="FR00", cert_id="0001")] == \
+            expect(lambda h: h.ca_id == "FR00" and h.cert_id == "0001")
+        start, end = date(2017, 1, 1), date(2017, 12, 31)
+        assert [r.doc.signature for r in a.query(sign_from=start, sign_to=end, doc_type_id="A5")] == \
+            expect(lambda h: h.sign_date and start <= h.sign_date <= end and h.doc_type_id == "A5")
+        assert list(a.query(perimeter_id=42)) == []
+        assert len(list(a.query(valid=True))) == len(docs)
+
+
+def sample_results(keychain):
+    return [verify(p.read_text().strip(), keychain)
+            for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def test_archive_recovers_truncated_tail(tmp_path, keychain):
+    results = sample_results(keychain)
+    path = tmp_path / "audit.tdda"
+    with Archive(path) as a:
+        a.append(results[:3])
+        size = path.stat().st_size
+        a.append(results[3:])
+    with open(path, "r+b") as f:
+        f.truncate(path.stat().st_size - 10)
+
+    with Archive(path) as a:
+        assert len(a) == 3
+        assert a.append(results[3:5]) == 2
+    assert path.stat().st_size > size
+    with Archive(path) as a:
+        assert [r.doc.signature for r in a] == [r.doc.signature for r in results[:5]]
+
+
+def test_archive_recovers_interrupted_first_append(tmp_path, keychain):
+    results = sample_results(keychain)
+    path = tmp_path / "audit.tdda"
+    with Archive(path) as a:
+        a.append(results[:3])
+    full = path.read_bytes()
+
+    for size in (len(full) - 10, 20, 5):
+        path.write_bytes(full[:size])
+        with Archive(path) as a:
+            assert len(a) == 0
+            assert a.append(results[:2]) == 2
+        with Archive(path) as a:
+            assert [r.doc.signature for r in a] == [r.doc.signature for r in results[:2]]
+
+    path.write_bytes(b"not an archive")
+    with pytest.raises(ValueError):
+        Archive(path)
+
+
+def test_archive_append_during_query(tmp_path, keychain):
+    results = sample_results(keychain)
+    path = tmp_path / "audit.tdda"
+    with Archive(path) as a:
+        a.append(results[:3])
+        records = a.query()
+        first = next(records)
+        a.append(results[3:])
+        # The running query goes on over the segments it started with
+        assert [r.doc.signature for r in [first, *records]] == \
+            [r.doc.signature for r in results[:3]]
+        assert len(list(a)) == len(results)
+
+
+def test_archive_opens_read_only(tmp_path):
+    path = tmp_path / "audit.tdda"
+    with Archive(path) as a:
+        assert len(a) == 0
+        assert list(a) == []
+    assert not path.exists()
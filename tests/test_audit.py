@@ -0,0 +1,64 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from tdd.audit import AuditLog
+from tdd.verify import verify, verify_many
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+CODES = [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def test_record_results(keychain, tmp_path):
+    path = tmp_path / "audit.db"
+    codes = CODES[:10] + ["garbage", CODES[0][:-4] + "AAAA"]
+    with AuditLog(path, batch_size=5, store_code=True) as audit:
+        passed = [r.code for r in audit.record(verify_many(codes, keychain, workers=2))]
+        assert passed == codes
+        assert len(audit) == len(codes)
+        audit.write({"valid": True, "reason": None, "ca_id": "FR01",
+                     "doc_type_id": "04", "sign_date": "2024-03-01"})
+
+    db = sqlite3.connect(path)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = {r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"verifications_cert", "verifications_doc_type", "verifications_sign_date"} <= indexes
+    rows = db.execute("SELECT valid, reason, ca_id, cert_id, sign_date, code "
+                      "FROM verifications ORDER BY id").fetchall()
+    assert len(rows) == len(codes) + 1
+    first = verify(codes[0], keychain)
+    assert rows[0] == (1, None, "FR00", first.header.cert_id,
+                       first.header.sign_date.isoformat(), codes[0])
+    assert rows[10][:3] == (0, rows[10][1], None) and rows[10][1].startswith("ValueError")
+    assert rows[11][:2] == (0, "Signature broken")
+    assert rows[12][2] == "FR01"
+
+
+def test_append_reopens(keychain, tmp_path):
+    path = tmp_path / "audit.db"
+    results = [verify(c, keychain) for c in CODES[:3]]
+    with AuditLog(path) as audit:
+        assert audit.append(results) == 3
+    with AuditLog(path) as audit:
+        audit.append(results)
+        assert len(audit) == 6
+
+
+def test_idle_flush_and_close(keychain, tmp_path):
+    path = tmp_path / "audit.db"
+    audit = AuditLog(path, flush_interval=0.1)
+    audit.write(verify(CODES[0], keychain))
+    db = sqlite3.connect(path)
+    deadline = time.monotonic() + 5
+    while db.execute("SELECT COUNT(*) FROM verifications").fetchone()[0] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    audit.close()
+    audit.close()
+    with pytest.raises(ValueError):
+        len(audit)
+    with pytest.raises(ValueError):
+        audit.write(verify(CODES[0], keychain))
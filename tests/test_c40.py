@@ -1,3 +1,7 @@
+import random
+
+import pytest
+
 from tdd.c40 import c40, text
 
 def test_c40_parse():
@@ -16,3 +20,22 @@ def test_text_iso():
     s = ''.join(chr(i) for i in range(128))
     assert text.parse(text.format(s)) == s
 
+
+def legacy_format(codec, s):
+    return codec.stream_format(codec.pack(codec.text_encode(s, codec.reverse)))
+
+def test_format_matches_legacy_encoder():
+    rng = random.Random(0)
+    for codec in (c40, text):
+        strings = [''.join(chr(rng.randrange(129)) for _ in range(rng.randrange(20)))
+                   for _ in range(500)]
+        expected = [legacy_format(codec, s) for s in strings]
+        assert [codec.format(s) for s in strings] == expected
+        assert codec.format_many(strings) == expected
+    assert c40.format('') == b'' and c40.format_many([]) == []
+
+def test_format_rejects_unknown_chars():
+    with pytest.raises(KeyError):
+        c40.format('FRé')
+    with pytest.raises(KeyError):
+        c40.format_many(['FR', '€'])
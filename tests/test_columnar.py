@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from tdd.columnar import decode_columns
+from tdd.doc import TwoDDoc
+from tdd.header import Header
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+CODES = [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def test_header_columns_match_objects():
+    cols = decode_columns(["garbage"] + CODES)
+    assert list(cols.index) == list(range(1, len(CODES) + 1))
+    assert not cols.errors
+    for row, i in enumerate(cols.index):
+        h = TwoDDoc.from_code(CODES[i - 1]).header
+        for name in ("version", "ca_id", "cert_id", "doc_type_id",
+                     "perimeter_id", "country_id"):
+            assert cols.header[name][row] == getattr(h, name)
+        for name in ("emit_date", "sign_date"):
+            d = getattr(h, name)
+            if d is None:
+                assert np.isnat(cols.header[name][row])
+            else:
+                assert cols.header[name][row] == np.datetime64(d)
+
+
+def test_field_columns_and_masks():
+    cols = decode_columns(CODES)
+    for row, i in enumerate(cols.index):
+        dataset = {}
+        for d in TwoDDoc.from_code(CODES[i]).message.dataset:
+            dataset.setdefault(d.definition.id, d.value)
+        for id, column in cols.fields.items():
+            if id not in dataset:
+                assert column.mask[row]
+                continue
+            assert not column.mask[row]
+            value, expected = column.data[row], dataset[id]
+            if isinstance(value, np.datetime64):
+                assert value == np.datetime64(expected)
+            elif isinstance(value, np.timedelta64):
+                assert value == np.timedelta64(
+                    expected.hour * 3600 + expected.minute * 60 + expected.second, "s")
+            else:
+                assert value == expected
+
+    records = cols.to_structured()
+    assert records.shape == (len(CODES),)
+    assert records.dtype.names[:2] == ("version", "ca_id")
+    assert set(cols.fields) <= set(records.dtype.names)
+
+
+def test_filters():
+    doc_type = CODES[0][20:22]
+    cols = decode_columns(CODES, perimeter_id=1, doc_type_id=doc_type,
+                          fields=["10", "ZZ"])
+    assert len(cols) == sum(c[20:22] == doc_type and TwoDDoc.from_code(c).header.perimeter_id == 1
+                            for c in CODES)
+    assert set(cols.header["doc_type_id"]) == {doc_type}
+    assert list(cols.fields) == ["10", "ZZ"]
+    assert cols.fields["ZZ"].mask.all()
+    assert len(decode_columns([])) == 0
+
+
+def test_bad_headers_are_rejected():
+    code = next(c for c in CODES if c.startswith("DC03"))
+    bad = [
+        "DC/;" + code[4:],
+        code[:12] + "00G0" + code[16:],
+        code[:16] + "0 00" + code[20:],
+        code[:22] + "X1" + code[24:],
+        code[:20],
+    ]
+    for c in bad:
+        with pytest.raises(ValueError):
+            Header.from_code(c)
+    lower = code[:16] + code[16:20].lower() + code[20:]
+    cols = decode_columns(bad + [code, lower])
+    assert list(cols.index) == [len(bad), len(bad) + 1]
+    assert cols.header["sign_date"][1] == np.datetime64(Header.from_code(lower).sign_date)
@@ -0,0 +1,114 @@
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from tdd.distributed import (ChunkFailedError, Coordinator, parse_address,
+                             recv_message, send_message)
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+
+@pytest.fixture
+def workers():
+    procs = []
+
+    def spawn():
+        p = subprocess.Popen(
+            [sys.executable, "-m", "tdd.distributed", "worker",
+             "--bind", "127.0.0.1:0", "--test-ca"],
+            stdout=subprocess.PIPE, text=True,
+            cwd=Path(__file__).parent.parent)
+        procs.append(p)
+        line = p.stdout.readline()
+        assert line.startswith("Listening on ")
+        return parse_address(line.split()[-1])
+
+    yield spawn
+    for p in procs:
+        p.kill()
+        p.wait()
+
+
+def free_address():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()
+
+
+def codes():
+    return [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def test_results_are_ordered(workers):
+    inputs = codes() * 2 + ["garbage"]
+    coordinator = Coordinator([workers(), workers()], chunk_size=7)
+    results = list(coordinator.run(iter(inputs)))
+
+    assert len(results) == len(inputs)
+    assert all(r["valid"] for r in results[:-1])
+    assert results[-1]["reason"].startswith("ValueError")
+    assert [r["sign_date"] for r in results[:len(inputs) // 2]] == \
+        [r["sign_date"] for r in results[len(inputs) // 2:-1]]
+
+
+def test_failed_worker_chunks_are_retried(workers):
+    inputs = codes()
+    coordinator = Coordinator([free_address(), workers()], chunk_size=5,
+                              retries=2, backoff=0.01)
+    results = list(coordinator.run(inputs))
+    assert len(results) == len(inputs)
+    assert all(r["valid"] for r in results)
+
+
+def test_no_worker_left():
+    coordinator = Coordinator([free_address()], retries=1, backoff=0.01)
+    with pytest.raises(ChunkFailedError):
+        list(coordinator.run(codes()))
+
+
+def test_dead_worker_does_not_use_up_chunk_retries(workers):
+    inputs = codes()
+    coordinator = Coordinator([free_address(), free_address(), workers()],
+                              chunk_size=3, retries=0, backoff=0.01)
+    results = list(coordinator.run(inputs))
+    assert len(results) == len(inputs)
+    assert all(r["valid"] for r in results)
+
+
+def test_early_close_does_not_wait_for_timeouts():
+    # Fake worker answering its first request, then never again
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    hanging = threading.Event()
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            request = recv_message(conn)
+            send_message(conn, {"chunk": request["chunk"],
+                                "results": [{"valid": True}] * len(request["codes"])})
+            recv_message(conn)
+            hanging.set()
+            try:
+                conn.recv(1)
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    try:
+        coordinator = Coordinator([server.getsockname()], chunk_size=2, timeout=60)
+        results = coordinator.run(codes())
+        assert next(results) == {"valid": True}
+        assert hanging.wait(5)
+        start = time.monotonic()
+        results.close()
+        assert time.monotonic() - start < 5
+    finally:
+        server.close()
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+SAMPLE = ROOT / "tests" / "spec_samples" / "3.1.3" / "15.2.2" / "17.txt"
+
+
+def dump(*args):
+    return subprocess.run([sys.executable, "-m", "tdd.dump", "--test-ca", *map(str, args)],
+                          capture_output=True, text=True, cwd=ROOT)
+
+
+def test_filter_only_when_asked(tmp_path):
+    garbage = tmp_path / "garbage.txt"
+    garbage.write_text("garbage")
+
+    # Without filter options, bad input is an error as before
+    r = dump(garbage)
+    assert r.returncode != 0 and "ValueError" in r.stderr
+
+    r = dump("--doctype", "04", garbage, SAMPLE)
+    assert r.returncode == 0 and r.stdout == ""
+    r = dump("--doctype", "A5", garbage, SAMPLE)
+    assert r.returncode == 0 and "Signature OK" in r.stdout
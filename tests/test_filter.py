@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from tdd.filter import HeaderFilter, filter_codes
+from tdd.header import Header
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+
+def codes():
+    return [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def test_raw_matching_agrees_with_header():
+    filters = [
+        HeaderFilter(doc_types=["01", "A5"]),
+        HeaderFilter(perimeters=[1]),
+        HeaderFilter(perimeters=[2]),
+        HeaderFilter(ca_ids=["FR00"], cert_ids=["0001"]),
+        HeaderFilter(countries=["FR"], doc_types=["04"]),
+    ]
+    for f in filters:
+        for code in codes():
+            assert f.matches_code(code) == f.matches(Header.from_code(code))
+
+
+def test_predicate_and_garbage():
+    f = HeaderFilter(predicate=lambda h: h.sign_date is not None and h.sign_date.year == 2017)
+    selected = list(filter_codes(codes() + ["garbage", "DC99"], f))
+    assert selected
+    assert all(Header.from_code(c).sign_date.year == 2017 for c in selected)
+    assert not HeaderFilter().matches_code("garbage")
+
+
+def test_binary_header():
+    c = bytes.fromhex("dc047ba77b9d200f2d0a5fb3e19961b0010001")
+    assert HeaderFilter(ca_ids=["FR01"], countries=["FRA"]).matches_code(c)
+    assert not HeaderFilter(ca_ids=["FR03"]).matches_code(c)
+
+
+def test_verify_many_skips_rejected(keychain):
+    from tdd.verify import verify_many
+    f = HeaderFilter(doc_types=["01"])
+    results = list(verify_many(codes() + ["garbage"], keychain, header_filter=f))
+    assert results and all(r.header.doc_type_id == "01" for r in results)
@@ -53,3 +53,23 @@ def test_header04_bin():
     assert h.perimeter_id == 1
     assert h.country_id == "FRA"
     assert h.to_code() == c
+
+def test_prefix_cache():
+    from tdd import header
+    a = Header.from_code("DC04FR0AXT4A0E840E8A0101FR")
+    b = Header.from_code("DC04FR0AXT4A111E111E0101FR")
+    assert a is not b
+    assert (b.ca_id, b.cert_id, b.doc_type_id, b.perimeter_id, b.country_id) == \
+        ("FR0A", "XT4A", "01", 1, "FR")
+    assert b.emit_date == b.sign_date == date(2011, 12, 31)
+    assert a.emit_date == date(2010, 3, 5)
+
+    for i in range(header.PREFIX_CACHE_SIZE * 2):
+        Header.from_code(f"DC03FR0A{i:04X}0E840E8A0101")
+    assert len(header._prefix_cache) <= header.PREFIX_CACHE_SIZE
+
+def test_epoch_date_table():
+    from tdd.header import epoch_date
+    assert epoch_date(0) == date(2000, 1, 1)
+    assert epoch_date(0x111E) is epoch_date(0x111E)
+    assert epoch_date(0xFFFF) == date(2179, 6, 6)
@@ -0,0 +1,124 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+from pathlib import Path
+
+import pytest
+
+import tdd.ingest
+from tdd.ingest import Ingestor, InotifyWatcher, PollingWatcher, main
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+CODES = [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def wait_for(path, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        assert time.monotonic() < deadline, f"{path} not written"
+        time.sleep(0.02)
+    return json.loads(path.read_text())
+
+
+def drop(directory, name, code):
+    # Write then rename, as a scanning station would
+    tmp = directory / (name + ".part")
+    tmp.write_text(code)
+    tmp.rename(directory / name)
+
+
+def run_watched(ingestor, directories, watch):
+    stop = threading.Event()
+    thread = threading.Thread(target=ingestor.run, args=(directories,),
+                              kwargs=dict(watch=watch, stop=stop))
+    thread.start()
+    return stop, thread
+
+
+def test_once_processes_pending(keychain, tmp_path):
+    (tmp_path / "a.txt").write_text(CODES[0] + "\n")
+    (tmp_path / "b.txt").write_text("garbage")
+    ingestor = Ingestor(keychain)
+    ingestor.run([tmp_path], once=True)
+    a = json.loads((tmp_path / "a.json").read_text())
+    b = json.loads((tmp_path / "b.json").read_text())
+    assert a["valid"] and a["file"] == "a.txt" and a["ca_id"] == "FR00"
+    assert not b["valid"] and b["reason"].startswith("ValueError")
+    assert ingestor.processed == 2
+
+    # Up to date results are not redone
+    assert list(ingestor.pending([tmp_path])) == []
+
+
+@pytest.mark.parametrize("kind", ["polling", "inotify"])
+def test_watch(keychain, tmp_path, kind):
+    inbox = tmp_path / "inbox"
+    out = tmp_path / "out"
+    inbox.mkdir()
+    drop(inbox, "early.txt", CODES[0])
+    if kind == "polling":
+        watch = PollingWatcher([inbox], interval=0.05)
+    else:
+        try:
+            watch = InotifyWatcher([inbox])
+        except OSError:
+            pytest.skip("inotify not available")
+
+    ingestor = Ingestor(keychain, output_dir=out, workers=2)
+    stop, thread = run_watched(ingestor, [inbox], watch)
+    try:
+        assert wait_for(out / "early.json")["valid"]
+        for i, code in enumerate(CODES[:5]):
+            drop(inbox, f"{i}.txt", code)
+        for i in range(5):
+            assert wait_for(out / f"{i}.json")["valid"]
+        assert not (inbox / "0.part.json").exists()
+    finally:
+        stop.set()
+        thread.join()
+        watch.close()
+    assert not list(inbox.glob("*.json"))
+
+
+def test_cli_once(tmp_path):
+    (tmp_path / "a.txt").write_text(CODES[0])
+    main([str(tmp_path), "--once", "--test-ca"])
+    assert json.loads((tmp_path / "a.json").read_text())["file"] == "a.txt"
+
+
+def test_failures_are_counted(keychain, tmp_path, monkeypatch, capsys):
+    def broken(path, data):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tdd.ingest, "_write_atomic", broken)
+    for i in range(3):
+        (tmp_path / f"{i}.txt").write_text(CODES[i])
+    ingestor = Ingestor(keychain)
+    ingestor.run([tmp_path], once=True)
+    assert (ingestor.processed, ingestor.failed) == (0, 3)
+    assert "disk full" in capsys.readouterr().err
+    assert not ingestor._inflight
+
+
+def test_queued_files_are_not_resubmitted(keychain, tmp_path):
+    (tmp_path / "a.txt").write_text(CODES[0])
+    ingestor = Ingestor(keychain)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def process(path):
+        calls.append(path)
+        started.set()
+        release.wait(5)
+
+    ingestor.process = process
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        ingestor._submit(pool, tmp_path / "a.txt")
+        started.wait(5)
+        # Overflow rescan while the file is still being processed
+        ingestor._submit(pool, tmp_path / "a.txt")
+        release.set()
+    assert len(calls) == 1
@@ -0,0 +1,267 @@
+import os
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.x509.oid import NameOID
+from datetime import datetime, timedelta, timezone
+
+from tdd.keychain import ExpiredCertificateError, KeyChain, RevokedCertificateError
+
+
+def test_crl_revokes_certificate(pki):
+    _, good = pki.issue("0001")
+    _, bad = pki.issue("0002")
+    k = KeyChain()
+    k.der_add(pki.der(pki.ca))
+    k.der_add(pki.der(good))
+    k.der_add(pki.der(bad))
+
+    assert k.crl_add(pki.crl([bad.serial_number])) == "FRZZ"
+    assert k.lookup("FRZZ", "0001") == good
+    with pytest.raises(RevokedCertificateError):
+        k.lookup("FRZZ", "0002")
+
+
+def test_crl_with_bad_signature_is_ignored(pki):
+    from conftest import PKI
+    _, cert = pki.issue("0001")
+    k = KeyChain()
+    k.der_add(pki.der(pki.ca))
+    k.der_add(pki.der(cert))
+
+    forged = PKI(pki.ca_cn).crl([cert.serial_number])
+    assert k.crl_add(forged) is None
+    assert k.lookup("FRZZ", "0001") == cert
+
+
+def test_crl_refresh(pki, tmp_path):
+    _, cert = pki.issue("0001")
+    (tmp_path / "FRZZ.der").write_bytes(pki.der(pki.ca))
+    (tmp_path / "FRZZ_0001.der").write_bytes(pki.der(cert))
+    crl = tmp_path / "FRZZ.crl"
+    then = datetime.now(timezone.utc) - timedelta(hours=1)
+    crl.write_bytes(pki.crl([], last_update=then))
+
+    k = KeyChain()
+    k.load_dir(tmp_path)
+    assert k.lookup("FRZZ", "0001") == cert
+
+    # Unchanged file is not reloaded
+    assert k.refresh_crls(tmp_path) == []
+
+    crl.write_bytes(pki.crl([cert.serial_number]))
+    stat = crl.stat()
+    os.utime(crl, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert k.refresh_crls(tmp_path) == ["FRZZ"]
+    with pytest.raises(RevokedCertificateError):
+        k.lookup("FRZZ", "0001")
+
+    # Older CRL does not override newer one
+    assert k.crl_add(pki.crl([], last_update=then)) is None
+
+
+def rotated_keychain(pki, check_expiry=True):
+    utc = timezone.utc
+    _, old = pki.issue("0001", datetime(2018, 1, 1, tzinfo=utc), datetime(2021, 1, 1, tzinfo=utc))
+    _, new = pki.issue("0001", datetime(2020, 6, 1, tzinfo=utc), datetime(2030, 1, 1, tzinfo=utc))
+    k = KeyChain(check_expiry=check_expiry)
+    k.der_add(pki.der(pki.ca))
+    k.der_add(pki.der(new))
+    k.der_add(pki.der(old))
+    return k, old, new
+
+
+def test_lookup_at_sign_date(pki):
+    from datetime import date
+    from tdd.keychain import ExpiredCertificateError
+
+    k, old, new = rotated_keychain(pki)
+    assert k.lookup("FRZZ", "0001", at=date(2019, 5, 1)) == old
+    # Overlapping windows resolve to the latest issued certificate
+    assert k.lookup("FRZZ", "0001", at=date(2020, 7, 1)) == new
+    assert k.lookup("FRZZ", "0001", at=datetime(2025, 1, 1)) == new
+    # Date granularity covers the whole day
+    assert k.lookup("FRZZ", "0001", at=date(2021, 1, 1)) == new
+    with pytest.raises(ExpiredCertificateError, match="not yet valid"):
+        k.lookup("FRZZ", "0001", at=date(2017, 1, 1))
+    with pytest.raises(ExpiredCertificateError, match="expired"):
+        k.lookup("FRZZ", "0001", at=date(2031, 1, 1))
+
+
+def test_expired_reports_window_before_lookup_time(pki):
+    utc = timezone.utc
+    k = KeyChain()
+    k.der_add(pki.der(pki.ca))
+    for start, end in ((2016, 2018), (2018, 2019), (2021, 2030)):
+        _, cert = pki.issue("0001", datetime(start, 1, 1, tzinfo=utc),
+                            datetime(end, 1, 1, tzinfo=utc))
+        k.der_add(pki.der(cert))
+
+    with pytest.raises(ExpiredCertificateError, match="expired 2019-01-01"):
+        k.lookup("FRZZ", "0001", at=datetime(2020, 1, 1))
+
+
+def test_lookup_at_without_expiry_check(pki):
+    from datetime import date
+
+    k, old, new = rotated_keychain(pki, check_expiry=False)
+    assert k.lookup("FRZZ", "0001", at=date(2019, 5, 1)) == old
+    assert k.lookup("FRZZ", "0001", at=date(2031, 1, 1)) == new
+
+
+def test_compact_keychain_verifies_samples():
+    from tdd.doc import TwoDDoc
+    from tdd.keychain import internal, CompactCertEntry
+    from pathlib import Path
+
+    k = internal(include_test=True, check_expiry=False, compact=True)
+    assert all(isinstance(e, CompactCertEntry) for e in k._entries)
+    for p in sorted((Path(__file__).parent / "spec_samples").rglob("*.txt")):
+        assert TwoDDoc.from_code(p.read_text().strip()).signature_is_valid(k)
+
+
+def test_compact_keychain_checks_issuer(pki):
+    from conftest import PKI
+    from cryptography.exceptions import InvalidSignature
+
+    _, cert = pki.issue("0001")
+    rogue = PKI(pki.ca_cn)
+    _, forged = rogue.issue("0002")
+    k = KeyChain(compact=True)
+    for c in (pki.ca, cert, forged):
+        k.der_add(pki.der(c))
+
+    entry = k.lookup("FRZZ", "0001")
+    # The verified CA is remembered apart from x509 attribute names
+    assert entry.issuer_entry is k._issuers("FRZZ")[0]
+    assert not hasattr(entry, "issuer")
+    assert entry.public_key() == cert.public_key()
+    assert entry.serial_number == cert.serial_number
+    with pytest.raises(InvalidSignature):
+        k.lookup("FRZZ", "0002")
+
+    k.crl_add(pki.crl([cert.serial_number]))
+    with pytest.raises(RevokedCertificateError):
+        k.lookup("FRZZ", "0001")
+
+
+def _signed(issuer, subject, public_key, signing_key, **sign):
+    now = datetime.now(timezone.utc)
+    return x509.CertificateBuilder() \
+        .issuer_name(issuer) \
+        .subject_name(subject) \
+        .public_key(public_key) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - timedelta(days=1)) \
+        .not_valid_after(now + timedelta(days=365)) \
+        .sign(signing_key, **sign)
+
+
+def _name(cn, o=None):
+    attributes = [x509.NameAttribute(NameOID.COMMON_NAME, cn)]
+    if o is not None:
+        attributes.append(x509.NameAttribute(NameOID.ORGANIZATION_NAME, o))
+    return x509.Name(attributes)
+
+
+@pytest.mark.parametrize("algorithm", ["ed25519", "rsa-pss"])
+def test_compact_keychain_signature_algorithms(pki, algorithm):
+    if algorithm == "ed25519":
+        ca_key = ed25519.Ed25519PrivateKey.generate()
+        sign = {"algorithm": None}
+    else:
+        ca_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        sign = {"algorithm": hashes.SHA256(),
+                "rsa_padding": padding.PSS(padding.MGF1(hashes.SHA256()),
+                                           padding.PSS.DIGEST_LENGTH)}
+    ca = _signed(_name("FRZZ"), _name("FRZZ"), ca_key.public_key(), ca_key, **sign)
+    key = ec.generate_private_key(ec.SECP256R1())
+    cert = _signed(_name("FRZZ"), _name("0001"), key.public_key(), ca_key, **sign)
+    k = KeyChain(compact=True)
+    for c in (ca, cert):
+        k.der_add(pki.der(c))
+
+    assert k.lookup("FRZZ", "0001").serial_number == cert.serial_number
+
+
+def test_compact_keychain_checks_issuer_name(pki):
+    ca_key = ec.generate_private_key(ec.SECP256R1())
+    ca = _signed(_name("FRZZ", "Other"), _name("FRZZ", "Other"), ca_key.public_key(),
+                 ca_key, algorithm=hashes.SHA256())
+    key = ec.generate_private_key(ec.SECP256R1())
+    cert = _signed(_name("FRZZ", "Issuer"), _name("0001"), key.public_key(), ca_key,
+                   algorithm=hashes.SHA256())
+    k = KeyChain(compact=True)
+    for c in (ca, cert):
+        k.der_add(pki.der(c))
+
+    with pytest.raises(ValueError):
+        k.lookup("FRZZ", "0001")
+
+
+def test_overlay_keychains(pki):
+    from conftest import PKI
+
+    base = KeyChain()
+    base.der_add(pki.der(pki.ca))
+    _, shared = pki.issue("SH01")
+    base.der_add(pki.der(shared))
+
+    private = PKI("FRYY")
+    _, own = private.issue("PV01")
+    _, extra = pki.issue("EX01")
+    tenant = base.overlay()
+    other = base.overlay()
+    tenant.der_add(private.der(private.ca))
+    tenant.der_add(private.der(own))
+    tenant.der_add(pki.der(extra))
+
+    # Shared certificates are visible, private ones stay in their layer
+    assert tenant.lookup("FRZZ", "SH01") == shared
+    assert other.lookup("FRZZ", "SH01") == shared
+    assert tenant.lookup("FRYY", "PV01") == own
+    assert tenant.lookup("FRZZ", "EX01") == extra
+    for chain in (base, other):
+        with pytest.raises(KeyError):
+            chain.lookup("FRYY", "PV01")
+    assert len(tenant._entries) == 3
+    assert len(tenant.certs) == 5
+
+    # Overlay CRLs only apply to the overlay
+    assert tenant.crl_add(pki.crl([shared.serial_number])) == "FRZZ"
+    with pytest.raises(RevokedCertificateError):
+        tenant.lookup("FRZZ", "SH01")
+    assert other.lookup("FRZZ", "SH01") == shared
+
+    # Certificates added to the base later are seen through overlays
+    _, late = pki.issue("LT01")
+    base.der_add(pki.der(late))
+    assert other.lookup("FRZZ", "LT01") == late
+
+
+def test_overlay_picks_latest_across_layers(pki):
+    from datetime import date
+    from tdd.keychain import ExpiredCertificateError
+
+    base = KeyChain()
+    base.der_add(pki.der(pki.ca))
+    _, old = pki.issue("RO01", not_before=datetime(2020, 1, 1, tzinfo=timezone.utc),
+                       not_after=datetime(2030, 1, 1, tzinfo=timezone.utc))
+    _, new = pki.issue("RO01", not_before=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                       not_after=datetime(2034, 1, 1, tzinfo=timezone.utc))
+    base.der_add(pki.der(old))
+    tenant = base.overlay()
+    tenant.der_add(pki.der(new))
+    assert tenant.lookup("FRZZ", "RO01", at=date(2025, 1, 1)) == new
+    assert tenant.lookup("FRZZ", "RO01", at=date(2022, 1, 1)) == old
+    assert base.lookup("FRZZ", "RO01", at=date(2025, 1, 1)) == old
+    with pytest.raises(ExpiredCertificateError):
+        tenant.lookup("FRZZ", "RO01", at=date(2040, 1, 1))
+
+
+def test_crl_without_loaded_issuer_is_ignored(pki):
+    _, cert = pki.issue("0001")
+    k = KeyChain(check_expiry=False)
+    assert k.crl_add(pki.crl([cert.serial_number])) is None
+    assert k.revoked == {}
@@ -1,4 +1,15 @@
-from tdd.message import C40Message
+from datetime import date
+from pathlib import Path
+import random
+import threading
+
+import pytest
+
+from tdd.data_definition import Interner, attribute_name, c40, view_class
+from tdd.doc import TwoDDoc
+from tdd.message import C40Message, LimitExceeded, Limits, _Separators
+
+SAMPLES = Path(__file__).parent.parent / "samples"
 
 
 def test_numeric_client_number_is_not_reparsed_as_phantom_field():
@@ -15,3 +26,182 @@ def test_numeric_client_number_is_not_reparsed_as_phantom_field():
     ids = [d.definition.id for d in msg.dataset]
     assert ids == ["19"], f"unexpected phantom field(s): {ids}"
     assert msg.dataset[0].value == "10510899"
+
+
+def test_interning():
+    interner = Interner(max_size=3)
+    interner.install()
+    try:
+        code = "L3COVID-19\x1dL201011951L5PFIZER"
+        a = C40Message.from_code(1, code)
+        b = C40Message.from_code(1, code)
+        assert all(x.value is y.value for x, y in zip(a.dataset, b.dataset))
+
+        # Table is full, new values are still parsed but not shared
+        c = C40Message.from_code(1, "L3OTHER")
+        d = C40Message.from_code(1, "L3OTHER")
+        assert c.dataset[0].value == d.dataset[0].value == "OTHER"
+        assert c.dataset[0].value is not d.dataset[0].value
+    finally:
+        Interner.uninstall()
+
+    fresh = Interner()
+    assert fresh(True) is True and fresh(1) == 1 and type(fresh(1)) is int
+    e = C40Message.from_code(1, code)
+    assert e.dataset[0].value is not a.dataset[0].value
+
+
+def test_interning_from_threads():
+    interner = Interner(max_size=1000)
+
+    def intern():
+        for i in range(2000):
+            interner(str(i))
+
+    threads = [threading.Thread(target=intern) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert interner.size == len(interner.tables[str]) == 1000
+
+
+def test_typed_view():
+    assert attribute_name("Date de fin des droits", "G3") == "date_fin_droits"
+    assert attribute_name("Nom d’usage", "63") == "nom_usage"
+
+    code = (SAMPLES / "exemple-attestation-vaccination-certifiee.txt").read_text().strip()
+    doc = TwoDDoc.from_code(code)
+    view = doc.typed()
+    assert view is doc.typed()
+    assert view.nom_patronymique_patient == "DUPONT"
+    assert view.date_naissance_patient == date(1951, 1, 1)
+    assert view.date_fin_droits is None
+    with pytest.raises(AttributeError):
+        view.not_a_field
+
+    group_view = c40.perimeters[1].datatype_get("G3")[0].view
+    msg = C40Message.from_code(1, "G0AAG331122024")
+    assert group_view(msg.dataset).date_fin_droits == date(2024, 12, 31)
+
+
+def test_typed_view_keeps_groups_apart():
+    # Family name of an identity document and of a test result
+    msg = C40Message.from_code(1, "62DUPONT\x1dF1MARTIN\x1d")
+    view = c40.view_get(1)(msg.dataset)
+    assert view.nom_patronymique_62 == "DUPONT"
+    assert view.nom_patronymique_f1 == "MARTIN"
+    with pytest.raises(AttributeError):
+        view.nom_patronymique
+
+    with pytest.raises(ValueError):
+        view_class("View", {"62": "nom", "F1": "nom"})
+
+
+def test_limits():
+    code = (SAMPLES / "exemple-attestation-vaccination-certifiee.txt").read_text().strip()
+    assert TwoDDoc.from_code(code, Limits(max_length=len(code)))
+    with pytest.raises(LimitExceeded):
+        TwoDDoc.from_code(code, Limits(max_length=len(code) - 1))
+    with pytest.raises(LimitExceeded):
+        TwoDDoc.from_code(code + "A" * 10 ** 7)
+    with pytest.raises(LimitExceeded):
+        TwoDDoc.from_code(code, Limits(max_fields=3))
+
+    assert C40Message.from_code(1, "01" + "A" * 1024).dataset[0].value == "A" * 1024
+    with pytest.raises(LimitExceeded):
+        C40Message.from_code(1, "01" + "A" * 1025)
+    # Definition bounds still apply below the limit
+    assert C40Message.from_code(1, "01ABC\x1d02D", Limits(max_field_size=3))
+    with pytest.raises(LimitExceeded):
+        C40Message.from_code(1, "01ABCD\x1d02D", Limits(max_field_size=3))
+
+
+class _ScanCounter(str):
+    "Code counting the characters scanned by separator searches"
+    scanned = 0
+
+    def find(self, sub, start=0):
+        i = str.find(self, sub, start)
+        _ScanCounter.scanned += (i if i >= 0 else len(self)) - start + 1
+        return i
+
+
+class _CountingSeparators(_Separators):
+    def __init__(self, code):
+        super().__init__(_ScanCounter(code))
+
+
+@pytest.mark.parametrize("field", ["01A\x1d", "01A\x1e", "18AB CD\x1d", "01"])
+def test_parsing_is_linear(monkeypatch, field):
+    # Unbounded fields without the separator searched first: each
+    # field used to scan the whole rest of the message. Timings are
+    # in benchmarks/parse_scaling.py, this counts scanned characters.
+    monkeypatch.setattr("tdd.message._Separators", _CountingSeparators)
+    unlimited = Limits(max_length=None, max_fields=None, max_field_size=None)
+    for count in (1000, 4000, 16000):
+        code = field * count
+        _ScanCounter.scanned = 0
+        C40Message.from_code(1, code, unlimited)
+        # Each separator kind is scanned over at most once
+        assert _ScanCounter.scanned <= 2 * (len(code) + 1) + 2 * count, (count, _ScanCounter.scanned)
+
+
+def _parse_outcome(code):
+    try:
+        msg = C40Message.from_code(1, code)
+    except Exception as e:
+        return type(e)
+    return [(d.definition.id, d.value) for d in msg.dataset]
+
+
+def test_layouts_match_generic_parser(monkeypatch):
+    layouts = C40Message.layouts
+    code = "L0DUPONT\x1dL1PAUL\x1dL201011951L3COVID-19\x1dL4J07BX03\x1dL5PFIZER\x1d" \
+        "L6PFIZER\x1dL72L82L930042021LATE"
+    test = "F0\x1dF1SPECIMEN NOM\x1dF201012000F3MF43333\x1dF5XF6120420210800"
+
+    calls = []
+    for layout in [l for ls in layouts.values() for l in ls]:
+        monkeypatch.setattr(layout, "parse", lambda c, limits, parse=layout.parse:
+                            calls.append(parse(c, limits)) or calls[-1])
+    assert _parse_outcome(code)[2] == ("L2", date(1951, 1, 1))
+    assert _parse_outcome(test)[0] == ("F0", "")
+    assert all(r is not None for r in calls)
+
+    rng = random.Random(4)
+    alphabet = "AZ09 -/.\n\x1d\x1e\x1f"
+    variants = []
+    for base in (code, test):
+        for _ in range(500):
+            chars = list(base)
+            for _ in range(rng.randint(1, 3)):
+                i = rng.randrange(len(chars))
+                op = rng.random()
+                if op < 0.4:
+                    chars[i] = rng.choice(alphabet)
+                elif op < 0.7:
+                    del chars[i]
+                else:
+                    chars.insert(i, rng.choice(alphabet) * rng.randint(1, 90))
+            variants.append("".join(chars))
+        variants.append(base.replace("\x1d", ""))
+        variants.append(base.replace("PFIZER", "P" * 30).replace("\x1dL6", "L6"))
+    variants.append(code + "L0X")
+
+    fast = [_parse_outcome(v) for v in variants]
+    monkeypatch.setattr(C40Message, "layouts", {})
+    assert [_parse_outcome(v) for v in variants] == fast
+
+
+def test_layout_registration():
+    with pytest.raises(ValueError):
+        C40Message.layout_add(1, ("10", "DH"))
+    layout = C40Message.layout_add(1, ("G0", "G3"))
+    try:
+        assert layout.parse("G0AAG331122024", Limits())
+        assert layout.parse("G0AAG331122024", Limits(max_fields=1)) is None
+        assert C40Message.from_code(1, "G0AAG331122024").dataset[1].value == date(2024, 12, 31)
+    finally:
+        C40Message.layout_remove(layout)
+    assert (1, "G0") not in C40Message.layouts
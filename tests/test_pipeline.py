@@ -0,0 +1,104 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from tdd.pipeline import Pipeline, verification
+from tdd.verify import verify
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+
+def sample_codes():
+    return [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def test_stages_keep_order():
+    def slow_square(x):
+        time.sleep(0.001 * (x % 3))
+        return x * x
+
+    p = Pipeline(range(100), maxsize=4) \
+        .filter(lambda x: x % 2) \
+        .map(slow_square, workers=4) \
+        .flat_map(lambda x: (x, -x), workers=2) \
+        .map(str)
+    assert list(p) == [str(y) for x in range(1, 100, 2) for y in (x * x, -x * x)]
+
+    seen = []
+    assert Pipeline("abc").each(seen.append, workers=2).run() == 3
+    assert seen == list("abc")
+
+
+def test_threaded_flat_map_runs_generators_in_workers():
+    threads = set()
+
+    def expand(x):
+        threads.add(threading.get_ident())
+        yield x
+        yield -x
+
+    assert list(Pipeline(range(20)).flat_map(expand, workers=2)) == \
+        [y for x in range(20) for y in (x, -x)]
+    assert threading.get_ident() not in threads
+
+
+def test_backpressure_bounds_pulled_items():
+    pulled = []
+
+    def source():
+        for i in range(10000):
+            pulled.append(i)
+            yield i
+
+    p = Pipeline(source(), maxsize=8).map(lambda x: x, workers=2) \
+        .map(lambda x: x, workers=2)
+    it = iter(p)
+    assert next(it) == 0
+    time.sleep(0.2)
+    # Two queues of 8, plus one item held by each blocked feeder
+    assert len(pulled) <= 2 * 8 + 4
+    it.close()
+
+
+def test_errors_and_early_stop():
+    def fail(x):
+        if x == 5:
+            raise ValueError(x)
+        return x
+
+    with pytest.raises(ValueError):
+        list(Pipeline(range(10)).map(fail, workers=3))
+
+    def broken():
+        yield 1
+        raise OSError("read failed")
+
+    with pytest.raises(OSError):
+        list(Pipeline(broken()).map(lambda x: x, workers=1))
+
+    before = threading.active_count()
+    for _ in Pipeline(iter(range(10 ** 9)), maxsize=2).map(lambda x: x, workers=2):
+        break
+    time.sleep(0.5)
+    assert threading.active_count() <= before + 1
+
+
+def test_verification(keychain):
+    from tdd.filter import HeaderFilter
+
+    codes = sample_codes() + ["garbage", sample_codes()[0][:-4] + "AAAA"]
+    results = list(verification(codes, keychain, workers=4, maxsize=4))
+    expected = [verify(c, keychain) for c in codes]
+    assert [r.code for r in results] == codes
+    assert [(r.valid, r.reason) for r in results] == [(r.valid, r.reason) for r in expected]
+
+    f = HeaderFilter(doc_types=["04"])
+    selected = list(verification(Pipeline(codes), keychain, header_filter=f))
+    assert selected and all(r.header.doc_type_id == "04" for r in selected)
+
+    data = "".join(c + "\r\n" for c in sample_codes()).encode("ascii")
+    chunks = (data[i:i + 7] for i in range(0, len(data), 7))
+    results = list(verification(Pipeline.from_chunks(chunks), keychain))
+    assert len(results) == len(sample_codes()) and all(r.valid for r in results)
@@ -0,0 +1,65 @@
+import hashlib
+
+import pytest
+
+from tdd.replay import EXACT, PROBABLE, ReplayDetector
+
+
+class Doc:
+    def __init__(self, n, signed_data = b"data"):
+        self.signature = n.to_bytes(64, "big")
+        self.signed_data = signed_data
+
+
+def test_exact_and_probable():
+    d = ReplayDetector(window = 100, generations = 4, capacity = 1000,
+                       exact_size = 10)
+    assert d.check(Doc(1), now = 0) is None
+    assert d.check(Doc(1), now = 1) == EXACT
+    for n in range(2, 20):
+        assert d.check(Doc(n), now = 2) is None
+    # Evicted from the bounded exact tier, still in the Bloom tier
+    assert d.check(Doc(1), now = 3) == PROBABLE
+    assert d.check(Doc(1), now = 4, add = False) == EXACT
+
+
+def test_windows():
+    d = ReplayDetector(window = 100, generations = 5, capacity = 1000,
+                       exact_window = 10)
+    d.check(Doc(1), now = 0)
+    assert d.check(Doc(1), now = 50, add = False) == PROBABLE
+    assert d.check(Doc(1), now = 100, add = False) == PROBABLE
+    assert d.check(Doc(1), now = 1000, add = False) is None
+
+
+def test_key_signed_data():
+    d = ReplayDetector(key = "signed_data", capacity = 1000)
+    assert d.check(Doc(1, b"same"), now = 0) is None
+    assert d.check(Doc(2, b"same"), now = 0) == EXACT
+    assert d.digest(Doc(3, b"same")) == hashlib.sha256(b"same").digest()
+    # Restored without signed data
+    with pytest.raises(ValueError, match="signed_data"):
+        d.check(Doc(4, None), now = 0)
+
+
+def test_false_positive_rate():
+    d = ReplayDetector(window = 100, capacity = 2000, error_rate = 1e-3,
+                       exact_size = 0)
+    for n in range(2000):
+        d.check(Doc(n), now = 0)
+    false = sum(d.check(Doc(n), now = 0, add = False) is not None
+                for n in range(10000, 30000))
+    assert false < 20000 * 5e-3
+
+
+def test_persistence(tmp_path):
+    path = tmp_path / "replay.bin"
+    with ReplayDetector(window = 100, capacity = 1000, path = path) as d:
+        d.check(Doc(1), now = 0)
+    with ReplayDetector(window = 100, capacity = 1000, path = path) as d:
+        assert d.check(Doc(1), now = 10) == PROBABLE
+        assert d.check(Doc(2), now = 10) is None
+    with pytest.raises(ValueError):
+        ReplayDetector(window = 100, capacity = 5000, path = path)
+    with pytest.raises(ValueError):
+        ReplayDetector(window = 50, capacity = 1000, path = path)
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+import multiprocessing
+from pathlib import Path
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+import pytest
+
+from tdd.keychain import KeyChain, RevokedCertificateError
+from tdd.shared import SharedKeyChain, publish
+
+SAMPLE = Path(__file__).parent / "spec_samples" / "3.1.3" / "15.2.2" / "17.txt"
+
+
+def _worker(name, code, queue):
+    from tdd.doc import TwoDDoc
+    keychain = SharedKeyChain.attach(name)
+    doc = TwoDDoc.from_code(code)
+    valid = doc.signature_is_valid(keychain)
+    materialized = sum(1 for e in keychain._entries if e.materialized)
+    keychain.close()
+    queue.put((valid, materialized, len(keychain._entries)))
+
+
+def test_attach_is_lazy(keychain, pki):
+    keychain.der_add(pki.der(pki.ca))
+    _, cert = pki.issue("0001")
+    keychain.der_add(pki.der(cert))
+    keychain.crl_add(pki.crl([cert.serial_number]))
+
+    segment = publish(keychain)
+    try:
+        shared = SharedKeyChain.attach(segment.name)
+        assert not shared.check_expiry
+        assert len(shared._entries) == len(keychain._entries)
+        assert not any(e.materialized for e in shared._entries)
+        assert shared.revoked["FRZZ"] == frozenset([cert.serial_number])
+
+        assert shared.lookup("FR00", "0001") == keychain.lookup("FR00", "0001")
+        assert 1 <= sum(1 for e in shared._entries if e.materialized) <= 3
+        shared.close()
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def test_spawned_worker(keychain):
+    segment = publish(keychain)
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        queue = ctx.Queue()
+        p = ctx.Process(target=_worker, args=(segment.name, SAMPLE.read_text().strip(), queue))
+        p.start()
+        valid, materialized, total = queue.get(timeout=60)
+        p.join()
+        assert valid
+        assert materialized < total
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+@pytest.mark.filterwarnings("ignore:Attribute's length")
+def test_long_names_and_crl_updates(pki):
+    # More than a byte length prefix holds (and than x509 allows,
+    # which parsing does not enforce)
+    cn = "0" * 300
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.now(timezone.utc)
+    cert = x509.CertificateBuilder() \
+        .issuer_name(pki.ca.subject) \
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn, _validate=False)])) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - timedelta(days=1)) \
+        .not_valid_after(now + timedelta(days=1)) \
+        .sign(pki.ca_key, hashes.SHA256())
+    then = now - timedelta(days=1)
+    k = KeyChain()
+    k.der_add(pki.der(pki.ca))
+    k.der_add(pki.der(cert))
+    k.crl_add(pki.crl([cert.serial_number]))
+
+    segment = publish(k)
+    try:
+        shared = SharedKeyChain.attach(segment.name)
+        assert {e.subject_cn for e in shared._entries} == {"FRZZ", cn}
+        # Older CRL than the published one
+        assert shared.crl_add(pki.crl([], last_update=then)) is None
+        with pytest.raises(RevokedCertificateError):
+            shared.lookup("FRZZ", cn)
+
+        shared.close()
+        with pytest.raises(ValueError, match="closed"):
+            shared.lookup("FRZZ", cn)
+
+        unused = SharedKeyChain.attach(segment.name)
+        unused.close()
+        with pytest.raises(ValueError, match="released"):
+            unused._entries[0].cert
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def test_crl_issuer_without_common_name():
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.ORGANIZATION_NAME, "No CN")])
+    now = datetime.now(timezone.utc)
+    ca = x509.CertificateBuilder() \
+        .issuer_name(name) \
+        .subject_name(name) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - timedelta(days=1)) \
+        .not_valid_after(now + timedelta(days=1)) \
+        .sign(key, hashes.SHA256())
+    crl = x509.CertificateRevocationListBuilder() \
+        .issuer_name(name) \
+        .last_update(now) \
+        .next_update(now + timedelta(days=1)) \
+        .add_revoked_certificate(x509.RevokedCertificateBuilder()
+                                 .serial_number(42).revocation_date(now).build()) \
+        .sign(key, hashes.SHA256())
+    k = KeyChain()
+    k.der_add(ca.public_bytes(Encoding.DER))
+    k.crl_add(crl.public_bytes(Encoding.DER))
+    assert k.revoked[None] == frozenset([42])
+
+    segment = publish(k)
+    try:
+        shared = SharedKeyChain.attach(segment.name)
+        assert shared.revoked == {None: frozenset([42])}
+        assert shared._crl_updates[None] == k._crl_updates[None]
+        shared.close()
+    finally:
+        segment.close()
+        segment.unlink()
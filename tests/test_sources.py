@@ -0,0 +1,79 @@
+import bz2
+import gzip
+import lzma
+from pathlib import Path
+
+import pytest
+
+from tdd.sources import archive_files, open_archive, read_codes, read_lines
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+
+def sample_codes():
+    return [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+@pytest.mark.parametrize("suffix,compress", [
+    (".txt", lambda b: b),
+    (".gz", gzip.compress),
+    (".xz", lzma.compress),
+    (".bz2", bz2.compress),
+])
+def test_read_lines(tmp_path, suffix, compress):
+    codes = sample_codes()
+    data = ("\r\n".join(codes[:10]) + "\n\n" + "\n".join(codes[10:])).encode("ascii")
+    path = tmp_path / ("codes" + suffix)
+    path.write_bytes(compress(data))
+
+    # Small chunks split lines anywhere
+    lines = list(read_lines(path, chunk_size=97, depth=2))
+    assert [code for _, code in lines] == codes
+    assert lines[10][0] == 12
+
+
+def test_content_sniffing_and_directories(tmp_path):
+    codes = sample_codes()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "two.gz").write_bytes(gzip.compress("\n".join(codes[5:]).encode()))
+    # Compressed content without a compression suffix
+    (tmp_path / "a.txt").write_bytes(lzma.compress("\n".join(codes[:5]).encode()))
+    (tmp_path / "notes.md").write_text("not codes")
+    with open_archive(tmp_path / "a.txt") as fd:
+        assert fd.read().decode().split("\n") == codes[:5]
+
+    assert [p.name for p in archive_files([tmp_path])] == ["a.txt", "two.gz"]
+    found = list(read_codes([tmp_path], chunk_size=64))
+    assert [code for _, _, code in found] == codes
+    assert found[5][:2] == (tmp_path / "b" / "two.gz", 1)
+
+
+def test_early_stop(tmp_path):
+    path = tmp_path / "big.gz"
+    path.write_bytes(gzip.compress(("\n".join(sample_codes()) + "\n").encode() * 200))
+    lines = read_lines(path, chunk_size=256, depth=2)
+    assert next(lines)[0] == 1
+    lines.close()
+
+
+def test_bad_lines_are_skipped(tmp_path):
+    codes = sample_codes()
+    data = codes[0].encode() + b"\n" + b"A" * 100000 + b"\n" + "é".encode() \
+        + b"\n" + codes[1].encode() + b"\n" + b"B" * 5000
+    path = tmp_path / "codes.gz"
+    path.write_bytes(gzip.compress(data))
+    errors = []
+    lines = list(read_lines(path, chunk_size=1000,
+                            on_error=lambda *e: errors.append(e)))
+    assert lines == [(1, codes[0]), (4, codes[1])]
+    assert [(n, m.split()[0]) for _, n, m in errors] == [(2, "line"), (3, "not"), (5, "line")]
+
+
+def test_zstd_frames(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    codes = sample_codes()
+    compressor = zstandard.ZstdCompressor()
+    path = tmp_path / "codes.zst"
+    path.write_bytes(compressor.compress(("\n".join(codes[:5]) + "\n").encode())
+                     + compressor.compress("\n".join(codes[5:]).encode()))
+    assert [code for _, code in read_lines(path, chunk_size=50)] == codes
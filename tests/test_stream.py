@@ -0,0 +1,140 @@
+import asyncio
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from tdd.doc import TwoDDoc
+from tdd.stream import Framer, prefetch, read_codes
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+CODES = [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+class FakeStream:
+    """
+    In-memory stand-in for asyncio.StreamReader, returning given reads
+    one at a time whatever size is asked.
+    """
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    async def read(self, n):
+        await asyncio.sleep(0)
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def stream_bytes(codes, terminator = b"\r\n"):
+    return b"".join(c.encode("ascii") + terminator for c in codes)
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_split_reads():
+    data = stream_bytes(CODES)
+    for size in (1, 3, 7, 64, len(data)):
+        framer = Framer()
+        codes = []
+        for chunk in split(data, size):
+            codes += framer.feed(chunk)
+        codes += framer.close()
+        assert codes == CODES
+
+
+def test_garbage_and_truncation():
+    data = b"\x00]Q1garbageD" + CODES[0][:40].encode("ascii") + b"\r\n" \
+        + b"DC99" + stream_bytes(CODES[:2], b"\n") + CODES[2].encode("ascii")
+    framer = Framer()
+    assert framer.feed(data) == CODES[:2]
+    assert framer.close() == [CODES[2]]
+
+
+def test_header_before_signature():
+    seen = []
+    framer = Framer(on_header = seen.append)
+    code = CODES[0].encode("ascii")
+    separator = code.index(b"\x1f")
+    assert framer.feed(code[:separator]) == []
+    assert len(seen) == 1
+    assert seen[0].ca_id == CODES[0][4:8]
+    assert framer.feed(code[separator:] + b"\r") == [CODES[0]]
+    assert len(seen) == 1
+
+
+def test_prefetch(keychain):
+    looked_up = []
+
+    class Chain:
+        def lookup(self, ca_cn, cert_cn, at = None):
+            looked_up.append((ca_cn, cert_cn))
+            return keychain.lookup(ca_cn, cert_cn, at = at)
+
+    chain = prefetch(Chain())
+    framer = Framer(on_header = chain)
+    codes = framer.feed(stream_bytes(CODES[:3]))
+    # Verification gets the prefetched certificates, not new lookups
+    assert all(TwoDDoc.from_code(c).signature_is_valid(chain) for c in codes)
+    expected = sorted({(c[4:8], c[8:12]) for c in CODES[:3]})
+    assert sorted(looked_up) == expected
+    with pytest.raises(KeyError):
+        chain.lookup("ZZZZ", "0000")
+    chain.close()
+
+
+@pytest.mark.parametrize("historical", [False, True])
+def test_prefetch_at(keychain, historical):
+    looked_up = []
+
+    class Chain:
+        def lookup(self, ca_cn, cert_cn, at = None):
+            looked_up.append((ca_cn, cert_cn, at))
+            return keychain.lookup(ca_cn, cert_cn, at = at)
+
+    at = date(2020, 1, 1)
+    chain = prefetch(Chain(), at = at, historical = historical)
+    framer = Framer(on_header = chain)
+    docs = [TwoDDoc.from_code(c) for c in framer.feed(stream_bytes(CODES[:3]))]
+    for doc in docs:
+        doc.signature_is_valid(chain, at = doc.header.sign_date if historical else None)
+    if historical:
+        expected = {(c[4:8], c[8:12], d.header.sign_date) for c, d in zip(CODES, docs)}
+    else:
+        expected = {(c[4:8], c[8:12], at) for c in CODES[:3]}
+    assert sorted(looked_up) == sorted(expected)
+    chain.close()
+
+
+def test_missing_terminator():
+    data = b"".join(c.encode("ascii") for c in CODES[:3])
+    framer = Framer()
+    assert framer.feed(data) + framer.close() == CODES[:3]
+    # A base32 run longer than any signature is dropped
+    data = CODES[0].encode("ascii") + b"A" * 300 + b"\r\n" + stream_bytes(CODES[1:2])
+    assert Framer().feed(data) == CODES[1:2]
+
+
+def test_async_reader(keychain):
+    prefetched = []
+
+    async def on_header(header):
+        prefetched.append(header.cert_id)
+
+    async def run():
+        stream = FakeStream(split(stream_bytes(CODES), 17))
+        return [TwoDDoc.from_code(c)
+                async for c in read_codes(stream, on_header = on_header)]
+
+    docs = asyncio.run(run())
+    assert len(docs) == len(CODES)
+    assert all(d.signature_is_valid(keychain) for d in docs)
+    assert prefetched == [c[8:12] for c in CODES]
+
+
+def test_frame_chunks():
+    from tdd.stream import frame
+
+    data = stream_bytes(CODES, b"\n")
+    assert list(frame(split(data, 5))) == CODES
@@ -0,0 +1,52 @@
+from tdd.data_definition import c40
+from tdd.keychain import KeyChain
+from tdd.synth import Generator, Authority, main
+from tdd.verify import verify
+
+
+def test_generated_documents_verify(tmp_path):
+    authority = Authority()
+    authority.write(tmp_path)
+    keychain = KeyChain()
+    keychain.load_dir(tmp_path)
+
+    generator = Generator(authority, seed = 1, corrupt_rate = 0.3)
+    used = set()
+    corrupted = 0
+    for code, corruption in generator.generate(400):
+        result = verify(code, keychain)
+        assert result.valid == (corruption is None), (code, corruption, result.reason)
+        if corruption is None:
+            used.update(d.definition.id for d in result.doc.message.dataset)
+            assert result.doc.header.doc_type_id in c40.perimeters[1].doctypes
+        else:
+            corrupted += 1
+    assert 60 < corrupted < 180
+    # Most definitions are exercised, few are left out
+    assert len(used) > 250
+    assert len(generator.skipped) < 10
+
+
+def test_doc_types_and_seed():
+    authority = Authority()
+    a = Generator(authority, seed = 7, doc_types = ["04", "B2"])
+    b = Generator(authority, seed = 7, doc_types = ["04", "B2"])
+    codes_a = [code for code, _ in a.generate(10)]
+    codes_b = [code for code, _ in b.generate(10)]
+    assert [c[20:22] for c in codes_a] == ["04", "B2"] * 5
+    # Same contents, ECDSA signatures differ
+    assert [c.split("\x1f")[0] for c in codes_a] == [c.split("\x1f")[0] for c in codes_b]
+
+
+def test_cli(tmp_path):
+    out = tmp_path / "corpus.txt"
+    labels = tmp_path / "labels.txt"
+    main(["-n", "50", "-o", str(out), "--labels", str(labels),
+          "--chains", str(tmp_path / "chains"), "--corrupt-rate", "0.5"])
+    keychain = KeyChain()
+    keychain.load_dir(tmp_path / "chains")
+    codes = out.read_text().split("\n")[:-1]
+    kinds = labels.read_text().splitlines()
+    assert len(codes) == len(kinds) == 50
+    for code, kind in zip(codes, kinds):
+        assert verify(code, keychain).valid == (kind == "valid")
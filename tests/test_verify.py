@@ -0,0 +1,84 @@
+import threading
+from pathlib import Path
+
+from tdd.verify import verify, verify_many
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+
+def sample_codes():
+    return [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))]
+
+
+def test_verify_reports_errors(keychain):
+    codes = sample_codes()
+    ok = verify(codes[0], keychain)
+    assert ok.valid and ok.reason is None and ok.header.ca_id == "FR00"
+
+    bad = verify("garbage", keychain)
+    assert bad.doc is None and not bad.valid
+    assert bad.reason.startswith("ValueError")
+
+    broken = verify(codes[0][:-4] + "AAAA", keychain)
+    assert broken.doc is not None and broken.reason == "Signature broken"
+
+
+def test_verify_many_matches_sequential(keychain):
+    codes = sample_codes() * 3
+    expected = [verify(c, keychain).valid for c in codes]
+    results = list(verify_many(iter(codes), keychain, workers=4))
+    assert [r.code for r in results] == codes
+    assert [r.valid for r in results] == expected
+    assert all(expected)
+
+
+def test_keychain_concurrent_load_and_lookup(pki):
+    from tdd.keychain import KeyChain
+
+    k = KeyChain()
+    k.der_add(pki.der(pki.ca))
+    issued = [pki.issue(f"{i:04d}")[1] for i in range(40)]
+    errors = []
+
+    def reader():
+        for _ in range(200):
+            try:
+                k.lookup("FRZZ", "0000")
+            except KeyError:
+                pass
+            except Exception as e:
+                errors.append(e)
+
+    k.der_add(pki.der(issued[0]))
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for cert in issued[1:]:
+        k.der_add(pki.der(cert))
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert all(k.lookup("FRZZ", c.subject.rfc4514_string()[3:]) == c for c in issued)
+
+
+def test_verify_before_decode(keychain):
+    from tdd.doc import TwoDDoc
+
+    for code in sample_codes():
+        doc = TwoDDoc.from_code_if_valid(code, keychain)
+        assert vars(doc.header) == vars(TwoDDoc.from_code(code).header)
+        raw = TwoDDoc.from_code_if_valid(code.encode("ascii"), keychain)
+        assert raw.signed_data == doc.signed_data
+        assert [d.value for d in raw.message.dataset] == [d.value for d in doc.message.dataset]
+
+    code = sample_codes()[0]
+    forged = code[:30] + ("A" if code[30] != "A" else "B") + code[31:]
+    assert TwoDDoc.from_code_if_valid(forged, keychain) is None
+
+    fast = verify(forged, keychain, decode_invalid=False)
+    assert not fast.valid and fast.doc is None
+    assert fast.reason == "Signature broken"
+    assert fast.to_dict()["ca_id"] == "FR00"
+    results = list(verify_many(sample_codes(), keychain, decode_invalid=False))
+    assert all(r.valid and r.doc is not None for r in results)
@@ -0,0 +1,79 @@
+import pickle
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+
+from tdd.doc import TwoDDoc, _split
+from tdd.message import VariableData
+from tdd.wire import decode_value, dumps, encode_value, loads
+
+SAMPLES = Path(__file__).parent / "spec_samples"
+
+
+def test_value_roundtrip():
+    values = [None, True, False, 0, -1, 12345678901234567890, -(1 << 70),
+              "", "DUPONT", "é", b"\x00\xff", date(2021, 4, 30),
+              datetime(2020, 1, 2, 3, 4, 5, 6), time(12, 34, 56),
+              datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=-5))),
+              time(12, 34, tzinfo=timezone.utc), [1, "a", [None]], {"k": {1: b"v"}}]
+    buf = bytearray()
+    for v in values:
+        encode_value(buf, v)
+    off = 0
+    for v in values:
+        decoded, off = decode_value(buf, off)
+        assert decoded == v and type(decoded) is type(v)
+        if isinstance(v, (datetime, time)):
+            assert decoded.utcoffset() == v.utcoffset()
+    assert off == len(buf)
+
+
+def fields(doc):
+    return [(type(d), d.group, d.definition, d.value) for d in doc.message.dataset]
+
+
+def test_document_roundtrip(keychain):
+    for p in sorted(SAMPLES.rglob("*.txt")):
+        doc = TwoDDoc.from_code(p.read_text().strip())
+        for copy in (loads(dumps(doc)), pickle.loads(pickle.dumps(doc))):
+            assert vars(copy.header) == vars(doc.header)
+            assert copy.signature == doc.signature
+            assert copy.signed_data == doc.signed_data
+            assert fields(copy) == fields(doc)
+            assert copy.signature_is_valid(keychain)
+
+        stripped = loads(dumps(doc, signed_data=False))
+        assert stripped.signed_data is None
+
+
+def test_variable_data_roundtrip():
+    doc = TwoDDoc.from_code((SAMPLES / "3.1.3" / "15.2.2" / "17.txt").read_text().strip())
+    d = doc.message.dataset[0]
+    doc.message.dataset[0] = VariableData(d.group, d.definition, d.value, complete=False)
+    copy = loads(dumps(doc))
+    assert isinstance(copy.message.dataset[0], VariableData)
+    assert not copy.message.dataset[0].complete
+    assert fields(copy)[1:] == fields(doc)[1:]
+
+
+def test_extra_is_kept():
+    code = sorted(SAMPLES.rglob("*.txt"))[0].read_text().strip()
+    doc = TwoDDoc.from_code(code)
+    doc.extra = {"scanner": "gate1", "at": datetime(2024, 1, 1, tzinfo=timezone.utc)}
+    assert loads(dumps(doc)).extra == doc.extra
+    assert pickle.loads(pickle.dumps(doc)).extra == doc.extra
+    assert loads(dumps(doc, extra=False)).extra is None
+
+    # Extra values the encoding does not support still pickle
+    doc.extra = {"ratio": 0.5}
+    assert pickle.loads(pickle.dumps(doc)).extra == {"ratio": 0.5}
+
+
+def test_split_decodes_header_only():
+    code = [p.read_text().strip() for p in sorted(SAMPLES.rglob("*.txt"))
+            if p.read_text()[2:4] in ("01", "02")][0]
+    raw = bytearray(code.encode("ascii"))
+    raw[23] = 0xe9
+    doc = TwoDDoc.from_code(code)
+    # Message is not ASCII, but the header parses
+    header, data, signature, signed_data = _split(bytes(raw))
+    assert vars(header) == vars(doc.header)